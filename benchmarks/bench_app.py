@@ -0,0 +1,30 @@
+__author__ = 'SmileyBarry'
+
+from steamapi.app import SteamApp
+from steamapi.core import store
+
+from .common import FakeConnection, benchmark, load_response
+
+
+def _achievements(userid):
+    app = SteamApp(440, "Benchmark Game", owner=userid)
+    store(app, "_schema", load_response("schema_for_game"))
+    connection = FakeConnection({"GetGlobalAchievementPercentagesForApp": load_response("global_percentages"),
+                                 "GetUserStatsForGame": load_response("user_stats_for_game")})
+    cache = app._cache
+
+    def join():
+        cache.pop("achievements", None)
+        with connection:
+            return app.achievements
+    return join
+
+
+@benchmark("app.SteamApp.achievements.anonymous")
+def achievements_anonymous():
+    return _achievements(None)
+
+
+@benchmark("app.SteamApp.achievements.user")
+def achievements_user():
+    return _achievements(76561197960265729)
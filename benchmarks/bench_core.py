@@ -0,0 +1,64 @@
+__author__ = 'SmileyBarry'
+
+from steamapi.core import APIInterface, APIResponse
+
+from .common import benchmark, load_payload, load_response
+
+
+@benchmark("core.APIResponse.wrap.player_summaries")
+def wrap_player_summaries():
+    payload = load_payload("player_summaries")['response']
+    return lambda: APIResponse(payload)
+
+
+@benchmark("core.APIResponse.wrap.owned_games")
+def wrap_owned_games():
+    payload = load_payload("owned_games")['response']
+    return lambda: APIResponse(payload)
+
+
+@benchmark("core.APIResponse.getattr.hit")
+def getattr_hit():
+    player = load_response("player_summaries").players[0]
+    return lambda: player.personaname
+
+
+@benchmark("core.APIResponse.getattr.miss")
+def getattr_miss():
+    player = load_response("player_summaries").players[0]
+    return lambda: getattr(player, 'no_such_field', None)
+
+
+@benchmark("core.APIResponse.contains")
+def contains():
+    player = load_response("player_summaries").players[0]
+    return lambda: 'personaname' in player
+
+
+@benchmark("core.APICall.resolve.unregistered")
+def resolve_unregistered():
+    api = APIInterface(api_key="0" * 32)
+    return lambda: api.ISteamUser.GetPlayerSummaries.v2
+
+
+@benchmark("core.APICall.resolve.registered")
+def resolve_registered():
+    api = APIInterface(api_key="0" * 32)
+    api.ISteamUser.GetPlayerSummaries.v2._register()
+    return lambda: api.ISteamUser.GetPlayerSummaries.v2
+
+
+@benchmark("core.APICall.str")
+def build_url():
+    method = APIInterface(api_key="0" * 32).ISteamUser.GetPlayerSummaries.v2
+    return lambda: str(method)
+
+
+@benchmark("core.APICall.convert_arguments")
+def convert_arguments():
+    method = APIInterface(api_key="0" * 32).ISteamUser.GetPlayerSummaries.v2
+    steamids = [player['steamid'] for player in load_payload("player_summaries")['response']['players']]
+
+    def convert():
+        method._convert_arguments({'steamids': steamids, 'include_appinfo': True, 'appid': 440})
+    return convert
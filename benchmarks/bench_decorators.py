@@ -0,0 +1,37 @@
+__author__ = 'SmileyBarry'
+
+from steamapi.core import store
+from steamapi.user import SteamUser
+
+from .common import benchmark, load_response
+
+
+def _cached_user():
+    user = SteamUser(76561197960265729)
+    user._cache = {}
+    store(user, "_summary", load_response("player_summaries").players[0])
+    return user
+
+
+@benchmark("decorators.cached_property.hit.infinite")
+def hit_infinite():
+    user = _cached_user()
+    user.profile_url
+    return lambda: user.profile_url
+
+
+@benchmark("decorators.cached_property.hit.ttl")
+def hit_ttl():
+    user = _cached_user()
+    return lambda: user._summary
+
+
+@benchmark("decorators.cached_property.miss")
+def miss():
+    user = _cached_user()
+    cache = user._cache
+
+    def read():
+        cache.pop("profile_url", None)
+        return user.profile_url
+    return read
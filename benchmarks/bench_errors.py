@@ -0,0 +1,38 @@
+__author__ = 'SmileyBarry'
+
+from steamapi import errors
+
+from .common import benchmark
+
+
+class _Request(object):
+    def __init__(self, url):
+        self.url = url
+
+
+class _Response(object):
+    """
+    Just enough of "requests.Response" for "errors.check".
+    """
+
+    def __init__(self, status_code, url):
+        self.status_code = status_code
+        self.request = _Request(url)
+
+
+@benchmark("errors.check.ok")
+def check_ok():
+    response = _Response(200, "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/?key=X&format=json")
+    return lambda: errors.check(response)
+
+
+@benchmark("errors.check.private")
+def check_private():
+    response = _Response(403, "http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/?key=X&format=json")
+
+    def check():
+        try:
+            errors.check(response)
+        except errors.APIPrivate:
+            pass
+    return check
@@ -0,0 +1,62 @@
+__author__ = 'SmileyBarry'
+
+import os
+import subprocess
+import sys
+
+from .common import benchmark
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_time(statement):
+    """
+    Run "statement" in a fresh interpreter under "-X importtime", and add up the cumulative import time of every
+    steamapi module it imported directly. (Their own imports, like "requests", are included in that)
+
+    :rtype: float
+    """
+    environment = dict(os.environ)
+    # Measure imports the way they happen in production: from bytecode caches, written on the first run.
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+    environment['PYTHONPATH'] = PACKAGE_ROOT + os.pathsep + environment.get('PYTHONPATH', '')
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', statement], env=environment,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode('utf-8', 'replace'))
+
+    total_us = 0
+    for line in stderr.decode('utf-8').splitlines():
+        # "import time: self [us] | cumulative | imported package", indented by nesting depth.
+        if not line.startswith("import time:") or line.count('|') != 2:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split('|')
+        if module.startswith('  '):
+            # Nested inside another import, which already accounts for it.
+            continue
+        if module.strip().split('.')[0] == "steamapi":
+            total_us += int(cumulative_us)
+    return total_us / 1e6
+
+
+def _import_benchmark(statement):
+    # Warm-up: writes the bytecode caches, and fills the OS's file cache.
+    _import_time(statement)
+    return lambda: _import_time(statement)
+
+
+if sys.version_info >= (3, 7):
+    # "-X importtime" is new in Python 3.7.
+
+    @benchmark("import.steamapi", self_timed=True)
+    def import_package():
+        return _import_benchmark("import steamapi")
+
+    @benchmark("import.steamapi.core", self_timed=True)
+    def import_core():
+        return _import_benchmark("from steamapi.core import APIConnection")
+
+    @benchmark("import.steamapi.user", self_timed=True)
+    def import_user():
+        return _import_benchmark("from steamapi.user import SteamUser")
@@ -0,0 +1,26 @@
+__author__ = 'SmileyBarry'
+
+from steamapi.core import store
+from steamapi.user import SteamUser, SteamUserBadges
+
+from .common import benchmark, load_response
+
+
+@benchmark("user.SteamUser.convert_games_list")
+def convert_games_list():
+    games = load_response("owned_games").games
+    return lambda: SteamUser._convert_games_list(games, 76561197960265729)
+
+
+@benchmark("user.SteamUser.badges")
+def badges():
+    user = SteamUser(76561197960265729)
+    user._cache = {}
+    store(user, "_badges", load_response("badges"))
+    return lambda: user.badges
+
+
+@benchmark("user.SteamUserBadges.from_api_response")
+def build_badges():
+    badges = load_response("badges").badges
+    return lambda: SteamUserBadges.from_api_response(badges)
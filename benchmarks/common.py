@@ -0,0 +1,121 @@
+__author__ = 'SmileyBarry'
+
+import json
+import os
+import time
+
+from steamapi.core import APIConnection, APIResponse
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads')
+
+# All registered benchmarks, in registration order: (name, setup function, self-timed).
+REGISTRY = []
+
+
+def benchmark(name, self_timed=False):
+    """
+    Register a benchmark. The decorated function does any necessary setup and returns a zero-argument callable, which
+    is the only thing that gets timed.
+
+    :param name: A unique, stable name. Results are compared across runs by name, so don't rename benchmarks casually.
+    :type name: str
+    :param self_timed: The callable measures itself, and returns the duration in seconds. For things that can't be
+    timed from the outside, like a module's import time in a fresh interpreter.
+    :type self_timed: bool
+    """
+    def register(setup):
+        REGISTRY.append((name, setup, self_timed))
+        return setup
+    return register
+
+
+def load_payload(name):
+    """
+    Load a recorded API payload from the "payloads" directory, exactly as the Web API returned it.
+
+    :param name: The payload's file name, without the ".json" extension.
+    :rtype: dict
+    """
+    with open(os.path.join(PAYLOADS_DIR, name + '.json')) as payload_file:
+        return json.load(payload_file)
+
+
+def load_response(name):
+    """
+    Load a recorded payload and unpack it the same way "APIConnection.call" does.
+
+    :rtype: APIResponse
+    """
+    payload = load_payload(name)
+    if len(payload.keys()) == 1 and 'response' in payload:
+        return APIResponse(payload['response'])
+    return APIResponse(payload)
+
+
+class FakeConnection(object):
+    """
+    Replaces "APIConnection().call" with canned responses, so benchmarks never touch the network. Use it as a
+    context manager.
+    """
+
+    def __init__(self, responses):
+        """
+        :param responses: A mapping of API command names (e.g. "GetSchemaForGame") to the APIResponse to return.
+        :type responses: dict
+        """
+        self._responses = responses
+        self._connection = APIConnection()
+
+    def call(self, interface, command, version, method="GET", **kwargs):
+        return self._responses[command]
+
+    def __enter__(self):
+        self._connection.call = self.call
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        del self._connection.call
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """
+    Time a zero-argument callable.
+
+    The loop count is calibrated so each repetition runs for at least "min_time" seconds, and the best repetition is
+    reported, since anything slower than the best run is noise from the rest of the system.
+
+    :return: A dictionary with the best & median time per call, in nanoseconds, and the loop count used.
+    :rtype: dict
+    """
+    loops = 1
+    while True:
+        elapsed = _time_loops(func, loops)
+        if elapsed >= min_time:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    timings = sorted([_time_loops(func, loops) / loops * 1e9 for _ in range(repeat)])
+    return {'best_ns': timings[0],
+            'median_ns': timings[len(timings) // 2],
+            'loops': loops}
+
+
+def measure_self_timed(func, repeat=5):
+    """
+    Like "measure", for a callable that returns its own duration, in seconds.
+
+    :rtype: dict
+    """
+    timings = sorted([func() * 1e9 for _ in range(repeat)])
+    return {'best_ns': timings[0],
+            'median_ns': timings[len(timings) // 2],
+            'loops': 1}
+
+
+def _time_loops(func, loops):
+    timer = getattr(time, 'perf_counter', time.time)
+    loop_range = range(loops)
+    start = timer()
+    for _ in loop_range:
+        func()
+    return timer() - start
@@ -0,0 +1,7 @@
+__author__ = 'SmileyBarry'
+
+import sys
+
+from .driver import main
+
+sys.exit(main())
@@ -0,0 +1,256 @@
+__author__ = 'SmileyBarry'
+
+import hashlib
+import math
+import random
+import threading
+import time
+
+BASE_STEAMID = 76561197960265728
+# The in-game store's order history ("GetReport") starts here, with an order every REPORT_INTERVAL seconds.
+REPORT_START = 1451606400
+REPORT_INTERVAL = 0.25
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet", "kilo", "lima",
+         "mike", "november", "oscar", "papa", "quebec", "romeo", "sierra", "tango", "uniform", "victor", "whiskey",
+         "xray", "yankee", "zulu")
+
+
+class FakeSteamData(object):
+    """
+    Generates a synthetic Steam population on demand.
+
+    Nothing is stored: every user, app and order is derived from a random generator seeded with its ID (and the
+    population's seed), so the same ID always yields the same data, across runs and across server threads, at no
+    memory cost. The one exception is orders finalized through the API, which have to stay finalized.
+    """
+
+    def __init__(self, seed=0, users=100000, apps=5000, private_ratio=0.2, max_friends=250, max_games=400,
+                 max_achievements=80, report_orders=100000):
+        """
+        :param seed: Changes the entire generated population.
+        :param users: Population size. Friend lists only point at users within the population.
+        :param apps: Catalog size. App IDs are multiples of 10, like Valve's early ones.
+        :param private_ratio: The ratio of users with private profiles. (No games, friends or stats)
+        :param max_friends: The largest generated friend list.
+        :param max_games: The largest generated game library.
+        :param max_achievements: The most achievements a generated app can have.
+        :param report_orders: The number of orders in the in-game store's order history.
+        """
+        self.seed = seed
+        self.users = users
+        self.apps = apps
+        self.private_ratio = private_ratio
+        self.max_friends = max_friends
+        self.max_games = max_games
+        self.max_achievements = max_achievements
+        self.report_orders = report_orders
+        self._finalized_orders = set()
+        self._orders_lock = threading.RLock()
+
+    def _random(self, kind, object_id):
+        digest = hashlib.md5("{0}:{1}:{2}".format(self.seed, kind, object_id).encode('ascii')).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    def _name(self, rng, words=2):
+        return ' '.join(rng.choice(WORDS).capitalize() for _ in range(words))
+
+    def steamid(self, index):
+        """
+        :return: The 64-bit Steam ID of the population's "index"-th user.
+        :rtype: int
+        """
+        return BASE_STEAMID + 1 + (index % self.users)
+
+    def vanity_name(self, steamid):
+        return "user{0}".format(int(steamid) - BASE_STEAMID)
+
+    def resolve_vanity(self, vanity_name):
+        if not vanity_name.startswith("user"):
+            return None
+        try:
+            index = int(vanity_name[len("user"):])
+        except ValueError:
+            return None
+        if not 0 < index <= self.users:
+            return None
+        return BASE_STEAMID + index
+
+    def is_private(self, steamid):
+        return self._random('private', steamid).random() < self.private_ratio
+
+    def summary(self, steamid):
+        rng = self._random('summary', steamid)
+        summary = {'steamid': str(steamid),
+                   'communityvisibilitystate': 1 if self.is_private(steamid) else 3,
+                   'profilestate': 1,
+                   'personaname': self._name(rng, 1) + str(rng.randint(1, 999)),
+                   'profileurl': "https://steamcommunity.com/id/{0}/".format(self.vanity_name(steamid)),
+                   'avatar': "https://avatars.example/{0}.jpg".format(steamid),
+                   'avatarmedium': "https://avatars.example/{0}_medium.jpg".format(steamid),
+                   'avatarfull': "https://avatars.example/{0}_full.jpg".format(steamid),
+                   'lastlogoff': 1500000000 + rng.randint(0, 10 ** 8),
+                   'personastate': rng.choice((0, 0, 0, 1, 1, 3)),
+                   'primaryclanid': "103582791429521408",
+                   'timecreated': 1100000000 + rng.randint(0, 10 ** 8)}
+        if rng.random() < 0.5:
+            summary['realname'] = self._name(rng)
+        if rng.random() < 0.1:
+            appid = self.appid(rng.randrange(self.apps))
+            summary['gameid'] = str(appid)
+            summary['gameextrainfo'] = self.app_name(appid)
+        return summary
+
+    def bans(self, steamid):
+        rng = self._random('bans', steamid)
+        vac_bans = 1 if rng.random() < 0.02 else 0
+        return {'SteamId': str(steamid),
+                'CommunityBanned': rng.random() < 0.01,
+                'VACBanned': vac_bans > 0,
+                'NumberOfVACBans': vac_bans,
+                'DaysSinceLastBan': rng.randint(1, 2000) if vac_bans else 0,
+                'NumberOfGameBans': 0,
+                'EconomyBan': "none"}
+
+    def friends(self, steamid):
+        rng = self._random('friends', steamid)
+        return [{'steamid': str(self.steamid(rng.randrange(self.users))),
+                 'relationship': "friend",
+                 'friend_since': 1300000000 + rng.randint(0, 10 ** 8)}
+                for _ in range(rng.randint(0, self.max_friends))]
+
+    def games(self, steamid):
+        rng = self._random('games', steamid)
+        appids = sorted(set(self.appid(rng.randrange(self.apps)) for _ in range(rng.randint(0, self.max_games))))
+        games = []
+        for appid in appids:
+            game = {'appid': appid,
+                    'name': self.app_name(appid),
+                    'playtime_forever': rng.choice((0, rng.randint(1, 100000))),
+                    'img_icon_url': "{0:040x}".format(appid),
+                    'img_logo_url': "{0:040x}".format(appid * 7),
+                    'has_community_visible_stats': self.achievement_count(appid) > 0}
+            if rng.random() < 0.05:
+                game['playtime_2weeks'] = rng.randint(1, 2000)
+            games += [game]
+        return games
+
+    def badges(self, steamid):
+        rng = self._random('badges', steamid)
+        badges = []
+        for badge_index in range(rng.randint(0, 30)):
+            badge = {'badgeid': badge_index + 1,
+                     'level': rng.randint(1, 5),
+                     'completion_time': 1300000000 + rng.randint(0, 10 ** 8),
+                     'xp': rng.randint(10, 500),
+                     'scarcity': rng.randint(100, 10 ** 6)}
+            if rng.random() < 0.5:
+                badge['appid'] = self.appid(rng.randrange(self.apps))
+            badges += [badge]
+        xp = sum(badge['xp'] for badge in badges)
+        return {'badges': badges,
+                'player_xp': xp,
+                'player_level': xp // 100,
+                'player_xp_needed_to_level_up': 100 - xp % 100,
+                'player_xp_needed_current_level': xp - xp % 100}
+
+    def appid(self, index):
+        return 10 * (index % self.apps + 1)
+
+    def app_name(self, appid):
+        return self._name(self._random('app', appid), 3)
+
+    def achievement_count(self, appid):
+        rng = self._random('achievements', appid)
+        if rng.random() < 0.3:
+            # A good share of apps have no stats at all.
+            return 0
+        return rng.randint(1, self.max_achievements)
+
+    def achievement_names(self, appid):
+        return ["ACH_{0}_{1}".format(appid, index) for index in range(self.achievement_count(appid))]
+
+    def app_modified(self, appid):
+        """
+        :return: When the app's store page was last modified, as a Unix timestamp.
+        """
+        return 1500000000 + self._random('modified', appid).randint(0, 10 ** 8)
+
+    def schema(self, appid):
+        game = {'gameName': self.app_name(appid), 'gameVersion': "1"}
+        names = self.achievement_names(appid)
+        if len(names) > 0:
+            rng = self._random('schema', appid)
+            game['availableGameStats'] = {
+                'achievements': [{'name': name,
+                                  'defaultvalue': 0,
+                                  'displayName': self._name(rng),
+                                  'hidden': 1 if rng.random() < 0.2 else 0,
+                                  'description': self._name(rng, 6),
+                                  'icon': "https://cdn.example/{0}.jpg".format(name),
+                                  'icongray': "https://cdn.example/{0}_gray.jpg".format(name)}
+                                 for name in names],
+                'stats': []}
+        return {'game': game}
+
+    def global_percentages(self, appid):
+        rng = self._random('percentages', appid)
+        achievements = [{'name': name, 'percent': round(rng.uniform(0.1, 95.0), 1)}
+                        for name in self.achievement_names(appid)]
+        achievements.sort(key=lambda achievement: -achievement['percent'])
+        return {'achievementpercentages': {'achievements': achievements}}
+
+    def user_achievements(self, steamid, appid):
+        rng = self._random('unlocks', "{0}:{1}".format(steamid, appid))
+        return [{'apiname': name,
+                 'achieved': 1 if rng.random() < 0.4 else 0,
+                 'unlocktime': 0}
+                for name in self.achievement_names(appid)]
+
+    def order(self, orderid):
+        """
+        :return: An in-game store order, as "ISteamMicroTxn.QueryTxn" describes it.
+        """
+        rng = self._random('order', orderid)
+        roll = rng.random()
+        status = "Approved" if roll < 0.85 else "Succeeded" if roll < 0.95 else "Failed"
+        with self._orders_lock:
+            if orderid in self._finalized_orders:
+                status = "Succeeded"
+        return {'orderid': str(orderid),
+                'transid': str(rng.randint(10 ** 15, 10 ** 16)),
+                'steamid': str(self.steamid(rng.randrange(self.users))),
+                'status': status,
+                'currency': "USD",
+                'time': "2016-01-01T00:00:00Z",
+                'country': "US",
+                'items': [{'itemid': rng.randint(1, 1000), 'qty': 1, 'amount': rng.randint(99, 5999), 'vat': 0,
+                           'itemstatus': status}]}
+
+    def finalize_order(self, orderid):
+        """
+        Finalize an approved order.
+
+        :return: None, or why the order couldn't be finalized.
+        """
+        with self._orders_lock:
+            if orderid in self._finalized_orders:
+                return "Order already finalized"
+            if self.order(orderid)['status'] != "Approved":
+                return "Order not in approved state"
+            self._finalized_orders.add(orderid)
+        return None
+
+    def report(self, since, count):
+        """
+        :param since: A Unix timestamp.
+        :return: Up to "count" orders of the order history, placed at "since" or later, oldest first. Several orders
+        share each second, like a busy store's.
+        """
+        first = max(0, int(math.ceil((since - REPORT_START) / REPORT_INTERVAL)))
+        orders = []
+        for index in range(first, min(first + count, self.report_orders)):
+            order = self.order(10 ** 9 + index)
+            order['time'] = time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                          time.gmtime(REPORT_START + int(index * REPORT_INTERVAL)))
+            orders += [order]
+        return orders
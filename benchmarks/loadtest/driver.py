@@ -0,0 +1,247 @@
+__author__ = 'SmileyBarry'
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+import time
+
+try:
+    from urllib.request import urlopen
+except ImportError:
+    # Python 2.x
+    from urllib2 import urlopen
+
+from steamapi import resilience, transport
+from steamapi.core import APIConnection, APIInterface, set_resilience, set_transport
+from steamapi.errors import APIException
+from steamapi.user import SteamUser
+
+from .data import FakeSteamData
+from .server import FakeSteamServer, ServerSettings
+
+WORKLOADS = {}
+
+
+def workload(name):
+    """
+    Register a workload. Workloads receive the run's context and a user index, and perform one "operation" -- the
+    unit that latency is measured in.
+    """
+    def register(func):
+        WORKLOADS[name] = func
+        return func
+    return register
+
+
+@workload("summaries")
+def summaries_workload(context, index):
+    """
+    One batched "GetPlayerSummaries" call for 100 users, straight through APIInterface.
+    """
+    steamids = [str(context.data.steamid(index * 100 + offset)) for offset in range(100)]
+    return context.player_summaries(steamids=steamids)
+
+
+@workload("friends")
+def friends_workload(context, index):
+    """
+    A user's friend list, plus every friend's name. With "precache" on, names come from a few batched summary calls;
+    with it off, every name costs its own request.
+    """
+    user = SteamUser(context.data.steamid(index))
+    return [friend.name for friend in user.friends]
+
+
+@workload("games")
+def games_workload(context, index):
+    """
+    A user's full game library.
+    """
+    return SteamUser(context.data.steamid(index)).games
+
+
+@workload("achievements")
+def achievements_workload(context, index):
+    """
+    A user's game library, plus achievements for the first few games that have stats.
+    """
+    games = SteamUser(context.data.steamid(index)).games
+    games_with_stats = [game for game in games if getattr(game, 'has_community_visible_stats', True)]
+    return [len(game.achievements) for game in games_with_stats[:context.apps_per_user]]
+
+
+class RunContext(object):
+    def __init__(self, data, interface, apps_per_user):
+        self.data = data
+        self.interface = interface
+        self.apps_per_user = apps_per_user
+        # Prepare the call once, the way a tight loop would.
+        self.player_summaries = interface.ISteamUser.GetPlayerSummaries.v2.bind()
+
+
+def percentile(sorted_values, fraction):
+    """
+    The nearest-rank percentile of an already-sorted list.
+    """
+    if len(sorted_values) == 0:
+        return float('nan')
+    rank = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+def run_workload(name, context, concurrency=8, duration=10.0, operations=None):
+    """
+    Run a workload from several threads until either "duration" seconds pass or "operations" operations complete.
+
+    :return: A list of (latency, exception class name or None) tuples, one per operation, and the wall-clock time.
+    :rtype: tuple
+    """
+    func = WORKLOADS[name]
+    counter = itertools.count()
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def work():
+        local_results = []
+        while time.time() < deadline:
+            index = next(counter)
+            if operations is not None and index >= operations:
+                break
+            start = time.time()
+            error = None
+            try:
+                func(context, index)
+            except APIException as ex:
+                error = type(ex).__name__
+            local_results += [(time.time() - start, error)]
+        with results_lock:
+            results.extend(local_results)
+
+    threads = [threading.Thread(target=work) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - start
+
+
+def summarize(results, elapsed, server_stats=None):
+    latencies = sorted(latency for latency, error in results)
+    errors = {}
+    for latency, error in results:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    report = {'operations': len(results),
+              'elapsed': elapsed,
+              'throughput': len(results) / elapsed if elapsed > 0 else 0.0,
+              'latency_ms': {'p50': percentile(latencies, 0.50) * 1000,
+                             'p90': percentile(latencies, 0.90) * 1000,
+                             'p95': percentile(latencies, 0.95) * 1000,
+                             'p99': percentile(latencies, 0.99) * 1000,
+                             'max': percentile(latencies, 1.0) * 1000},
+              'errors': errors}
+    if server_stats is not None:
+        report['server'] = server_stats
+        report['requests_per_second'] = server_stats['requests'] / elapsed if elapsed > 0 else 0.0
+    return report
+
+
+def print_report(name, report):
+    print("Workload: {0}".format(name))
+    print("  operations:   {0} in {1:.2f}s ({2:.1f} ops/s)".format(
+        report['operations'], report['elapsed'], report['throughput']))
+    if 'server' in report:
+        print("  requests:     {0} ({1:.1f} req/s, {2} throttled, {3} server errors)".format(
+            report['server']['requests'], report['requests_per_second'], report['server']['throttled'],
+            report['server']['errors']))
+    latency = report['latency_ms']
+    print("  latency (ms): p50 {p50:.1f}  p90 {p90:.1f}  p95 {p95:.1f}  p99 {p99:.1f}  max {max:.1f}".format(**latency))
+    if report['errors']:
+        print("  errors:       " + ", ".join("{0}: {1}".format(name, count)
+                                             for name, count in sorted(report['errors'].items())))
+
+
+def _fetch_server_stats(domain):
+    return json.loads(urlopen("http://{0}/_stats".format(domain)).read().decode('utf-8'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test steamapi against a local Steam Web API stand-in.")
+    parser.add_argument('workloads', nargs='*', default=["games"], choices=sorted(WORKLOADS),
+                        help="Workloads to run, one after the other. (Default: games)")
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help="Client threads. (Default: 8)")
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help="Seconds per workload. (Default: 10)")
+    parser.add_argument('-n', '--operations', type=int, help="Stop each workload after this many operations.")
+    parser.add_argument('--no-precache', action='store_true', help="Disable APIConnection's friend precaching.")
+    parser.add_argument('--apps-per-user', type=int, default=5,
+                        help="Games per user whose achievements are fetched. (Default: 5)")
+    parser.add_argument('--server', metavar='HOST:PORT',
+                        help="Use an already-running server instead of starting one in-process.")
+    parser.add_argument('--latency', type=float, default=0.02, help="Base server latency, seconds. (Default: 0.02)")
+    parser.add_argument('--latency-jitter', type=float, default=0.01,
+                        help="Mean extra, exponentially-distributed latency, seconds. (Default: 0.01)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Ratio of 500 responses. (Default: 0)")
+    parser.add_argument('--stall-rate', type=float, default=0.0, help="Ratio of stalled requests. (Default: 0)")
+    parser.add_argument('--stall-latency', type=float, default=1.0,
+                        help="Extra latency of stalled requests, seconds. (Default: 1)")
+    parser.add_argument('--rate-limit', type=float, help="Requests per second per key before 429s. (Default: off)")
+    parser.add_argument('--burst', type=float, help="Token bucket size for --rate-limit.")
+    parser.add_argument('--users', type=int, default=100000, help="Generated population size. (Default: 100000)")
+    parser.add_argument('--seed', type=int, default=0, help="Data & latency seed. (Default: 0)")
+    parser.add_argument('--json', action='store_true', help="Print the reports as JSON.")
+    parser.add_argument('--record', metavar='ARCHIVE', help="Record every exchange into this archive file.")
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help="Answer requests from this archive file, falling through to the server on misses.")
+    parser.add_argument('--resilience', action='store_true',
+                        help="Hedge slow requests & break circuits of failing endpoints. (See \"steamapi.resilience\")")
+    args = parser.parse_args(argv)
+
+    data = FakeSteamData(seed=args.seed, users=args.users)
+    if args.server is None:
+        server = FakeSteamServer(data=data,
+                                 settings=ServerSettings(latency=args.latency,
+                                                         latency_jitter=args.latency_jitter,
+                                                         error_rate=args.error_rate,
+                                                         rate_limit=args.rate_limit,
+                                                         burst=args.burst,
+                                                         seed=args.seed,
+                                                         stall_rate=args.stall_rate,
+                                                         stall_latency=args.stall_latency))
+        server.serve_in_background()
+        domain = server.domain
+    else:
+        domain = args.server
+
+    if args.record is not None:
+        set_transport(transport.RecordingTransport(transport.Archive(args.record)))
+    elif args.replay is not None:
+        set_transport(transport.ReplayTransport(transport.Archive(args.replay), transport.FALLTHROUGH))
+    if args.resilience:
+        set_resilience(resilience.ResiliencePolicy())
+
+    api_key = "0" * 32
+    APIConnection(api_key=api_key, settings={'api_domain': domain, 'precache': not args.no_precache})
+    context = RunContext(data, APIInterface(api_key=api_key, api_domain=domain), args.apps_per_user)
+
+    reports = {}
+    for name in args.workloads:
+        stats_before = _fetch_server_stats(domain)
+        results, elapsed = run_workload(name, context, args.concurrency, args.duration, args.operations)
+        stats_after = _fetch_server_stats(domain)
+        server_stats = {counter: stats_after[counter] - stats_before[counter]
+                        for counter in ('requests', 'throttled', 'errors')}
+        reports[name] = summarize(results, elapsed, server_stats)
+        if not args.json:
+            print_report(name, reports[name])
+
+    if args.json:
+        print(json.dumps(reports, indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,380 @@
+__author__ = 'SmileyBarry'
+
+import calendar
+import json
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlsplit
+except ImportError:
+    # Python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlsplit
+
+from .data import FakeSteamData
+
+
+class ServerSettings(object):
+    def __init__(self, latency=0.0, latency_jitter=0.0, error_rate=0.0, rate_limit=None, burst=None, seed=0,
+                 stall_rate=0.0, stall_latency=1.0):
+        """
+        Tunable misbehaviour for the fake API server.
+
+        :param latency: The minimum added latency per request, in seconds.
+        :type latency: float
+        :param latency_jitter: The mean of an exponentially-distributed extra latency, in seconds. This gives a
+        realistic long tail, rather than uniform noise.
+        :type latency_jitter: float
+        :param error_rate: The ratio of requests that fail with a "500 Internal Server Error".
+        :type error_rate: float
+        :param rate_limit: The sustained requests per second allowed per API key, past which requests are throttled
+        with "429 Too Many Requests". None disables throttling.
+        :type rate_limit: float
+        :param burst: How many requests per key can be made in a burst before throttling kicks in. Defaults to one
+        second's worth of requests.
+        :type burst: float
+        :param seed: Seeds the latency & error generator.
+        :type seed: int
+        :param stall_rate: The ratio of requests that stall, like ones stuck behind a busy backend or a lost packet.
+        :type stall_rate: float
+        :param stall_latency: How long stalled requests take on top of the rest, in seconds.
+        :type stall_latency: float
+        """
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self.seed = seed
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+
+
+class _TokenBucket(object):
+    def __init__(self, rate, burst):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last_update = time.time()
+
+    def take(self):
+        now = time.time()
+        self._tokens = min(self._burst, self._tokens + (now - self._last_update) * self._rate)
+        self._last_update = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class FakeSteamServer(ThreadingMixIn, HTTPServer):
+    """
+    A local, threaded stand-in for the Steam Web API, serving generated data.
+
+    Request statistics are available from "stats()", or over HTTP at "/_stats".
+    """
+    daemon_threads = True
+    # Every request opens a new connection. The default backlog (5) drops connection attempts under concurrent load,
+    # and each dropped one waits out a retransmission timeout.
+    request_queue_size = 128
+
+    def __init__(self, address=('127.0.0.1', 0), data=None, settings=None):
+        """
+        :param address: The (host, port) to listen on. Port 0 picks a free port.
+        :param data: The population to serve.
+        :type data: FakeSteamData
+        :param settings: Latency, error & throttling settings.
+        :type settings: ServerSettings
+        """
+        HTTPServer.__init__(self, address, FakeSteamRequestHandler)
+        self.data = data if data is not None else FakeSteamData()
+        self.settings = settings if settings is not None else ServerSettings()
+        self._random = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'endpoints': {}}
+
+    @property
+    def domain(self):
+        """
+        :return: A "host:port" string, suitable for APIConnection's & APIInterface's "api_domain".
+        :rtype: str
+        """
+        return "{0}:{1}".format(*self.server_address[:2])
+
+    def serve_in_background(self):
+        """
+        Start serving from a daemon thread.
+
+        :rtype: threading.Thread
+        """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            return json.loads(json.dumps(self._stats))
+
+    def admit(self, endpoint, key):
+        """
+        Account for a new request and decide its fate.
+
+        :return: A (delay, status) tuple. "status" is None if the request should be served normally.
+        """
+        settings = self.settings
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['endpoints'][endpoint] = self._stats['endpoints'].get(endpoint, 0) + 1
+
+            if settings.rate_limit is not None:
+                if key not in self._buckets:
+                    self._buckets[key] = _TokenBucket(settings.rate_limit, settings.burst)
+                if not self._buckets[key].take():
+                    self._stats['throttled'] += 1
+                    # Throttled requests are rejected right away.
+                    return 0.0, 429
+
+            delay = settings.latency
+            if settings.latency_jitter > 0:
+                delay += self._random.expovariate(1.0 / settings.latency_jitter)
+            if settings.stall_rate > 0 and self._random.random() < settings.stall_rate:
+                delay += settings.stall_latency
+
+            if settings.error_rate > 0 and self._random.random() < settings.error_rate:
+                self._stats['errors'] += 1
+                return delay, 500
+        return delay, None
+
+
+class FakeSteamRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Stay quiet; load tests make a *lot* of requests.
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self._handle(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self._handle(urlsplit(self.path).path, parse_qs(body))
+
+    def _handle(self, path, query):
+        params = {name: values[-1] for name, values in query.items()}
+        if path == "/_stats":
+            return self._reply(200, self.server.stats())
+
+        parts = [part for part in path.split('/') if part]
+        if len(parts) != 3:
+            return self._reply(404, None)
+        interface, command = parts[0], parts[1]
+        endpoint = interface + '.' + command
+
+        delay, status = self.server.admit(endpoint, params.get('key'))
+        if delay > 0:
+            time.sleep(delay)
+        if status is not None:
+            return self._reply(status, None)
+
+        handler = ENDPOINTS.get(endpoint)
+        if handler is None:
+            return self._reply(404, None)
+        try:
+            status, payload = handler(self.server.data, params)
+        except (KeyError, ValueError):
+            status, payload = 400, None
+        return self._reply(status, payload)
+
+    def _reply(self, status, payload):
+        if payload is None:
+            body = "<html><body><h1>{0}</h1></body></html>".format(status).encode('utf-8')
+            content_type = "text/html"
+        else:
+            body = json.dumps(payload).encode('utf-8')
+            content_type = "application/json; charset=UTF-8"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _steamids(params):
+    return [int(steamid) for steamid in params['steamids'].split(',') if steamid]
+
+
+def _get_player_summaries(data, params):
+    return 200, {'response': {'players': [data.summary(steamid) for steamid in _steamids(params)]}}
+
+
+def _get_player_bans(data, params):
+    return 200, {'players': [data.bans(steamid) for steamid in _steamids(params)]}
+
+
+def _get_friend_list(data, params):
+    steamid = int(params['steamid'])
+    if data.is_private(steamid):
+        return 401, None
+    return 200, {'friendslist': {'friends': data.friends(steamid)}}
+
+
+def _get_user_group_list(data, params):
+    return 200, {'response': {'success': True, 'groups': [{'gid': "4"}, {'gid': "1012"}]}}
+
+
+def _resolve_vanity_url(data, params):
+    steamid = data.resolve_vanity(params['vanityurl'])
+    if steamid is None:
+        return 200, {'response': {'success': 42, 'message': "No match"}}
+    return 200, {'response': {'steamid': str(steamid), 'success': 1}}
+
+
+def _get_owned_games(data, params):
+    steamid = int(params['steamid'])
+    if data.is_private(steamid):
+        return 200, {'response': {}}
+    games = data.games(steamid)
+    if params.get('include_played_free_games', '0') == '0':
+        # There's no "free" flag in the generated data, so treat every tenth app as free-to-play.
+        games = [game for game in games if game['appid'] % 100 != 0]
+    return 200, {'response': {'game_count': len(games), 'games': games}}
+
+
+def _get_recently_played_games(data, params):
+    steamid = int(params['steamid'])
+    if data.is_private(steamid):
+        return 200, {'response': {}}
+    games = [game for game in data.games(steamid) if 'playtime_2weeks' in game]
+    return 200, {'response': {'total_count': len(games), 'games': games}}
+
+
+def _get_badges(data, params):
+    return 200, {'response': data.badges(int(params['steamid']))}
+
+
+def _is_playing_shared_game(data, params):
+    return 200, {'response': {'lender_steamid': 0}}
+
+
+def _get_schema_for_game(data, params):
+    return 200, data.schema(int(params['appid']))
+
+
+def _get_global_achievement_percentages(data, params):
+    appid = int(params['gameid'])
+    if data.achievement_count(appid) == 0:
+        return 403, None
+    return 200, data.global_percentages(appid)
+
+
+def _get_user_stats_for_game(data, params):
+    steamid, appid = int(params['steamid']), int(params['appid'])
+    if data.is_private(steamid) or data.achievement_count(appid) == 0:
+        return 400, None
+    achievements = [{'name': achievement['apiname'], 'achieved': 1}
+                    for achievement in data.user_achievements(steamid, appid) if achievement['achieved']]
+    return 200, {'playerstats': {'steamID': str(steamid),
+                                 'gameName': data.app_name(appid),
+                                 'achievements': achievements,
+                                 'stats': []}}
+
+
+def _get_player_achievements(data, params):
+    steamid, appid = int(params['steamid']), int(params['appid'])
+    if data.is_private(steamid) or data.achievement_count(appid) == 0:
+        return 400, None
+    return 200, {'playerstats': {'steamID': str(steamid),
+                                 'gameName': data.app_name(appid),
+                                 'achievements': data.user_achievements(steamid, appid),
+                                 'success': True}}
+
+
+def _query_txn(data, params):
+    return 200, {'response': {'result': "OK", 'params': data.order(int(params['orderid']))}}
+
+
+def _finalize_txn(data, params):
+    orderid = int(params['orderid'])
+    error = data.finalize_order(orderid)
+    if error is not None:
+        return 200, {'response': {'result': "Failure", 'error': {'errorcode': 100, 'errordesc': error}}}
+    return 200, {'response': {'result': "OK", 'params': {'orderid': str(orderid),
+                                                         'transid': data.order(orderid)['transid']}}}
+
+
+def _get_report(data, params):
+    since = calendar.timegm(time.strptime(params['time'], "%Y-%m-%dT%H:%M:%SZ"))
+    orders = data.report(since, min(int(params.get('maxresults', 1000)), 10000))
+    return 200, {'response': {'result': "OK", 'params': {'count': len(orders), 'orders': orders}}}
+
+
+def _get_app_list(data, params):
+    return 200, {'applist': {'apps': [{'appid': data.appid(index), 'name': data.app_name(data.appid(index))}
+                                      for index in range(data.apps)]}}
+
+
+def _get_store_app_list(data, params):
+    if 'key' not in params:
+        return 403, None
+    modified_since = int(params.get('if_modified_since', 0))
+    last_appid = int(params.get('last_appid', 0))
+    max_results = int(params.get('max_results', 10000))
+    apps = []
+    for index in range(data.apps):
+        appid = data.appid(index)
+        if appid > last_appid and data.app_modified(appid) > modified_since:
+            apps += [{'appid': appid, 'name': data.app_name(appid), 'last_modified': data.app_modified(appid),
+                      'price_change_number': 0}]
+    response = {'apps': apps[:max_results]}
+    if len(apps) > max_results:
+        response['have_more_results'] = True
+        response['last_appid'] = apps[max_results - 1]['appid']
+    return 200, {'response': response}
+
+
+def _get_supported_api_list(data, params):
+    interfaces = {}
+    for endpoint in sorted(ENDPOINTS):
+        interface, command = endpoint.split('.')
+        interfaces.setdefault(interface, []).append({'name': command,
+                                                     'version': 1,
+                                                     'httpmethod': "GET",
+                                                     'parameters': []})
+    return 200, {'apilist': {'interfaces': [{'name': name, 'methods': methods}
+                                            for name, methods in sorted(interfaces.items())]}}
+
+
+ENDPOINTS = {
+    'ISteamUser.GetPlayerSummaries': _get_player_summaries,
+    'ISteamUser.GetPlayerBans': _get_player_bans,
+    'ISteamUser.GetFriendList': _get_friend_list,
+    'ISteamUser.GetUserGroupList': _get_user_group_list,
+    'ISteamUser.ResolveVanityURL': _resolve_vanity_url,
+    'IPlayerService.GetOwnedGames': _get_owned_games,
+    'IPlayerService.GetRecentlyPlayedGames': _get_recently_played_games,
+    'IPlayerService.GetBadges': _get_badges,
+    'IPlayerService.IsPlayingSharedGame': _is_playing_shared_game,
+    'ISteamUserStats.GetSchemaForGame': _get_schema_for_game,
+    'ISteamUserStats.GetGlobalAchievementPercentagesForApp': _get_global_achievement_percentages,
+    'ISteamUserStats.GetUserStatsForGame': _get_user_stats_for_game,
+    'ISteamUserStats.GetPlayerAchievements': _get_player_achievements,
+    'ISteamWebAPIUtil.GetSupportedAPIList': _get_supported_api_list,
+    'ISteamApps.GetAppList': _get_app_list,
+    'IStoreService.GetAppList': _get_store_app_list,
+    'ISteamMicroTxn.QueryTxn': _query_txn,
+    'ISteamMicroTxn.FinalizeTxn': _finalize_txn,
+    'ISteamMicroTxnSandbox.QueryTxn': _query_txn,
+    'ISteamMicroTxnSandbox.FinalizeTxn': _finalize_txn,
+    'ISteamMicroTxn.GetReport': _get_report,
+    'ISteamMicroTxnSandbox.GetReport': _get_report,
+}
@@ -0,0 +1,95 @@
+__author__ = 'SmileyBarry'
+
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+
+from .common import REGISTRY, measure, measure_self_timed
+
+BENCHMARK_MODULES = ("bench_core", "bench_decorators", "bench_user", "bench_app", "bench_errors", "bench_import")
+
+
+def run(name_filter=None, min_time=0.2, repeat=5):
+    """
+    Run every registered benchmark (or only those whose name contains "name_filter").
+
+    :return: A mapping of benchmark names to their "common.measure" results.
+    :rtype: dict
+    """
+    for module_name in BENCHMARK_MODULES:
+        importlib.import_module('.' + module_name, __package__)
+
+    results = {}
+    for name, setup, self_timed in REGISTRY:
+        if name_filter is not None and name_filter not in name:
+            continue
+        if self_timed is True:
+            results[name] = measure_self_timed(setup(), repeat=repeat)
+        else:
+            results[name] = measure(setup(), min_time=min_time, repeat=repeat)
+        print("{name:<50} {best:>12.1f} ns  (median {median:.1f} ns, {loops} loops)".format(
+            name=name, best=results[name]['best_ns'], median=results[name]['median_ns'],
+            loops=results[name]['loops']))
+    return results
+
+
+def compare(baseline, results, threshold):
+    """
+    Compare results against a saved baseline.
+
+    :param threshold: The relative slowdown (e.g. 0.1 for 10%) above which a benchmark counts as a regression.
+    :return: The names of all regressed benchmarks.
+    :rtype: list of str
+    """
+    regressions = []
+    print("")
+    print("{0:<50} {1:>12} {2:>12} {3:>8}".format("benchmark", "baseline", "current", "change"))
+    for name in sorted(results):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['best_ns']
+        after = results[name]['best_ns']
+        change = (after - before) / before
+        marker = ""
+        if change > threshold:
+            regressions += [name]
+            marker = "  <-- REGRESSION"
+        print("{0:<50} {1:>9.1f} ns {2:>9.1f} ns {3:>+7.1%}{4}".format(name, before, after, change, marker))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the steamapi micro-benchmark suite.")
+    parser.add_argument('-k', '--filter', help="Only run benchmarks whose name contains this string.")
+    parser.add_argument('--save', metavar='PATH', help="Save the results as JSON, for later comparison.")
+    parser.add_argument('--compare', metavar='PATH', help="Compare the results against a saved JSON baseline.")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative slowdown counted as a regression when comparing. (Default: 0.10)")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="Minimum duration of each timed repetition, in seconds. (Default: 0.2)")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed repetitions per benchmark. (Default: 5)")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.min_time, args.repeat)
+
+    if args.save is not None:
+        with open(args.save, 'w') as output_file:
+            json.dump({'python': platform.python_version(),
+                       'implementation': platform.python_implementation(),
+                       'platform': platform.platform(),
+                       'timestamp': time.time(),
+                       'results': results}, output_file, indent=2, sort_keys=True)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,26 @@
 __author__ = 'SmileyBarry'
 
-from . import app, core, errors, user
+import importlib
+import sys
+
+__all__ = ['app', 'core', 'errors', 'user']
+
+# Every submodule, imported on first access (e.g.: "steamapi.user") rather than with the package, so processes only
+# pay for what they use.
+_SUBMODULES = ('analytics', 'app', 'cache', 'cachefile', 'catalog', 'consts', 'core', 'decorators', 'errors', 'export',
+               'keypool', 'metrics', 'presence', 'resilience', 'scheduler', 'snapshot', 'store', 'tracing', 'transport',
+               'user', 'workers')
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # Only called for attributes that aren't set yet. Importing the submodule sets it, so this runs once per
+        # submodule.
+        if name in _SUBMODULES:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(_SUBMODULES))
+else:
+    # No module-level "__getattr__" before Python 3.7 (PEP 562), so import everything up-front, as before.
+    from . import app, core, errors, user
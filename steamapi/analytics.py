@@ -0,0 +1,220 @@
+__author__ = 'SmileyBarry'
+
+try:
+    import numpy
+except ImportError:
+    raise ImportError("\"steamapi.analytics\" requires NumPy. Install it with \"pip install numpy\".")
+
+from .errors import APIException
+
+# Global unlock percentages are rounded, and some come back as 0; treat anything rarer as this rare.
+MIN_PERCENT = 0.01
+
+
+def _is_unlocked(achievement):
+    # "SteamApp.achievements" pre-caches unlocks as "is_achieved". Reading "is_unlocked" instead would cost a call per
+    # achievement.
+    cached = getattr(achievement, '_cache', {}).get('is_achieved')
+    if cached is not None:
+        return cached[0]
+    return achievement.is_unlocked
+
+
+class AchievementMatrix(object):
+    def __init__(self, steamids, appids, achievement_apps, achievement_names, percentages, unlocked, has_stats):
+        """
+        Achievement data of many users over many apps, as NumPy arrays. Users are rows; achievements are columns,
+        grouped by app. Every statistic is computed over the whole matrix at once. Build one with "from_games"
+        rather than by hand.
+
+            >>> matrix = AchievementMatrix.from_games({user.steamid: user.games for user in users})
+            >>> matrix.cohort_percentiles(matrix.user_completion())
+
+        :param steamids: The users, one per row.
+        :type steamids: list of int
+        :param appids: The apps, in column order.
+        :type appids: list of int
+        :param achievement_apps: Each column's index into "appids". Must be sorted.
+        :type achievement_apps: numpy.ndarray
+        :param achievement_names: Each column's achievement API name.
+        :type achievement_names: list of str
+        :param percentages: Each column's global unlock percentage. (0-100)
+        :type percentages: numpy.ndarray
+        :param unlocked: A (users x achievements) bool array of who unlocked what.
+        :type unlocked: numpy.ndarray
+        :param has_stats: A (users x apps) bool array of which users have stats for which apps. (Usually: which apps
+        they own)
+        :type has_stats: numpy.ndarray
+        """
+        self.steamids = list(steamids)
+        self.appids = list(appids)
+        self.achievement_apps = numpy.asarray(achievement_apps, dtype=numpy.intp)
+        self.achievement_names = list(achievement_names)
+        self.percentages = numpy.asarray(percentages, dtype=numpy.float64)
+        self.unlocked = numpy.asarray(unlocked, dtype=bool)
+        self.has_stats = numpy.asarray(has_stats, dtype=bool)
+        # Where each app's columns start; "numpy.add.reduceat" sums each app's columns with these.
+        self._app_starts = numpy.searchsorted(self.achievement_apps, numpy.arange(len(self.appids)))
+
+    @classmethod
+    def from_games(cls, games_by_user):
+        """
+        Collect the achievements of each user's games. Their "achievements" are fetched if they aren't cached yet;
+        games without stats (or whose stats can't be fetched) are left out of that user's row.
+
+        :param games_by_user: {steamid: games}, where games are SteamApp objects associated with that user, like
+        "SteamUser.games".
+        :type games_by_user: dict
+        :rtype: AchievementMatrix
+        """
+        steamids = list(games_by_user)
+        columns = {}
+        percentages = {}
+        unlocks = []
+        owned = []
+        for row, steamid in enumerate(steamids):
+            for game in games_by_user[steamid]:
+                try:
+                    achievements = game.achievements
+                except APIException:
+                    continue
+                if len(achievements) == 0:
+                    continue
+                appid = int(game.appid)
+                owned += [(row, appid)]
+                for achievement in achievements:
+                    key = (appid, achievement.apiname)
+                    if key not in columns:
+                        columns[key] = len(columns)
+                        percentages[key] = achievement.unlock_percentage
+                    if _is_unlocked(achievement):
+                        unlocks += [(row, key)]
+
+        # Group columns by app, as "reduceat" needs.
+        keys = sorted(columns)
+        appids = sorted(set(appid for appid, name in keys))
+        app_index = {appid: index for index, appid in enumerate(appids)}
+        column_index = {key: index for index, key in enumerate(keys)}
+
+        unlocked = numpy.zeros((len(steamids), len(keys)), dtype=bool)
+        if len(unlocks) > 0:
+            rows, unlocked_keys = zip(*unlocks)
+            unlocked[list(rows), [column_index[key] for key in unlocked_keys]] = True
+        has_stats = numpy.zeros((len(steamids), len(appids)), dtype=bool)
+        if len(owned) > 0:
+            rows, owned_appids = zip(*owned)
+            has_stats[list(rows), [app_index[appid] for appid in owned_appids]] = True
+
+        return cls(steamids, appids,
+                   [app_index[appid] for appid, name in keys],
+                   [name for appid, name in keys],
+                   [percentages[key] for key in keys],
+                   unlocked, has_stats)
+
+    def rarity_scores(self):
+        """
+        Score each achievement by how rare it is: -log10 of its global unlock ratio. An achievement everyone has
+        scores 0, one in ten players 1, one in a hundred 2, and so on.
+
+        :return: One score per achievement column.
+        :rtype: numpy.ndarray
+        """
+        return -numpy.log10(numpy.clip(self.percentages, MIN_PERCENT, 100.0) / 100.0)
+
+    def user_rarity_scores(self):
+        """
+        :return: Each user's total rarity score: the sum of "rarity_scores" over the achievements they unlocked.
+        :rtype: numpy.ndarray
+        """
+        return self.unlocked.dot(self.rarity_scores())
+
+    def _per_app(self, values):
+        if len(self.appids) == 0:
+            return numpy.zeros((values.shape[0], 0))
+        return numpy.add.reduceat(values, self._app_starts, axis=1)
+
+    def unlocked_counts(self):
+        """
+        :return: A (users x apps) array of how many of each app's achievements each user unlocked.
+        :rtype: numpy.ndarray
+        """
+        return self._per_app(self.unlocked.astype(numpy.int32))
+
+    def totals(self):
+        """
+        :return: How many achievements each app has.
+        :rtype: numpy.ndarray
+        """
+        return numpy.bincount(self.achievement_apps, minlength=len(self.appids))
+
+    def completion(self):
+        """
+        :return: A (users x apps) array of each user's completion (0.0 to 1.0) of each app. NaN where a user has no
+        stats for the app.
+        :rtype: numpy.ndarray
+        """
+        completion = self.unlocked_counts() / self.totals().astype(numpy.float64)
+        completion[~self.has_stats] = numpy.nan
+        return completion
+
+    def user_completion(self):
+        """
+        :return: Each user's average completion of the apps they have stats for. (NaN for users with none)
+        :rtype: numpy.ndarray
+        """
+        completion = self.completion()
+        counts = self.has_stats.sum(axis=1)
+        totals = numpy.where(self.has_stats, completion, 0.0).sum(axis=1)
+        average = numpy.full(len(self.steamids), numpy.nan)
+        numpy.divide(totals, counts, out=average, where=counts > 0)
+        return average
+
+    def rarest_unlocked(self, count=10):
+        """
+        Rank each user's unlocked achievements by global rarity.
+
+        :param count: How many to return per user.
+        :type count: int
+        :return: {steamid: [(appid, achievement API name, global percentage), ...]}, rarest first.
+        :rtype: dict
+        """
+        count = min(count, len(self.achievement_names))
+        rarest = {steamid: [] for steamid in self.steamids}
+        if count == 0:
+            return rarest
+        masked = numpy.where(self.unlocked, self.percentages, numpy.inf)
+        # Partition out each row's "count" rarest, and only sort those.
+        candidates = numpy.argpartition(masked, count - 1, axis=1)[:, :count]
+        order = numpy.argsort(numpy.take_along_axis(masked, candidates, axis=1), axis=1, kind='stable')
+        ranked = numpy.take_along_axis(candidates, order, axis=1)
+        unlocked_counts = self.unlocked.sum(axis=1)
+        for row, steamid in enumerate(self.steamids):
+            rarest[steamid] = [(self.appids[self.achievement_apps[column]], self.achievement_names[column],
+                                float(self.percentages[column]))
+                               for column in ranked[row, :min(count, unlocked_counts[row])]]
+        return rarest
+
+    def cohort_percentiles(self, values):
+        """
+        Place each user within the cohort: the percentage of users whose value is lower or equal. NaN values (e.g.:
+        users without stats) are left out of the cohort, and stay NaN.
+
+            >>> percentiles = matrix.cohort_percentiles(matrix.user_rarity_scores())
+
+        :param values: One value per user, like "user_completion()" or "user_rarity_scores()".
+        :type values: numpy.ndarray
+        :return: A percentile (0-100) per user.
+        :rtype: numpy.ndarray
+        """
+        values = numpy.asarray(values, dtype=numpy.float64)
+        valid = ~numpy.isnan(values)
+        cohort = numpy.sort(values[valid])
+        percentiles = numpy.full(len(values), numpy.nan)
+        if len(cohort) > 0:
+            percentiles[valid] = numpy.searchsorted(cohort, values[valid], side='right') * 100.0 / len(cohort)
+        return percentiles
+
+    def __repr__(self):
+        return "<{cls} ({users} users, {apps} apps, {achievements} achievements)>".format(
+            cls=self.__class__.__name__, users=len(self.steamids), apps=len(self.appids),
+            achievements=len(self.achievement_names))
@@ -1,7 +1,91 @@
 __author__ = 'SmileyBarry'
 
+import threading
+
+from .cache import TTLCache, MISSING
 from .core import APIConnection, SteamObject, store
-from .decorators import cached_property, INFINITE
+from .decorators import cached_property, INFINITE, HOUR
+from .errors import APIPrivate, APIKeyRequired
+
+# The full "ISteamApps.GetAppList", as an {appid: name} dict, once downloaded by "SteamApp.resolve_names".
+APP_LIST_TTL = 24 * HOUR
+_app_list = TTLCache(ttl=APP_LIST_TTL)
+_app_list_lock = threading.Lock()
+_name_source = None
+
+# Every app's {achievement API name: global unlock percentage}, shared by all SteamApp & SteamUser objects. Apps
+# without achievements get an empty dict, so they're never asked again.
+GLOBAL_PERCENTAGES_CACHE = TTLCache(ttl=24 * HOUR, max_size=20000)
+
+
+def _global_percentages(appid):
+    """
+    :return: The app's {achievement API name: global unlock percentage}, through "GLOBAL_PERCENTAGES_CACHE".
+    :rtype: dict
+    """
+    percentages = GLOBAL_PERCENTAGES_CACHE.get(appid)
+    if percentages is MISSING:
+        try:
+            response = APIConnection().call("ISteamUserStats", "GetGlobalAchievementPercentagesForApp", "v0002",
+                                            gameid=appid)
+            percentages = {achievement.name: achievement.percent
+                           for achievement in response.achievementpercentages.achievements}
+        except (APIPrivate, APIKeyRequired):
+            # This API is public; it refuses apps that have no stats.
+            percentages = {}
+        GLOBAL_PERCENTAGES_CACHE.set(appid, percentages)
+    return percentages
+
+
+def set_name_source(source):
+    """
+    Look app names up in "source" -- usually a "catalog.AppCatalog" -- before falling back to the downloaded app
+    list, or to "GetSchemaForGame":
+
+        >>> app.set_name_source(catalog.AppCatalog("apps.catalog"))
+
+    :param source: An object with a "names(appids)" method returning an {appid: name} dict, or None for none.
+    """
+    global _name_source
+    _name_source = source
+
+
+def get_name_source():
+    """
+    :return: The current name source, or None.
+    """
+    return _name_source
+
+
+def _download_app_list():
+    with _app_list_lock:
+        names = _app_list.get('names', None)
+        if names is None:
+            response = APIConnection().call("ISteamApps", "GetAppList", "v2")
+            # Plenty of entries (mostly tools & test apps) have a blank name.
+            names = {app.appid: app.name for app in response.applist.apps if getattr(app, 'name', "") != ""}
+            _app_list.set('names', names)
+    return names
+
+
+def _lookup_names(appids, download=False):
+    """
+    :param download: Whether to download the app list for names the name source doesn't have. Otherwise, it's only
+    used if it was already downloaded.
+    :return: An {appid: name} dict of the apps whose names are known without a per-app call.
+    :rtype: dict
+    """
+    names = {}
+    if _name_source is not None:
+        names.update(_name_source.names(appids))
+    missing = [appid for appid in appids if appid not in names]
+    if len(missing) > 0:
+        app_list = _download_app_list() if download else _app_list.get('names', None)
+        if app_list is not None:
+            for appid in missing:
+                if appid in app_list:
+                    names[appid] = app_list[appid]
+    return names
 
 
 class SteamApp(SteamObject):
@@ -39,12 +123,41 @@ class SteamApp(SteamObject):
                 "An app ID is required to create a SteamApp object.")
 
         appid = api_json.appid
-        name = None
         if 'name' in api_json:
             name = api_json.name
+        else:
+            name = _lookup_names([int(appid)]).get(int(appid))
 
         return SteamApp(appid, name, associated_userid)
 
+    @staticmethod
+    def resolve_names(apps):
+        """
+        Find many apps' names at once, without downloading each app's schema: from the name source (see
+        "set_name_source") if there is one, and from "ISteamApps.GetAppList" otherwise. The app list is a single,
+        large call, cached for a day.
+
+        Given SteamApp objects, their "name" is filled in too, so reading it costs nothing.
+
+            >>> SteamApp.resolve_names([570, 730])
+            {570: 'Dota 2', 730: 'Counter-Strike 2'}
+
+        :param apps: App IDs, or SteamApp objects.
+        :type apps: iterable of int or SteamApp
+        :return: An {appid: name} dict. Apps without a known name are left out; their "name" still comes from
+        "GetSchemaForGame".
+        :rtype: dict
+        """
+        apps = list(apps)
+        appids = [int(app.appid if isinstance(app, SteamApp) else app) for app in apps]
+        names = _lookup_names(appids, download=True)
+        for app in apps:
+            if isinstance(app, SteamApp) and int(app.appid) in names:
+                if not hasattr(app, '_cache'):
+                    app._cache = {}
+                store(app, "name", names[int(app.appid)])
+        return names
+
     @cached_property(ttl=INFINITE)
     def _schema(self):
         return APIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=self._id)
@@ -55,8 +168,7 @@ class SteamApp(SteamObject):
 
     @cached_property(ttl=INFINITE)
     def achievements(self):
-        global_percentages = APIConnection().call("ISteamUserStats", "GetGlobalAchievementPercentagesForApp", "v0002",
-                                                  gameid=self._id)
+        global_percentages = _global_percentages(int(self._id))
         if self._userid is not None:
             # Ah-ha, this game is associated to a user!
             userid = self._userid
@@ -84,9 +196,8 @@ class SteamApp(SteamObject):
                 store(achievement_obj, "is_hidden", False)
             else:
                 store(achievement_obj, "is_hidden", True)
-            for global_achievement in global_percentages.achievementpercentages.achievements:
-                if global_achievement.name == achievement.name:
-                    achievement_obj.unlock_percentage = global_achievement.percent
+            if achievement.name in global_percentages:
+                achievement_obj.unlock_percentage = global_percentages[achievement.name]
             achievements_list += [achievement_obj]
         if unlocks is not None:
             for achievement in achievements_list:
@@ -98,6 +209,10 @@ class SteamApp(SteamObject):
 
     @cached_property(ttl=INFINITE)
     def name(self):
+        names = _lookup_names([int(self._id)])
+        if int(self._id) in names:
+            return names[int(self._id)]
+        # Only the schema has the name of an app the name source and app list don't.
         if 'gameName' in self._schema.game:
             return self._schema.game.gameName
         else:
@@ -0,0 +1,232 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import threading
+import time
+
+from .decorators import HOUR
+from . import metrics
+
+# The most entries a NegativeCache keeps in memory by default: a crawl over millions of IDs mustn't keep every private
+# profile around.
+DEFAULT_NEGATIVE_CACHE_SIZE = 100000
+
+# How many entries a NegativeCache adds to its SQLite file between sweeps of the expired ones. Lookups skip expired
+# rows anyway; the sweeps only keep the file from growing for as long as it's used.
+NEGATIVE_CACHE_PURGE_EVERY = 1000
+
+# Returned by "TTLCache.get" when "default" isn't given, to tell "nothing cached" apart from a cached None.
+MISSING = object()
+
+
+class TTLCache(object):
+    def __init__(self, ttl=HOUR, max_size=None):
+        """
+        A thread-safe, in-memory key-value cache whose entries expire after a while. Unlike "cached_property", it's
+        not bound to any object, so it can be shared between instances. (E.g.: all SteamUser objects)
+
+        Negative results can be cached too; just store a value that means "not found" (usually None) with a shorter
+        TTL, and check for it after "get".
+
+        :param ttl: The default time-to-live of entries, in seconds.
+        :type ttl: int or float
+        :param max_size: The maximum number of entries. When full, the oldest entries are evicted first. None means
+        unbounded.
+        :type max_size: int
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        """
+        :return: The cached value, or "default" (MISSING, unless given) if there is none or it expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expiry = entry
+            if expiry < time.time():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param ttl: Overrides the cache's default TTL for this entry.
+        :type ttl: int or float
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            if key in self._entries:
+                # Re-insert it, so it counts as the newest entry.
+                del self._entries[key]
+            self._entries[key] = (value, time.time() + ttl)
+            if self.max_size is not None:
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class NegativeCache(object):
+    def __init__(self, ttl=6 * HOUR, path=None, max_size=DEFAULT_NEGATIVE_CACHE_SIZE):
+        """
+        Remembers which IDs an endpoint refused (private profiles) or didn't know (deleted users & apps), so repeated
+        lookups fail right away instead of costing a request each. Thread-safe; with "path", also shared between
+        processes through a SQLite file.
+
+            >>> reason = cache.check("IPlayerService.GetOwnedGames", steamid)
+            >>> if reason is not None:
+            ...     raise AccessException()
+
+        :param ttl: How long to remember a refusal, in seconds. Private profiles can be made public at any time.
+        :type ttl: int or float
+        :param path: A SQLite file to share entries through. (See "attach")
+        :type path: str
+        :param max_size: The most entries kept in memory; the oldest go first. Entries in the SQLite file are kept
+        regardless, and read back when needed. None means unbounded.
+        :type max_size: int
+        """
+        self.ttl = ttl
+        self._entries = TTLCache(ttl, max_size=max_size)
+        self._lock = threading.Lock()
+        self._path = None
+        self._local = threading.local()
+        self._stats = {}
+        self._inserts = 0
+        if path is not None:
+            self.attach(path)
+
+    def attach(self, path):
+        """
+        Share entries with every other process (and NegativeCache) attached to the same SQLite file.
+
+        :type path: str
+        """
+        db = self._connect(path)
+        db.execute("CREATE TABLE IF NOT EXISTS negative (endpoint TEXT, id TEXT, reason TEXT, expires REAL, "
+                   "PRIMARY KEY (endpoint, id))")
+        self._purge(db)
+        with self._lock:
+            self._path = path
+            self._local = threading.local()
+
+    @staticmethod
+    def _connect(path):
+        # Only needed for shared caches, so it isn't imported with the module.
+        import sqlite3
+        return sqlite3.connect(path, timeout=30)
+
+    def _connection(self):
+        """
+        :return: This thread's connection to the shared file, or None if there is none. Every thread gets its own,
+        so threads look entries up concurrently (SQLite allows many readers) rather than one at a time.
+        """
+        path = self._path
+        if path is None:
+            return None
+        local = self._local
+        db = getattr(local, 'db', None)
+        if db is None:
+            db = local.db = self._connect(path)
+        return db
+
+    @staticmethod
+    def _purge(db):
+        db.execute("DELETE FROM negative WHERE expires <= ?", (time.time(),))
+        db.commit()
+
+    def _count(self, endpoint, event):
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = {'hits': 0, 'misses': 0, 'added': 0}
+            stats[event] += 1
+        if metrics.enabled is True and event != 'added':
+            metrics.REGISTRY.record_cache("NegativeCache." + endpoint,
+                                          metrics.CACHE_HIT if event == 'hits' else metrics.CACHE_MISS)
+
+    def check(self, endpoint, item_id):
+        """
+        :param endpoint: The endpoint, as "Interface.Command". (E.g.: "IPlayerService.GetOwnedGames")
+        :type endpoint: str
+        :param item_id: The refused ID. (Usually a 64-bit Steam ID or an app ID)
+        :return: The recorded reason (usually an exception class name) if the endpoint refused this ID recently, or
+        None if it didn't.
+        :rtype: str or None
+        """
+        key = (endpoint, str(item_id))
+        reason = self._entries.get(key, None)
+        db = self._connection() if reason is None else None
+        if db is not None:
+            row = db.execute("SELECT reason, expires FROM negative WHERE endpoint = ? AND id = ? AND expires > ?",
+                             (key[0], key[1], time.time())).fetchone()
+            if row is not None:
+                reason = row[0]
+                self._entries.set(key, reason, ttl=row[1] - time.time())
+        self._count(endpoint, 'hits' if reason is not None else 'misses')
+        return reason
+
+    def add(self, endpoint, item_id, reason, ttl=None):
+        """
+        :param reason: Why the ID was refused. (Usually an exception class name, like "AccessException")
+        :type reason: str
+        :param ttl: Overrides the cache's default TTL for this entry.
+        :type ttl: int or float
+        """
+        if ttl is None:
+            ttl = self.ttl
+        key = (endpoint, str(item_id))
+        self._entries.set(key, reason, ttl=ttl)
+        db = self._connection()
+        if db is not None:
+            db.execute("INSERT OR REPLACE INTO negative VALUES (?, ?, ?, ?)",
+                       (key[0], key[1], reason, time.time() + ttl))
+            db.commit()
+            with self._lock:
+                self._inserts += 1
+                purge = self._inserts % NEGATIVE_CACHE_PURGE_EVERY == 0
+            if purge:
+                self._purge(db)
+        self._count(endpoint, 'added')
+
+    def discard(self, endpoint, item_id):
+        key = (endpoint, str(item_id))
+        self._entries.delete(key)
+        db = self._connection()
+        if db is not None:
+            db.execute("DELETE FROM negative WHERE endpoint = ? AND id = ?", key)
+            db.commit()
+
+    def clear(self):
+        self._entries.clear()
+        db = self._connection()
+        if db is not None:
+            db.execute("DELETE FROM negative")
+            db.commit()
+        with self._lock:
+            self._stats = {}
+
+    def stats(self):
+        """
+        :return: Per-endpoint hit (i.e.: saved request), miss & addition counts, as seen by this process.
+        :rtype: dict
+        """
+        with self._lock:
+            return {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
@@ -0,0 +1,194 @@
+__author__ = 'SmileyBarry'
+
+import mmap
+import os
+import pickle
+import struct
+import time
+import zlib
+
+# The file starts with a fixed header: a magic string, then the index's offset & size. Records (one compressed pickle
+# per object) follow, and the index (a compressed, pickled list of (key, offset, size) tuples) comes last.
+MAGIC = b"STEAMAPI-CACHE\x00\x01"
+_HEADER = struct.Struct("<16sQQ")
+
+# Protocol 2 is the newest one Python 2.7 can read.
+PICKLE_PROTOCOL = 2
+
+
+def object_key(obj):
+    """
+    :return: The key an object is stored under: its class name and ID, as a string.
+    :rtype: tuple
+    """
+    state = vars(obj)
+    if '_id' in state:
+        item_id = state['_id']
+    else:
+        # A SteamUser whose vanity URL hasn't been resolved yet. Don't resolve it just for this.
+        item_id = "vanity:" + state['_vanity_url']
+    return type(obj).__name__, str(item_id)
+
+
+def dump(objects, path):
+    """
+    Write objects (SteamUser, SteamApp, SteamAchievement, SteamGroup...) and everything they've cached, with their
+    timestamps, into a cache file. Objects reachable from their caches (e.g.: a user's friends & games) are stored
+    along with them. Later objects with the same key replace earlier ones.
+
+    The file is written under a temporary name and then renamed, so readers never see half of it.
+
+    :type objects: iterable of SteamObject
+    :param path: The cache file's path.
+    :type path: str
+    :return: The number of objects written.
+    :rtype: int
+    """
+    index = {}
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'wb') as output:
+        output.write(_HEADER.pack(MAGIC, 0, 0))
+        offset = _HEADER.size
+        for obj in objects:
+            record = zlib.compress(pickle.dumps(obj, PICKLE_PROTOCOL))
+            output.write(record)
+            index[object_key(obj)] = (offset, len(record))
+            offset += len(record)
+        index_record = zlib.compress(pickle.dumps([key + location for key, location in index.items()],
+                                                  PICKLE_PROTOCOL))
+        output.write(index_record)
+        output.seek(0)
+        output.write(_HEADER.pack(MAGIC, offset, len(index_record)))
+    getattr(os, 'replace', os.rename)(temporary_path, path)
+    return len(index)
+
+
+def _drop_old_entries(obj, max_age):
+    cache = getattr(obj, '_cache', None)
+    if cache is None:
+        return
+    oldest = time.time() - max_age
+    for name, entry in list(cache.items()):
+        if entry[1] < oldest:
+            del cache[name]
+
+
+class CacheFile(object):
+    def __init__(self, path, max_age=None):
+        """
+        Open a file written by "dump". The file is memory-mapped and only its index is read up-front; each object is
+        unpickled on first access, so opening even a huge file is fast and costs little memory.
+
+        Only open files you trust: loading a cache file unpickles it.
+
+            >>> warm = CacheFile("workers.cache")
+            >>> user = warm.get(SteamUser, steamid) or SteamUser(steamid)
+
+        :param path: The cache file's path.
+        :type path: str
+        :param max_age: Drop loaded objects' cache entries older than this, in seconds -- useful for properties
+        cached forever (INFINITE), which would otherwise never be refreshed. Entries that expired according to their
+        own TTL are already recomputed on access.
+        :type max_age: int or float
+        """
+        self.path = path
+        self.max_age = max_age
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        magic, index_offset, index_size = _HEADER.unpack(self._map[:_HEADER.size])
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("\"{0}\" is not a steamapi cache file.".format(path))
+        entries = pickle.loads(zlib.decompress(self._map[index_offset:index_offset + index_size]))
+        self._index = {(class_name, item_id): (offset, size) for class_name, item_id, offset, size in entries}
+
+    def _load(self, key):
+        offset, size = self._index[key]
+        obj = pickle.loads(zlib.decompress(self._map[offset:offset + size]))
+        if self.max_age is not None:
+            _drop_old_entries(obj, self.max_age)
+        return obj
+
+    def get(self, cls, item_id, default=None):
+        """
+        :param cls: The object's class, or its name. (E.g.: SteamUser or "SteamUser")
+        :param item_id: The object's ID. (A Steam ID, an app ID...)
+        :return: A new object, with its cache restored, or "default" if the file doesn't have it.
+        """
+        key = (cls if isinstance(cls, str) else cls.__name__, str(item_id))
+        if key not in self._index:
+            return default
+        return self._load(key)
+
+    def restore(self, obj):
+        """
+        Fill an existing object's cache from the file. Entries the object already has are kept, unless the file's
+        are newer.
+
+        :type obj: SteamObject
+        :return: Whether the file had this object.
+        :rtype: bool
+        """
+        key = object_key(obj)
+        if key not in self._index:
+            return False
+        stored_cache = getattr(self._load(key), '_cache', {})
+        try:
+            cache = obj._cache
+        except AttributeError:
+            cache = obj._cache = {}
+        for name, entry in stored_cache.items():
+            if name not in cache or cache[name][1] < entry[1]:
+                cache[name] = entry
+        return True
+
+    def keys(self):
+        """
+        :return: The (class name, ID) keys of every stored object.
+        :rtype: list of tuple
+        """
+        return list(self._index)
+
+    def __iter__(self):
+        """
+        Load every stored object, one at a time, in file order.
+        """
+        for key, location in sorted(self._index.items(), key=lambda item: item[1][0]):
+            yield self._load(key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return '<{cls} "{path}" ({count} objects)>'.format(cls=self.__class__.__name__,
+                                                           path=self.path,
+                                                           count=len(self._index))
+
+
+def load(path, max_age=None):
+    """
+    Load every object from a cache file at once. (Use "CacheFile" to load them lazily instead)
+
+    :param max_age: See "CacheFile".
+    :return: The stored objects.
+    :rtype: list of SteamObject
+    """
+    with CacheFile(path, max_age) as cache_file:
+        return list(cache_file)
@@ -0,0 +1,483 @@
+__author__ = 'SmileyBarry'
+
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from .core import APIConnection
+from .errors import APIException
+
+# File layout: a header, then four sections --
+#   apps:     one (appid, name offset, name length) record per app, sorted by app ID
+#   names:    every name, UTF-8, back to back
+#   by name:  one (folded name offset, length, app index) record per app, sorted by folded (lower-case) name
+#   tokens:   one (token offset, length, app index) record per word of every name, sorted by token, then by the
+#             name's length & app index -- the order search results are ranked in
+# followed by the folded names & tokens they point to. Every lookup is a binary search over fixed-size records, read
+# straight from the memory-mapped file.
+MAGIC = b"STMCATL1"
+_HEADER = struct.Struct("<8sIIdQQQQQ")
+_APP = struct.Struct("<IIH")
+_REFERENCE = struct.Struct("<IHI")
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# "IStoreService.GetAppList" returns at most 50000 apps per page.
+STORE_PAGE_SIZE = 50000
+
+# See "AppCatalog.search".
+SET_CHECK_RATIO = 8
+
+
+def _fold(name):
+    return name.lower().encode('utf-8')
+
+
+def _tokens(folded_name):
+    return set(token.encode('utf-8') for token in _TOKEN.findall(folded_name.decode('utf-8')))
+
+
+def _write_catalog(path, apps, last_modified):
+    """
+    Write a catalog file from an {appid: name} mapping, under a temporary name first.
+    """
+    appids = sorted(apps)
+    names = bytearray()
+    strings = bytearray()
+    app_records = bytearray()
+    folded_offsets = {}
+    by_name = []
+    token_refs = []
+    token_offsets = {}
+
+    for index, appid in enumerate(appids):
+        encoded = apps[appid].encode('utf-8')
+        app_records += _APP.pack(appid, len(names), len(encoded))
+        names += encoded
+
+        folded = _fold(apps[appid])
+        if folded not in folded_offsets:
+            folded_offsets[folded] = len(strings)
+            strings += folded
+        by_name += [(folded, appid, index)]
+        for token in _tokens(folded):
+            if token not in token_offsets:
+                token_offsets[token] = len(strings)
+                strings += token
+            token_refs += [(token, len(encoded), index)]
+
+    by_name.sort()
+    token_refs.sort()
+    by_name_records = b''.join(_REFERENCE.pack(folded_offsets[folded], len(folded), index)
+                               for folded, appid, index in by_name)
+    token_records = b''.join(_REFERENCE.pack(token_offsets[token], len(token), index)
+                             for token, name_length, index in token_refs)
+
+    apps_offset = _HEADER.size
+    names_offset = apps_offset + len(app_records)
+    by_name_offset = names_offset + len(names)
+    tokens_offset = by_name_offset + len(by_name_records)
+    strings_offset = tokens_offset + len(token_records)
+
+    temporary_path = path + ".tmp"
+    with open(temporary_path, 'wb') as output:
+        output.write(_HEADER.pack(MAGIC, len(appids), len(token_refs), last_modified, apps_offset, names_offset,
+                                  by_name_offset, tokens_offset, strings_offset))
+        for section in (app_records, names, by_name_records, token_records, strings):
+            output.write(bytes(section))
+    getattr(os, 'replace', os.rename)(temporary_path, path)
+
+
+class _CatalogView(object):
+    """
+    A read-only view of one version of the catalog file. Replaced as a whole on refresh, so readers never see a
+    half-updated catalog.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as catalog_file:
+            self.map = mmap.mmap(catalog_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Readers currently using this view, and whether it was swapped out: the map is closed once both say so.
+        self.readers = 0
+        self.retired = False
+        (magic, self.app_count, self.token_count, self.last_modified, self.apps_offset, self.names_offset,
+         self.by_name_offset, self.tokens_offset, self.strings_offset) = _HEADER.unpack(self.map[:_HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("\"{0}\" is not a steamapi app catalog.".format(path))
+
+    def app(self, index):
+        """
+        :return: The (appid, name) of the "index"-th app, by app ID order.
+        """
+        appid, name_offset, name_length = _APP.unpack_from(self.map, self.apps_offset + index * _APP.size)
+        start = self.names_offset + name_offset
+        return appid, self.map[start:start + name_length].decode('utf-8')
+
+    def find_appid(self, appid):
+        """
+        :return: The app's index, or None.
+        """
+        low, high = 0, self.app_count
+        while low < high:
+            middle = (low + high) // 2
+            middle_appid = _APP.unpack_from(self.map, self.apps_offset + middle * _APP.size)[0]
+            if middle_appid < appid:
+                low = middle + 1
+            elif middle_appid > appid:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _reference(self, section_offset, position):
+        string_offset, length, index = _REFERENCE.unpack_from(self.map, section_offset + position * _REFERENCE.size)
+        start = self.strings_offset + string_offset
+        return self.map[start:start + length], index
+
+    def lower_bound(self, section_offset, count, key):
+        """
+        :return: The position of the first reference whose string is >= "key".
+        """
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._reference(section_offset, middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def key_range(self, section_offset, count, key, exact):
+        """
+        :return: The (start, end) positions of the references whose string equals (if "exact") or starts with "key".
+        """
+        # No token or name contains a NUL, and UTF-8 never contains 0xFF, so these bound the matches from above.
+        end_key = key + (b"\x00" if exact else b"\xff")
+        return (self.lower_bound(section_offset, count, key),
+                self.lower_bound(section_offset, count, end_key))
+
+    def name_length(self, index):
+        """
+        :return: The length of the "index"-th app's name, in UTF-8 bytes, without reading the name.
+        """
+        return _APP.unpack_from(self.map, self.apps_offset + index * _APP.size)[2]
+
+    def indices(self, section_offset, start, end):
+        """
+        Yield the app index of every reference in [start, end).
+        """
+        for position in range(start, end):
+            yield _REFERENCE.unpack_from(self.map, section_offset + position * _REFERENCE.size)[2]
+
+
+class AppCatalog(object):
+    def __init__(self, path):
+        """
+        A local catalog of every app's name, kept in a compact, memory-mapped file, for looking apps up by ID and
+        searching them by name without any API calls, and without loading the catalog into Python objects.
+
+            >>> catalog = AppCatalog("apps.catalog")
+            >>> catalog.refresh()  # Downloads the app list the first time, then only what changed.
+            >>> catalog.name(570)
+            'Dota 2'
+            >>> catalog.search("counter str")
+            [(10, 'Counter-Strike'), (730, 'Counter-Strike 2'), ...]
+
+        Thread-safe: refreshing writes a new file and swaps it in, while readers keep using the previous one until
+        they're done with it. Call "close" (or use it in a "with" block) to unmap the file.
+
+        :param path: The catalog file's path. It doesn't have to exist yet.
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        # Guards "_view" and its reader count. Separate from "_lock", which is held through whole rewrites.
+        self._view_lock = threading.Lock()
+        self._view = _CatalogView(path) if os.path.exists(path) else None
+
+    def _acquire_view(self):
+        """
+        :return: The current view (or None), kept open until "_release_view" even if it's swapped out meanwhile.
+        """
+        with self._view_lock:
+            view = self._view
+            if view is not None:
+                view.readers += 1
+            return view
+
+    def _release_view(self, view):
+        if view is None:
+            return
+        with self._view_lock:
+            view.readers -= 1
+            if view.retired and view.readers == 0:
+                view.map.close()
+
+    def _swap_view(self, view):
+        """
+        Replace the current view, and close the previous one once its last reader is done with it.
+        """
+        with self._view_lock:
+            previous, self._view = self._view, view
+            if previous is not None:
+                previous.retired = True
+                if previous.readers == 0:
+                    previous.map.close()
+
+    def close(self):
+        """
+        Unmap the catalog file. The catalog reads as empty afterwards, until the next "update" or "refresh".
+        """
+        self._swap_view(None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def last_modified(self):
+        """
+        :return: When the catalog was last refreshed from the API, as a Unix timestamp. (0 if never)
+        :rtype: float
+        """
+        view = self._view
+        return view.last_modified if view is not None else 0.0
+
+    def name(self, appid, default=None):
+        """
+        :return: The app's name, or "default" if it isn't in the catalog.
+        :rtype: str
+        """
+        view = self._acquire_view()
+        try:
+            index = view.find_appid(int(appid)) if view is not None else None
+            if index is None:
+                return default
+            return view.app(index)[1]
+        finally:
+            self._release_view(view)
+
+    def names(self, appids):
+        """
+        :return: An {appid: name} mapping of the given apps that are in the catalog.
+        :rtype: dict
+        """
+        view = self._acquire_view()
+        names = {}
+        if view is None:
+            return names
+        try:
+            for appid in appids:
+                index = view.find_appid(int(appid))
+                if index is not None:
+                    names[int(appid)] = view.app(index)[1]
+        finally:
+            self._release_view(view)
+        return names
+
+    def prefix(self, prefix, limit=20):
+        """
+        Find apps whose names start with "prefix". (Case-insensitive)
+
+        :return: Up to "limit" (appid, name) tuples, ordered by name.
+        :rtype: list of tuple
+        """
+        view = self._acquire_view()
+        if view is None:
+            return []
+        try:
+            start, end = view.key_range(view.by_name_offset, view.app_count, _fold(prefix), exact=False)
+            return [view.app(index) for index in view.indices(view.by_name_offset, start, min(end, start + limit))]
+        finally:
+            self._release_view(view)
+
+    def search(self, query, limit=20):
+        """
+        Find apps whose names contain every word of "query". (Case-insensitive) The last word may be incomplete, as
+        in a search-as-you-type box.
+
+        :return: Up to "limit" (appid, name) tuples: exact matches first, then shorter names first.
+        :rtype: list of tuple
+        """
+        view = self._acquire_view()
+        try:
+            return self._search(view, query, limit)
+        finally:
+            self._release_view(view)
+
+    @staticmethod
+    def _search(view, query, limit):
+        folded_query = _fold(query)
+        words = [token.encode('utf-8') for token in _TOKEN.findall(folded_query.decode('utf-8'))]
+        if view is None or len(words) == 0 or limit <= 0:
+            return []
+
+        # Start from the rarest word's apps, and check the other words against each of their names. Looking up how
+        # many apps have each word is just two binary searches.
+        ranges = []
+        for position, word in enumerate(words):
+            is_last = position == len(words) - 1
+            start, end = view.key_range(view.tokens_offset, view.token_count, word, exact=not is_last)
+            if start == end:
+                return []
+            ranges += [(end - start, start, end, word, is_last)]
+        ranges.sort()
+        size, start, end = ranges[0][:3]
+
+        # Words with few more apps than the rarest one are checked against the set of their apps, which is cheaper
+        # than reading every candidate's name; much more common ones are checked against the name.
+        app_sets = []
+        name_words = []
+        for other_size, other_start, other_end, word, is_last in ranges[1:]:
+            if other_size <= size * SET_CHECK_RATIO:
+                app_sets += [set(view.indices(view.tokens_offset, other_start, other_end))]
+            else:
+                name_words += [(word, is_last)]
+
+        def matches(index):
+            for apps in app_sets:
+                if index not in apps:
+                    return False
+            if len(name_words) == 0:
+                return True
+            name_tokens = _tokens(_fold(view.app(index)[1]))
+            for word, is_last in name_words:
+                if is_last:
+                    if not any(token.startswith(word) for token in name_tokens):
+                        return False
+                elif word not in name_tokens:
+                    return False
+            return True
+
+        name_start, name_end = view.key_range(view.by_name_offset, view.app_count, folded_query, exact=True)
+        found = [index for index in view.indices(view.by_name_offset, name_start, name_end) if matches(index)]
+        seen = set(found)
+
+        first_token = view._reference(view.tokens_offset, start)[0]
+        if view._reference(view.tokens_offset, end - 1)[0] == first_token:
+            # A single word's references are already ranked (by name length, then app ID), so stop at "limit".
+            for index in view.indices(view.tokens_offset, start, end):
+                if len(found) >= limit:
+                    break
+                if index not in seen and matches(index):
+                    seen.add(index)
+                    found += [index]
+        else:
+            # A prefix of several words: rank their apps by name length, without reading any names unless there are
+            # other words to check.
+            candidates = set(view.indices(view.tokens_offset, start, end)) - seen
+            ranked = sorted((view.name_length(index), index) for index in candidates)
+            for name_length, index in ranked:
+                if len(found) >= limit:
+                    break
+                if matches(index):
+                    found += [index]
+        return [view.app(index) for index in found[:limit]]
+
+    def items(self):
+        """
+        Iterate every (appid, name) in the catalog, by app ID.
+        """
+        view = self._acquire_view()
+        if view is None:
+            return
+        try:
+            for index in range(view.app_count):
+                yield view.app(index)
+        finally:
+            self._release_view(view)
+
+    def update(self, apps, last_modified=None):
+        """
+        Add or rename apps, and rewrite the catalog file.
+
+        :param apps: An {appid: name} mapping.
+        :type apps: dict
+        :param last_modified: The new "last_modified" timestamp. (Default: unchanged)
+        :type last_modified: float
+        :return: How many apps were added, and how many renamed.
+        :rtype: dict
+        """
+        with self._lock:
+            merged = dict(self.items())
+            counts = {'added': 0, 'renamed': 0}
+            for appid, name in apps.items():
+                appid = int(appid)
+                if appid not in merged:
+                    counts['added'] += 1
+                elif merged[appid] != name:
+                    counts['renamed'] += 1
+                else:
+                    continue
+                merged[appid] = name
+            if last_modified is None:
+                last_modified = self.last_modified
+            if counts['added'] + counts['renamed'] > 0 or last_modified != self.last_modified:
+                _write_catalog(self.path, merged, last_modified)
+                self._swap_view(_CatalogView(self.path))
+        counts['total'] = len(self)
+        return counts
+
+    def refresh(self, full=False):
+        """
+        Bring the catalog up to date. A new (or "full") refresh downloads the entire app list through
+        "ISteamApps.GetAppList". Later ones ask "IStoreService.GetAppList" for only the apps modified since the last
+        refresh, which requires an API key; without one, they fall back to the full list.
+
+        :return: How many apps were added & renamed, and the catalog's new size.
+        :rtype: dict
+        """
+        started = time.time()
+        if not full and self._view is not None:
+            try:
+                return self.update(self._fetch_modified_since(int(self.last_modified)), started)
+            except APIException:
+                # Usually no (or an unprivileged) key. The full list works without one.
+                pass
+        response = APIConnection().call("ISteamApps", "GetAppList", "v2")
+        return self.update({app.appid: getattr(app, 'name', "") for app in response.applist.apps}, started)
+
+    @staticmethod
+    def _fetch_modified_since(timestamp):
+        apps = {}
+        last_appid = 0
+        while True:
+            response = APIConnection().call("IStoreService", "GetAppList", "v1",
+                                            if_modified_since=timestamp,
+                                            last_appid=last_appid,
+                                            max_results=STORE_PAGE_SIZE,
+                                            include_games=True,
+                                            include_dlc=True,
+                                            include_software=True,
+                                            include_videos=True,
+                                            include_hardware=True)
+            for app in getattr(response, 'apps', []):
+                apps[app.appid] = getattr(app, 'name', "")
+            if not getattr(response, 'have_more_results', False):
+                return apps
+            last_appid = response.last_appid
+
+    def __contains__(self, appid):
+        view = self._acquire_view()
+        try:
+            return view is not None and view.find_appid(int(appid)) is not None
+        finally:
+            self._release_view(view)
+
+    def __getitem__(self, appid):
+        name = self.name(appid)
+        if name is None:
+            raise KeyError(appid)
+        return name
+
+    def __len__(self):
+        view = self._view
+        return view.app_count if view is not None else 0
+
+    def __repr__(self):
+        return '<{cls} "{path}" ({count} apps)>'.format(cls=self.__class__.__name__, path=self.path, count=len(self))
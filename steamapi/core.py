@@ -1,13 +1,20 @@
 __author__ = 'SmileyBarry'
 
-import requests
 import sys
 import time
 
 from .consts import API_CALL_DOCSTRING_TEMPLATE, API_CALL_PARAMETER_TEMPLATE, IPYTHON_PEEVES, IPYTHON_MODE
 from .decorators import Singleton, cached_property, INFINITE
 from .errors import APIException, APIUnauthorized, APIKeyRequired, APIPrivate, APIConfigurationError
-from . import errors
+from .keypool import APIKeyPool
+from . import errors, metrics, tracing
+
+try:
+    from urllib.parse import urlencode, urlsplit
+except ImportError:
+    # Python 2.x
+    from urllib import urlencode
+    from urlparse import urlsplit
 
 GET = "GET"
 POST = "POST"
@@ -28,6 +35,193 @@ if sys.version_info.major < 3:
     APITypes['rawbinary'] += [buffer]
 
 
+def _endpoint_name(query):
+    """
+    Turn an API URL into an "Interface.Command.Version" endpoint name.
+    """
+    return '.'.join(urlsplit(query).path.strip('/').split('/'))
+
+
+def _send(method, query, params, endpoint=None):
+    """
+    Send a single request to the API, and check its response for errors. This is the common request path of both
+    APIConnection and APICall.
+
+    :param method: GET or POST.
+    :param query: The full URL of the API function.
+    :param params: The call's parameters, including "key" & "format".
+    :type params: dict
+    :param endpoint: The endpoint's "Interface.Command.Version" name. Only used for metrics & tracing, and derived
+    from the query if not given.
+    :type endpoint: str
+    :rtype: requests.Response
+    """
+    policy = _resilience
+    if policy is not None:
+        if endpoint is None:
+            endpoint = _endpoint_name(query)
+        return policy.send(_send_scheduled, method, query, params, endpoint)
+    return _send_scheduled(method, query, params, endpoint)
+
+
+def _send_scheduled(method, query, params, endpoint=None):
+    """
+    Send a request once the scheduler (if there is one) lets it through. Hedged requests come through here too.
+    """
+    scheduler = _scheduler
+    if scheduler is not None:
+        with scheduler.slot():
+            return _send_now(method, query, params, endpoint)
+    return _send_now(method, query, params, endpoint)
+
+
+def _send_now(method, query, params, endpoint=None):
+    """
+    Send a request right away, once the scheduler (if there is one) has let it through. (See "_send_scheduled")
+    """
+    key_pool = params.get("key")
+    if isinstance(key_pool, APIKeyPool):
+        # Borrow a real key for this request, and report back how it went.
+        params["key"] = key_pool.acquire()
+        try:
+            response = _send_now(method, query, params, endpoint)
+        except Exception as ex:
+            key_pool.release(params["key"], ex, endpoint if endpoint is not None else _endpoint_name(query))
+            raise
+        key_pool.release(params["key"])
+        return response
+
+    if metrics.enabled is False and tracing.active is False:
+        response = _request(method, query, params)
+        errors.check(response)
+        return response
+
+    if endpoint is None:
+        endpoint = _endpoint_name(query)
+    if tracing.active is True:
+        tracing.run_request_hooks(method, query, params)
+
+    start = time.time()
+    response = None
+    response_bytes = 0
+    error = None
+    with tracing.span("{0} {1}".format(method, endpoint), tracing.SPAN_HTTP,
+                      **{'http.method': method, 'http.url': query, 'steamapi.endpoint': endpoint}) as http_span:
+        try:
+            response = _request(method, query, params)
+            response_bytes = len(response.content)
+            if http_span is not None:
+                http_span.attributes['http.status_code'] = response.status_code
+            errors.check(response)
+            return response
+        except Exception as ex:
+            error = ex
+            raise
+        finally:
+            elapsed = time.time() - start
+            if metrics.enabled is True:
+                metrics.REGISTRY.record_request(endpoint,
+                                                response.status_code if response is not None else None,
+                                                elapsed,
+                                                response_bytes,
+                                                type(error).__name__ if error is not None else None)
+            if tracing.active is True:
+                tracing.run_response_hooks(method, query, params, response, error, elapsed)
+
+
+def _request(method, query, params):
+    transport = _transport
+    if transport is None:
+        transport = _default_transport()
+    return transport.send(method, query, params)
+
+
+# The transport that sends all requests, or None for a plain network request. (See "set_transport")
+_transport = None
+# The plain network transport, built on first use: it imports "requests", which takes longer than the rest of the
+# library put together.
+_http_transport = None
+
+
+def _default_transport():
+    global _http_transport
+    if _http_transport is None:
+        from .transport import HTTPTransport
+        _http_transport = HTTPTransport()
+    return _http_transport
+
+
+def set_transport(transport):
+    """
+    Route every API request through "transport" -- usually a "transport.RecordingTransport" or
+    "transport.ReplayTransport", to record a session into an archive or replay one without network access:
+
+        >>> archive = transport.Archive("session.sqlite")
+        >>> core.set_transport(transport.RecordingTransport(archive))
+
+    :param transport: An object with a "send(method, query, params)" method returning a response, or None to go back
+    to plain network requests.
+    """
+    global _transport
+    _transport = transport
+
+
+def get_transport():
+    """
+    :return: The current transport, or None if requests go straight to the network.
+    """
+    return _transport
+
+
+# Schedules all requests by priority class, or None to send them as they come. (See "set_scheduler")
+_scheduler = None
+
+
+def set_scheduler(scheduler):
+    """
+    Send every API request through "scheduler" -- a "scheduler.RequestScheduler" -- so calls tagged with a higher
+    priority class go ahead of background work:
+
+        >>> core.set_scheduler(scheduler.RequestScheduler(concurrency=8))
+
+    :param scheduler: A RequestScheduler, or None to send requests as soon as they're made.
+    """
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler():
+    """
+    :return: The current scheduler, or None.
+    """
+    return _scheduler
+
+
+# Hedges slow requests & fails calls to failing endpoints fast, or None to send every request once. (See
+# "set_resilience")
+_resilience = None
+
+
+def set_resilience(policy):
+    """
+    Send every API request through "policy" -- a "resilience.ResiliencePolicy" -- to hedge slow GET requests and
+    fail calls to failing endpoints fast:
+
+        >>> core.set_resilience(resilience.ResiliencePolicy(hedge_percentile=95))
+
+    :param policy: A ResiliencePolicy, or None to send each request once, and always.
+    """
+    global _resilience
+    _resilience = policy
+
+
+def get_resilience():
+    """
+    :return: The current resilience policy, or None.
+    """
+    return _resilience
+
+
 class APICall(object):
     def __init__(self, api_id, parent, method=None):
         """
@@ -51,6 +245,9 @@ class APICall(object):
         # Cached data.
         self._cached_key = None
         self._query = ""
+        if parent is not None:
+            # Parents never change, so the URL can be built once, right away.
+            self._build_query()
 
         # Set an empty documentation for now.
         self._api_documentation = ""
@@ -82,23 +279,22 @@ class APICall(object):
         if self._query != "":
             return self._query
 
-        # Build the query by calling "str" on ourselves, which recursively
-        # calls "str" on each parent in the chain.
-        self._query = str(self)
+        # Build the query on top of the parent's (already built) query.
+        if isinstance(self._parent, APIInterface):
+            self._query = self._parent._query_template + self._api_id + '/'
+        else:
+            self._query = self._parent._build_query() + self._api_id + '/'
         return self._query
 
     def __str__(self):
         """
         Generate the function URL.
         """
-        if isinstance(self._parent, APIInterface):
-            return self._parent._query_template + self._api_id + '/'
-        else:
-            return str(self._parent) + self._api_id + '/'
+        return self._build_query()
 
     @cached_property(ttl=INFINITE)
     def _full_name(self):
-        if self._parent is None:
+        if not isinstance(self._parent, APICall):
             return self._api_id
         else:
             return self._parent._full_name + '.' + self._api_id
@@ -113,26 +309,25 @@ class APICall(object):
                                                        full_name=self._full_name,
                                                        api_note=note)
 
-    def __getattribute__(self, item):
+    def __getattr__(self, item):
+        # Only called when the normal lookup fails, so registered & already-used children never get here.
         if item.startswith('_'):
             # Underscore items are special.
-            return super(APICall, self).__getattribute__(item)
-        else:
-            try:
-                return super(APICall, self).__getattribute__(item)
-            except AttributeError:
-                if IPYTHON_MODE is True:
-                    # We're in IPython. Which means "getdoc()" is also
-                    # automatically used for docstrings!
-                    if item == "getdoc":
-                        return lambda: self._api_documentation
-                    elif item in IPYTHON_PEEVES:
-                        # IPython always looks for this, no matter what (hiding it in __dir__ doesn't work), so this is
-                        # necessary to keep it from constantly making new
-                        # APICall instances. (a significant slowdown)
-                        raise
-                # Not an expected item, so generate a new APICall!
-                return APICall(item, self)
+            raise AttributeError("'{cls}' object has no attribute '{attr}'".format(cls=type(self).__name__,
+                                                                                   attr=item))
+        if IPYTHON_MODE is True:
+            # We're in IPython. Which means "getdoc()" is also
+            # automatically used for docstrings!
+            if item == "getdoc":
+                return lambda: self._api_documentation
+            elif item in IPYTHON_PEEVES:
+                # IPython always looks for this, no matter what (hiding it in __dir__ doesn't work), so this is
+                # necessary to keep it from constantly making new
+                # APICall instances. (a significant slowdown)
+                raise AttributeError(item)
+        # Not an expected item, so generate a new APICall, and keep it so the next access is a plain attribute
+        # lookup. "setdefault" makes sure that racing threads end up sharing the same child.
+        return self.__dict__.setdefault(item, APICall(item, self))
 
     def __iter__(self):
         return self.__dict__.__iter__()
@@ -155,8 +350,10 @@ class APICall(object):
         :type apicall_child: APICall
         """
         if apicall_child is not None:
-            if apicall_child._api_id in self.__dict__ \
-               and apicall_child is not self.__dict__[apicall_child._api_id]:
+            existing_child = self.__dict__.get(apicall_child._api_id)
+            if isinstance(existing_child, APICall) and existing_child is not apicall_child \
+               and existing_child._is_registered is True:
+                # Unregistered children are just memoized lookups, and can be replaced.
                 raise KeyError(
                     "This API ID is already taken by another API function!")
         if not isinstance(self._parent, APIInterface):
@@ -176,14 +373,14 @@ class APICall(object):
         :return: None, as the given dictionary is changed in-place.
         :rtype: None
         """
-        for argument in kwargs:
-            if issubclass(type(kwargs[argument]), list):
+        for argument, value in kwargs.items():
+            if isinstance(value, list):
                 # The API takes multiple values in a "a,b,c" structure, so we
                 # have to encode it in that way.
-                kwargs[argument] = ','.join(kwargs[argument])
-            elif issubclass(type(kwargs[argument]), bool):
+                kwargs[argument] = ','.join(value)
+            elif isinstance(value, bool):
                 # The API treats True/False as 1/0. Convert it.
-                if kwargs[argument] is True:
+                if value is True:
                     kwargs[argument] = 1
                 else:
                     kwargs[argument] = 0
@@ -200,34 +397,104 @@ class APICall(object):
         if self._api_key is not None:
             kwargs["key"] = self._api_key
 
-        # Format the final query.
-        query = str(self)
-
         if self._method is not None:
             method = self._method
 
-        if method == POST:
-            response = requests.request(method, query, data=kwargs)
-        else:
-            response = requests.request(method, query, params=kwargs)
-
-        errors.check(response)
+        response = _send(method, self._query, kwargs)
 
         # Store the object for future reference.
         if self._is_registered is False:
             self._parent._register(self)
 
-        if automatic_parsing is True:
-            response_obj = response.json()
-            if len(response_obj.keys()) == 1 and 'response' in response_obj:
-                return APIResponse(response_obj['response'])
-            else:
-                return APIResponse(response_obj)
+        return _parse_response(response, automatic_parsing, kwargs["format"])
+
+    def bind(self, method=GET, **kwargs):
+        """
+        Prepare this API function for repeated calls with the same static arguments, e.g. in a tight loop. The
+        static arguments are converted (and, for GET calls, URL-encoded) once, here, instead of on every call:
+
+            >>> get_summaries = api.ISteamUser.GetPlayerSummaries.v2.bind(format="json")
+            >>> for batch in batches:
+            ...     get_summaries(steamids=batch)
+
+        :param method: The HTTP method, unless this API function already defines one.
+        :param kwargs: Static arguments, sent with every call.
+        :return: A callable taking the remaining (per-call) arguments, and returning what calling this APICall
+        would.
+        :rtype: PreparedAPICall
+        """
+        return PreparedAPICall(self, method, kwargs)
+
+
+class PreparedAPICall(object):
+    def __init__(self, api_call, method, static_kwargs):
+        """
+        An APICall bound to a set of static arguments. Use "APICall.bind" to create one.
+
+        :type api_call: APICall
+        :type static_kwargs: dict
+        """
+        self._api_call = api_call
+        if api_call._method is not None:
+            method = api_call._method
+        self._method = method
+
+        static_kwargs = dict(static_kwargs)
+        api_call._convert_arguments(static_kwargs)
+        self._automatic_parsing = "format" not in static_kwargs
+        if self._automatic_parsing is True:
+            static_kwargs["format"] = "json"
+        self._format = static_kwargs["format"]
+
+        if method == POST:
+            # POST bodies are form-encoded by the transport, so just keep the converted arguments.
+            self._query = api_call._query
+            self._static_kwargs = static_kwargs
         else:
-            if kwargs["format"] == "json":
-                return response.json()
-            else:
-                return response.content
+            # Static GET arguments go straight into the URL; per-call arguments get appended to it.
+            self._query = api_call._query + '?' + urlencode(sorted(static_kwargs.items()))
+            self._static_kwargs = {}
+
+    def __call__(self, **kwargs):
+        api_call = self._api_call
+        if "format" in kwargs:
+            raise ValueError("\"format\" can only be set when binding, not when calling.")
+        api_call._convert_arguments(kwargs)
+        if self._static_kwargs:
+            merged_kwargs = dict(self._static_kwargs)
+            merged_kwargs.update(kwargs)
+            kwargs = merged_kwargs
+
+        if api_call._api_key is not None:
+            kwargs["key"] = api_call._api_key
+
+        response = _send(self._method, self._query, kwargs)
+
+        if api_call._is_registered is False:
+            api_call._parent._register(api_call)
+
+        return _parse_response(response, self._automatic_parsing, self._format)
+
+    def __repr__(self):
+        return "<{cls} {query}>".format(cls=self.__class__.__name__, query=self._query)
+
+
+def _parse_response(response, automatic_parsing, response_format):
+    """
+    Turn a checked response into the value returned to the caller: an APIResponse if parsing is automatic, or the
+    parsed JSON / raw content if a "format" was explicitly requested.
+    """
+    if automatic_parsing is True:
+        response_obj = response.json()
+        if len(response_obj.keys()) == 1 and 'response' in response_obj:
+            return APIResponse(response_obj['response'])
+        else:
+            return APIResponse(response_obj)
+    else:
+        if response_format == "json":
+            return response.json()
+        else:
+            return response.content
 
 
 class APIInterface(object):
@@ -238,8 +505,9 @@ class APIInterface(object):
         Initialize a new APIInterface object. This object defines an API-interacting session, and is used to call
         any API functions from standard code.
 
-        :param api_key: Your Steam Web API key. Can be left blank, but some APIs will not work.
-        :type api_key: str
+        :param api_key: Your Steam Web API key. Can be left blank, but some APIs will not work. An APIKeyPool can be
+        given instead, to spread calls over several keys.
+        :type api_key: str or APIKeyPool
         :param autopopulate: Whether the interfaces, services and methods supported by the Steam Web API should be \
         auto-populated during initialization.
         :type autopopulate: bool
@@ -410,12 +678,15 @@ class APIConnection(object):
         will not re-initialise the instance but just retrieve the existing instance. To reassign an API key,
         retrieve the Singleton instance and call "reset" with the key.
 
-        :param api_key: A Steam Web API key. (Optional, but recommended)
+        :param api_key: A Steam Web API key, or an APIKeyPool of several keys. (Optional, but recommended)
         :param settings: A dictionary of advanced tweaks. Beware! (Optional)
             precache -- True/False. (Default: True) Decides whether attributes that retrieve
                         a group of users, such as "friends", should precache player summaries,
                         like nicknames. Recommended if you plan to use nicknames right away, since
                         caching is done in groups and retrieving one-by-one takes a while.
+            api_domain -- The API server's domain name, optionally with a port. (Default: "api.steampowered.com")
+                          Useful for pointing the library at a proxy or a local stand-in server.
+            api_protocol -- "http" or "https". (Default: "http")
         :param validate_key: Perform a test call to the API with the given key to ensure the key is valid & working.
 
         """
@@ -427,6 +698,18 @@ class APIConnection(object):
                 type(settings['precache']), bool):
             self.precache = settings['precache']
 
+        if 'api_domain' in settings or 'api_protocol' in settings:
+            api_domain = settings.get('api_domain', "api.steampowered.com")
+            api_protocol = settings.get('api_protocol', "http")
+            if api_protocol not in ("http", "https"):
+                raise ValueError(
+                    "\"api_protocol\" must either be \"http\" or \"https\".")
+            if '/' in api_domain:
+                raise ValueError(
+                    "\"api_domain\" should only contain the domain name itself, without any paths or queries.")
+            self.QUERY_TEMPLATE = "{proto}://{domain}/{{interface}}/{{command}}/{{version}}/".format(
+                proto=api_protocol, domain=api_domain)
+
         if validate_key:
             if api_key is None:
                 raise ValueError(
@@ -482,12 +765,8 @@ class APIConnection(object):
         query = self.QUERY_TEMPLATE.format(
             interface=interface, command=command, version=version)
 
-        if method == POST:
-            response = requests.request(method, query, data=kwargs)
-        else:
-            response = requests.request(method, query, params=kwargs)
-
-        errors.check(response)
+        response = _send(method, query, kwargs,
+                         endpoint="{0}.{1}.{2}".format(interface, command, version))
 
         if automatic_parsing is True:
             response_obj = response.json()
@@ -504,20 +783,25 @@ class APIResponse(object):
 
     Recursively wraps every response given to it, by replacing each 'dict' object with an
     APIResponse instance. Other types are safe.
+
+    The response's fields are stored as the instance's own attributes (its "__dict__"), so reading
+    one is a plain attribute lookup, with no Python-level code involved. Nothing else may be stored
+    in the instance.
     """
 
     def __init__(self, father_dict):
-        # Initialize an empty dictionary.
-        self._real_dictionary = {}
+        fields = self.__dict__
+        if isinstance(father_dict, dict):
+            items = father_dict.items()
+        else:
+            items = ((item, father_dict[item]) for item in father_dict)
         # Recursively wrap the response in APIResponse instances.
-        for item in father_dict:
-            if isinstance(father_dict[item], dict):
-                self._real_dictionary[item] = APIResponse(father_dict[item])
-            elif isinstance(father_dict[item], list):
-                self._real_dictionary[item] = APIResponse._wrap_list(
-                    father_dict[item])
-            else:
-                self._real_dictionary[item] = father_dict[item]
+        for item, value in items:
+            if isinstance(value, dict):
+                value = APIResponse(value)
+            elif isinstance(value, list):
+                value = APIResponse._wrap_list(value)
+            fields[item] = value
 
     @staticmethod
     def _wrap_list(original_list):
@@ -530,38 +814,26 @@ class APIResponse(object):
         :return: A near-identical list, with "dict" objects replaced into APIResponse ones.
         :rtype: list
         """
-        new_list = []
-        for item in original_list:
-            if isinstance(item, dict):
-                new_list += [APIResponse(item)]
-            elif isinstance(item, list):
-                new_list += [APIResponse._wrap_list(item)]
-            else:
-                new_list += [item]
-        return new_list
-
-    def __repr__(self):
-        return dict.__repr__(self._real_dictionary)
+        return [APIResponse(item) if isinstance(item, dict)
+                else APIResponse._wrap_list(item) if isinstance(item, list)
+                else item
+                for item in original_list]
 
     @property
-    def __dict__(self):
-        return self._real_dictionary
+    def _real_dictionary(self):
+        return self.__dict__
 
-    def __getattribute__(self, item):
-        if item.startswith("_"):
-            return super(APIResponse, self).__getattribute__(item)
-        else:
-            if item in self._real_dictionary:
-                return self._real_dictionary[item]
-            else:
-                raise AttributeError("'{cls}' has no attribute '{attr}'".format(cls=type(self).__name__,
-                                                                                attr=item))
+    def __repr__(self):
+        return dict.__repr__(self.__dict__)
 
     def __getitem__(self, item):
-        return self._real_dictionary[item]
+        return self.__dict__[item]
+
+    def __contains__(self, item):
+        return item in self.__dict__
 
     def __iter__(self):
-        return self._real_dictionary.__iter__()
+        return self.__dict__.__iter__()
 
 
 class SteamObject(object):
@@ -641,6 +913,22 @@ def expire(obj, property_name):
             "This object type either doesn't visibly support caching, or has yet to initialise its cache.")
 
 
+def unwrap(obj):
+    """
+    Recursively convert an APIResponse (or a list of them) back into plain dictionaries & lists, e.g. for
+    serialization.
+
+    :param obj: An APIResponse object, a list, or a plain value.
+    :return: The same data, built only from Python's native types.
+    """
+    if isinstance(obj, APIResponse):
+        return {key: unwrap(value) for key, value in obj._real_dictionary.items()}
+    elif isinstance(obj, list):
+        return [unwrap(item) for item in obj]
+    else:
+        return obj
+
+
 def chunker(seq, size):
     """
     Turn an iteratable into a iterable of iterables of size
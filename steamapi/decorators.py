@@ -3,6 +3,14 @@ __author__ = 'SmileyBarry'
 import threading
 import time
 
+from . import metrics, tracing
+
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
 
 class debug(object):
     @staticmethod
@@ -51,6 +59,12 @@ class cached_property(object):
 
         del instance._cache[<property name>]
 
+    Hits, misses & expirations are counted per property while "steamapi.metrics" is enabled, and every
+    (re-)computation opens a span while "steamapi.tracing" is tracing.
+
+    With a RefreshPolicy set (see "set_refresh_policy"), values nearing expiry are refreshed in the background, and
+    expired values may be served for a while longer as their refresh completes.
+
     """
 
     def __init__(self, ttl=300):
@@ -64,25 +78,198 @@ class cached_property(object):
         return self
 
     def __get__(self, inst, owner):
-        now = time.time()
-        value, last_update = None, None
-        if not hasattr(inst, '_cache'):
-            inst._cache = {}
-
-        entry = inst._cache.get(self.__name__, None)
-        if entry is not None:
-            value, last_update = entry
-            if now - last_update > self.ttl > 0:
-                entry = None
+        if inst is None:
+            # Accessed through the class itself.
+            return self
 
-        if entry is None:
-            value = self.fget(inst)
+        try:
             cache = inst._cache
-            cache[self.__name__] = (value, now)
+        except AttributeError:
+            cache = inst._cache = {}
 
+        name = self.__name__
+        entry = cache.get(name, None)
+        if entry is not None:
+            # A TTL of zero (or less) never expires, so don't even look at the clock.
+            if self.ttl <= 0:
+                if metrics.enabled is True:
+                    metrics.REGISTRY.record_cache(owner.__name__ + '.' + name, metrics.CACHE_HIT)
+                return entry[0]
+            age = time.time() - entry[1]
+            if age <= self.ttl:
+                if _refresh_policy is not None and age > self.ttl * _refresh_policy.earliest_refresh:
+                    _refresh_policy.refresh_ahead_of_time(self, inst, owner, age)
+                if metrics.enabled is True:
+                    metrics.REGISTRY.record_cache(owner.__name__ + '.' + name, metrics.CACHE_HIT)
+                return entry[0]
+            if _refresh_policy is not None and _refresh_policy.serve_stale(self, inst, owner, age):
+                if metrics.enabled is True:
+                    metrics.REGISTRY.record_cache(owner.__name__ + '.' + name, metrics.CACHE_STALE)
+                return entry[0]
+            event = metrics.CACHE_EXPIRED
+        else:
+            event = metrics.CACHE_MISS
+
+        if metrics.enabled is True:
+            metrics.REGISTRY.record_cache(owner.__name__ + '.' + name, event)
+        return self.refresh(inst, owner)
+
+    def refresh(self, inst, owner):
+        """
+        (Re-)compute the property's value for "inst", and cache it.
+        """
+        now = time.time()
+        if tracing.active is True:
+            with tracing.span(owner.__name__ + '.' + self.__name__, tracing.SPAN_PROPERTY):
+                value = self.fget(inst)
+        else:
+            value = self.fget(inst)
+        inst._cache[self.__name__] = (value, now)
         return value
 
 
+class RefreshPolicy(object):
+    def __init__(self, refresh_ahead=0.1, jitter=0.1, max_stale=None, workers=2, properties=None):
+        """
+        An opt-in policy for cached properties with a TTL: values are refreshed by background workers shortly
+        before they expire, and expired values keep being served (stale-while-revalidate) while a refresh is on its
+        way, so readers almost never wait for the API. Activate it with "set_refresh_policy".
+
+        Each cached value gets its own refresh point, spread over a window of "jitter" times its TTL, so objects
+        cached together (e.g.: a friend list's summaries) aren't all refreshed at once.
+
+        :param refresh_ahead: How early to refresh, as a fraction of the TTL. (0.1 refreshes a 2-hour TTL about 12
+        minutes before it expires)
+        :type refresh_ahead: float
+        :param jitter: The width of the window refresh points are spread over, as a fraction of the TTL. Added on
+        top of "refresh_ahead".
+        :type jitter: float
+        :param max_stale: How long after expiring, in seconds, a value may still be served while it's refreshed.
+        None allows up to another TTL. Past that, readers wait for a fresh value as usual.
+        :type max_stale: int or float
+        :param workers: The number of background refresh threads.
+        :type workers: int
+        :param properties: Only apply to these properties, as "Class.property" names. (E.g.: {"SteamUser._summary"})
+        None applies to all of them.
+        :type properties: set of str
+        """
+        if not 0 <= refresh_ahead + jitter < 1:
+            raise ValueError("\"refresh_ahead\" and \"jitter\" must add up to less than 1.")
+        self.refresh_ahead = refresh_ahead
+        self.jitter = jitter
+        self.max_stale = max_stale
+        self.workers = workers
+        self.properties = set(properties) if properties is not None else None
+        # No value is refreshed before this fraction of its TTL, whatever its jitter.
+        self.earliest_refresh = 1.0 - refresh_ahead - jitter
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stats = {'refreshes': 0, 'failures': 0}
+
+    def applies_to(self, prop, owner):
+        return self.properties is None or owner.__name__ + '.' + prop.__name__ in self.properties
+
+    def refresh_ahead_of_time(self, prop, inst, owner, age):
+        """
+        Called on reads of values past "earliest_refresh". Queues a refresh if the value passed its own refresh
+        point.
+        """
+        # A deterministic, per-value fraction in [0, 1).
+        spread = (hash((id(inst), prop.__name__)) & 0xffff) / 65536.0
+        if age > prop.ttl * (1.0 - self.refresh_ahead - self.jitter * spread) and self.applies_to(prop, owner):
+            self._schedule(prop, inst, owner)
+
+    def serve_stale(self, prop, inst, owner, age):
+        """
+        Called on reads of expired values.
+
+        :return: Whether the stale value may be served. If so, a refresh was queued.
+        :rtype: bool
+        """
+        max_stale = self.max_stale if self.max_stale is not None else prop.ttl
+        if age > prop.ttl + max_stale or not self.applies_to(prop, owner):
+            return False
+        self._schedule(prop, inst, owner)
+        return True
+
+    def _schedule(self, prop, inst, owner):
+        key = (id(inst), prop.__name__)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if len(self._threads) == 0:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._work, name="cached_property refresh #{0}".format(index))
+                    thread.daemon = True
+                    thread.start()
+                    self._threads += [thread]
+        self._queue.put((prop, inst, owner, key))
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            prop, inst, owner, key = task
+            try:
+                prop.refresh(inst, owner)
+                succeeded = True
+            except Exception:
+                # Keep serving the stale value; the next read past expiry tries again.
+                succeeded = False
+            with self._lock:
+                self._pending.discard(key)
+                self._stats['refreshes' if succeeded else 'failures'] += 1
+
+    def stats(self):
+        """
+        :return: Counts of completed & failed refreshes, and how many are queued or running.
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+    def shutdown(self):
+        """
+        Stop the background workers, once they're done with the refreshes already queued.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+
+# The active RefreshPolicy, if any. Checked by "cached_property" on reads of values nearing (or past) expiry.
+_refresh_policy = None
+
+
+def set_refresh_policy(policy):
+    """
+    Serve cached properties with "policy" (a RefreshPolicy), or None to go back to plain expiry, where reading an
+    expired value waits for a fresh one.
+
+        >>> set_refresh_policy(RefreshPolicy(refresh_ahead=0.1, jitter=0.1))
+    """
+    global _refresh_policy
+    previous, _refresh_policy = _refresh_policy, policy
+    if previous is not None and previous is not policy:
+        previous.shutdown()
+
+
+def get_refresh_policy():
+    """
+    :rtype: RefreshPolicy or None
+    """
+    return _refresh_policy
+
+
 class Singleton:
     """
     A non-thread-safe helper class to ease implementing singletons.
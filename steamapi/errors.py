@@ -40,6 +40,22 @@ class APIError(APIException):
     pass
 
 
+class APIRateLimited(APIError):
+    """
+    You've sent too many requests in too short a time, and the API server is throttling you. Slow down and try
+    again later. (429)
+    """
+    pass
+
+
+class APICircuitOpen(APIError):
+    """
+    Calls to this API have been failing, so they fail right away for a while instead of being sent. (See
+    "resilience.CircuitBreaker")
+    """
+    pass
+
+
 class APIFailure(APIException):
     """
     An API failure signifies a problem with your request (e.g.: invalid API), a problem with your data,
@@ -93,6 +109,13 @@ class APIConfigurationError(APIFailure):
     pass
 
 
+class APIReplayMissing(APIFailure):
+    """
+    A strictly-replaying transport was asked for a request that isn't in its archive. (See "transport.ReplayTransport")
+    """
+    pass
+
+
 def check(response):
     """
     :type response: requests.Response
@@ -109,6 +132,9 @@ def check(response):
                     "You have no permission to use this API, or your key may be invalid.")
             else:
                 raise APIKeyRequired("This API requires a key to call.")
+        elif response.status_code == 429:
+            raise APIRateLimited(
+                "You have made too many requests recently. Try again later.")
         elif response.status_code == 400:
             raise APIBadCall(
                 "The parameters you sent didn't match this API's requirements.")
@@ -0,0 +1,488 @@
+__author__ = 'SmileyBarry'
+
+import bz2
+import csv
+import gzip
+import io
+import itertools
+import json
+import sys
+
+from .core import APIConnection, unwrap
+from .errors import APIException, AccessException
+from .user import ACCESS_DENIED_CACHE
+from .workers import imap_bounded
+
+USER_FIELDS = ("summary", "bans", "badges", "games", "achievements")
+APP_FIELDS = ("schema", "global_percentages")
+
+# "GetPlayerSummaries" & "GetPlayerBans" accept up to a hundred IDs per call.
+DEFAULT_BATCH_SIZE = 100
+
+_COMPRESSORS = {'gzip': gzip.GzipFile,
+                'bz2': bz2.BZ2File}
+_EXTENSIONS = {'.gz': 'gzip',
+               '.bz2': 'bz2'}
+
+if sys.version_info.major < 3:
+    _STRING_TYPES = (str, unicode)
+else:
+    _STRING_TYPES = (str,)
+
+
+def _batches(iterable, size):
+    """
+    Like "core.chunker", but for any iterable -- including generators which can't be sliced.
+    """
+    items = iter(iterable)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if len(batch) == 0:
+            return
+        yield batch
+
+
+def _open_text_target(target, compression):
+    """
+    Open a writable text stream for the given path or file object, optionally compressed.
+
+    :return: A (stream, should_close) tuple.
+    """
+    if not isinstance(target, _STRING_TYPES):
+        # Already a file-like object. We don't own it, so we won't close it either.
+        return target, False
+
+    if compression is None:
+        for extension, inferred_compression in _EXTENSIONS.items():
+            if target.endswith(extension):
+                compression = inferred_compression
+                break
+
+    if compression is None:
+        return io.open(target, 'w', encoding='utf-8', newline=''), True
+    if compression not in _COMPRESSORS:
+        raise ValueError("Unsupported compression \"{0}\". Use one of: {1}".format(
+            compression, ', '.join(_COMPRESSORS)))
+    raw_stream = _COMPRESSORS[compression](target, 'wb')
+    return io.TextIOWrapper(raw_stream, encoding='utf-8', newline=''), True
+
+
+def _flatten(row, prefix=''):
+    """
+    Flatten a nested row into a single level of dotted keys. Lists are kept as JSON strings, since CSV & columnar
+    formats have no good way to represent them.
+    """
+    flat = {}
+    for key, value in row.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, list):
+            flat[name] = json.dumps(value, sort_keys=True)
+        else:
+            flat[name] = value
+    return flat
+
+
+class DatasetWriter(object):
+    """
+    The interface of all row writers, and their context manager support. Writers are context managers, and must be
+    closed to flush their last batch. Subclasses implement:
+
+        write(row) -- Write a single row: a dictionary of native Python types. (See "core.unwrap")
+        close() -- Flush what's left, and close the output if the writer opened it.
+    """
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class JSONLinesWriter(DatasetWriter):
+    def __init__(self, target, compression=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Write rows as JSON Lines -- one JSON document per line.
+
+        :param target: A file path or a writable text stream.
+        :type target: str or file
+        :param compression: "gzip", "bz2" or None. Inferred from the file extension if not given.
+        :type compression: str
+        :param batch_size: How many rows to buffer before writing them out.
+        :type batch_size: int
+        """
+        self._stream, self._owns_stream = _open_text_target(target, compression)
+        self._batch_size = batch_size
+        self._pending = []
+
+    def write(self, row):
+        self._pending += [json.dumps(row, sort_keys=True)]
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) > 0:
+            self._stream.write(u'\n'.join(self._pending) + u'\n')
+            self._pending = []
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owns_stream:
+            self._stream.close()
+
+
+class CSVWriter(DatasetWriter):
+    def __init__(self, target, columns=None, compression=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Write rows as CSV. Nested fields are flattened into dotted column names (e.g. "summary.personaname") and
+        lists are written as JSON strings.
+
+        :param target: A file path or a writable text stream.
+        :type target: str or file
+        :param columns: The CSV columns. If not given, they're taken from the keys of the first batch of rows, and
+        keys which only show up later are dropped.
+        :type columns: list of str
+        :param compression: "gzip", "bz2" or None. Inferred from the file extension if not given.
+        :type compression: str
+        :param batch_size: How many rows to buffer before writing them out.
+        :type batch_size: int
+        """
+        self._stream, self._owns_stream = _open_text_target(target, compression)
+        self._columns = columns
+        self._batch_size = batch_size
+        self._pending = []
+        self._writer = None
+
+    def write(self, row):
+        self._pending += [_flatten(row)]
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        if self._writer is None:
+            if self._columns is None:
+                self._columns = sorted(set(itertools.chain.from_iterable(self._pending)))
+            self._writer = csv.DictWriter(self._stream, self._columns, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerows(self._pending)
+        self._pending = []
+        self._stream.flush()
+
+    def close(self):
+        self.flush()
+        if self._owns_stream:
+            self._stream.close()
+
+
+class ParquetWriter(DatasetWriter):
+    def __init__(self, path, compression='snappy', batch_size=10000, schema=None):
+        """
+        Write rows as a Parquet file, one row group per batch. Requires "pyarrow".
+
+        Rows are flattened the same way "CSVWriter" flattens them. A Parquet file has a single schema, set before the
+        first row group: unless "schema" is given, it's inferred from the first batch, and later batches are
+        converted to it. Like "CSVWriter", keys which only show up later are dropped, and missing ones are null.
+        Inferred types leave room for later rows: integer columns are stored as doubles (which hold any integer up
+        to 2 ** 53), so a field that's an integer early on and fractional later still fits -- except IDs (columns
+        whose names end with "id", like "steamid"), which stay 64-bit integers. Columns that are all-null in the first
+        batch are stored as strings.
+
+        :param path: The output file path.
+        :type path: str
+        :param compression: Any Parquet codec supported by pyarrow. ("snappy", "gzip", "zstd", etc.)
+        :type compression: str
+        :param batch_size: How many rows go into each row group.
+        :type batch_size: int
+        :param schema: The file's schema, with flattened column names.
+        :type schema: pyarrow.Schema
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output requires \"pyarrow\". Install it with \"pip install pyarrow\".")
+        self._pyarrow = pyarrow
+        self._parquet = pyarrow.parquet
+        self._path = path
+        self._compression = compression
+        self._batch_size = batch_size
+        self._pending = []
+        self._schema = schema
+        self._writer = None
+
+    def write(self, row):
+        self._pending += [_flatten(row)]
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+    def _infer_schema(self, rows):
+        pyarrow = self._pyarrow
+        fields = []
+        # Every row's keys, not just the first row's. (Unlike "Table.from_pylist")
+        for name in sorted(set(itertools.chain.from_iterable(rows))):
+            column_type = pyarrow.array([row.get(name) for row in rows]).type
+            if pyarrow.types.is_null(column_type):
+                column_type = pyarrow.string()
+            elif pyarrow.types.is_integer(column_type) and not name.lower().endswith("id"):
+                column_type = pyarrow.float64()
+            fields += [pyarrow.field(name, column_type)]
+        return pyarrow.schema(fields)
+
+    def _to_table(self, rows):
+        pyarrow = self._pyarrow
+        columns = []
+        for field in self._schema:
+            values = [row.get(field.name) for row in rows]
+            try:
+                column = pyarrow.array(values, type=field.type)
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                if pyarrow.types.is_string(field.type):
+                    # Anything fits in a string column, as JSON.
+                    column = pyarrow.array([value if value is None or isinstance(value, _STRING_TYPES)
+                                            else json.dumps(value) for value in values], type=field.type)
+                else:
+                    # E.g.: booleans into a double column.
+                    column = pyarrow.array(values).cast(field.type)
+            columns += [column]
+        return pyarrow.Table.from_arrays(columns, schema=self._schema)
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        if self._schema is None:
+            self._schema = self._infer_schema(self._pending)
+        if self._writer is None:
+            self._writer = self._parquet.ParquetWriter(self._path, self._schema, compression=self._compression)
+        self._writer.write_table(self._to_table(self._pending))
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _fetch_user_batch(steamids, fields):
+    """
+    Fetch the batchable user fields (summaries & bans) for a list of users, with a single call per field.
+
+    :rtype: list of dict
+    """
+    rows = [{'steamid': int(steamid)} for steamid in steamids]
+    steamid_list = [str(steamid) for steamid in steamids]
+
+    for field, command, version in (("summary", "GetPlayerSummaries", "v0002"),
+                                    ("bans", "GetPlayerBans", "v1")):
+        if field not in fields:
+            continue
+        response = APIConnection().call("ISteamUser", command, version, steamids=steamid_list)
+        by_id = {}
+        for player in response.players:
+            # Summaries name it "steamid", bans name it "SteamId".
+            by_id[int(getattr(player, 'steamid', None) or player.SteamId)] = unwrap(player)
+        for row in rows:
+            row[field] = by_id.get(row['steamid'], None)
+    return rows
+
+
+def _fetch_user_details(row, fields):
+    """
+    Fetch the per-user fields (badges, games & achievements) for a single row, in-place.
+
+    :rtype: dict
+    """
+    errors = {}
+    games = None
+    if "games" in fields or "achievements" in fields:
+        if ACCESS_DENIED_CACHE.check("IPlayerService.GetOwnedGames", row['steamid']) is not None:
+            response = None
+        else:
+            response = APIConnection().call("IPlayerService", "GetOwnedGames", "v1",
+                                            steamid=row['steamid'],
+                                            include_appinfo=True,
+                                            include_played_free_games=True)
+        if response is None or 'game_count' not in response:
+            # Private profile. (See "SteamUser.games")
+            errors['games'] = AccessException.__name__
+            if response is not None:
+                ACCESS_DENIED_CACHE.add("IPlayerService.GetOwnedGames", row['steamid'], AccessException.__name__)
+        else:
+            games = [unwrap(game) for game in getattr(response, 'games', [])]
+        if "games" in fields:
+            row['games'] = games
+
+    if "badges" in fields:
+        if ACCESS_DENIED_CACHE.check("IPlayerService.GetBadges", row['steamid']) is not None:
+            response = None
+        else:
+            response = APIConnection().call("IPlayerService", "GetBadges", "v1", steamid=row['steamid'])
+        if response is None or 'player_level' not in response:
+            # Private profiles get an empty response here too.
+            errors['badges'] = AccessException.__name__
+            row['badges'] = None
+            if response is not None:
+                ACCESS_DENIED_CACHE.add("IPlayerService.GetBadges", row['steamid'], AccessException.__name__)
+        else:
+            row['badges'] = unwrap(response)
+
+    if "achievements" in fields:
+        achievements = None
+        if games is not None:
+            achievements = {}
+            for game in games:
+                if game.get('playtime_forever', 0) == 0 or not game.get('has_community_visible_stats', False):
+                    # Never played, or has no stats to speak of.
+                    continue
+                try:
+                    response = APIConnection().call("ISteamUserStats", "GetPlayerAchievements", "v1",
+                                                    steamid=row['steamid'], appid=game['appid'])
+                except APIException:
+                    # Some apps advertise stats but don't have any achievements.
+                    continue
+                achievements[str(game['appid'])] = [achievement.apiname
+                                                    for achievement in getattr(response.playerstats,
+                                                                               'achievements', [])
+                                                    if achievement.achieved != 0]
+        row['achievements'] = achievements
+
+    if len(errors) > 0:
+        row['errors'] = errors
+    return row
+
+
+def iter_users(steamids, fields=("summary", "bans"), concurrency=4, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Lazily fetch dataset rows for a (possibly endless) iterable of users.
+
+    Summaries & bans are fetched in batches of "batch_size" users per call; badges, games & achievements are fetched
+    per-user.
+    Both stages run with up to "concurrency" requests in flight.
+
+    :param steamids: 64-bit Steam IDs.
+    :type steamids: iterable of int
+    :param fields: Which fields to fetch. Any of "summary", "bans", "badges", "games" and "achievements".
+    :type fields: tuple of str
+    :param concurrency: The maximum number of concurrent requests per stage.
+    :type concurrency: int
+    :param batch_size: How many users to fetch in each batched call.
+    :type batch_size: int
+    :return: An iterator of row dictionaries, in input order.
+    :rtype: iterator
+    """
+    for field in fields:
+        if field not in USER_FIELDS:
+            raise ValueError("Unknown field \"{0}\". Use any of: {1}".format(field, ', '.join(USER_FIELDS)))
+
+    def fetch_batch(batch):
+        return _fetch_user_batch(batch, fields)
+
+    def fetch_details(row):
+        return _fetch_user_details(row, fields)
+
+    def batch_rows():
+        for batch, rows, error in imap_bounded(fetch_batch, _batches(steamids, batch_size), concurrency):
+            if error is not None:
+                rows = [{'steamid': int(steamid), 'errors': {'batch': type(error).__name__}}
+                        for steamid in batch]
+            for row in rows:
+                yield row
+
+    if "badges" not in fields and "games" not in fields and "achievements" not in fields:
+        for row in batch_rows():
+            yield row
+        return
+
+    for row, detailed_row, error in imap_bounded(fetch_details, batch_rows(), concurrency):
+        if error is not None:
+            row.setdefault('errors', {})['details'] = type(error).__name__
+            detailed_row = row
+        yield detailed_row
+
+
+def iter_apps(appids, fields=APP_FIELDS, concurrency=4):
+    """
+    Lazily fetch dataset rows for an iterable of apps: their names and achievement definitions, including global
+    unlock percentages.
+
+    :param appids: App IDs.
+    :type appids: iterable of int
+    :param fields: Which fields to fetch. Any of "schema" and "global_percentages".
+    :type fields: tuple of str
+    :param concurrency: The maximum number of concurrent requests.
+    :type concurrency: int
+    :return: An iterator of row dictionaries, in input order.
+    :rtype: iterator
+    """
+    for field in fields:
+        if field not in APP_FIELDS:
+            raise ValueError("Unknown field \"{0}\". Use any of: {1}".format(field, ', '.join(APP_FIELDS)))
+
+    def fetch_app(appid):
+        row = {'appid': int(appid)}
+        if "schema" in fields:
+            game = APIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=appid).game
+            row['name'] = getattr(game, 'gameName', None)
+            if 'availableGameStats' in game:
+                row['achievements'] = unwrap(getattr(game.availableGameStats, 'achievements', []))
+            else:
+                row['achievements'] = []
+        if "global_percentages" in fields:
+            response = APIConnection().call("ISteamUserStats", "GetGlobalAchievementPercentagesForApp", "v0002",
+                                            gameid=appid)
+            row['global_percentages'] = {achievement.name: achievement.percent
+                                         for achievement in response.achievementpercentages.achievements}
+        return row
+
+    for appid, row, error in imap_bounded(fetch_app, appids, concurrency):
+        if error is not None:
+            row = {'appid': int(appid), 'errors': {'app': type(error).__name__}}
+        yield row
+
+
+def export_users(steamids, writer, **kwargs):
+    """
+    Stream user rows (see "iter_users") into a writer. Output starts flowing as soon as the first batch is done,
+    and memory use stays constant regardless of how many users are exported:
+
+        >>> with JSONLinesWriter("users.jsonl.gz") as writer:
+        ...     export_users(steamids, writer, fields=("summary", "bans", "games"), concurrency=8)
+
+    :param steamids: 64-bit Steam IDs.
+    :type steamids: iterable of int
+    :param writer: The destination.
+    :type writer: DatasetWriter
+    :param kwargs: Passed on to "iter_users".
+    :return: The number of rows written.
+    :rtype: int
+    """
+    count = 0
+    for row in iter_users(steamids, **kwargs):
+        writer.write(row)
+        count += 1
+    return count
+
+
+def export_apps(appids, writer, **kwargs):
+    """
+    Stream app rows (see "iter_apps") into a writer.
+
+    :param appids: App IDs.
+    :type appids: iterable of int
+    :param writer: The destination.
+    :type writer: DatasetWriter
+    :param kwargs: Passed on to "iter_apps".
+    :return: The number of rows written.
+    :rtype: int
+    """
+    count = 0
+    for row in iter_apps(appids, **kwargs):
+        writer.write(row)
+        count += 1
+    return count
@@ -0,0 +1,222 @@
+__author__ = 'SmileyBarry'
+
+import threading
+import time
+
+from .decorators import HOUR
+from .errors import APIConfigurationError, APIPrivate, APIRateLimited, APIUnauthorized
+from .workers import RateLimiter
+
+LEAST_LOADED = "least_loaded"
+ROUND_ROBIN = "round_robin"
+
+# The Steam Web API's default daily call limit per key.
+DEFAULT_DAILY_QUOTA = 100000
+DAY = 24 * HOUR
+
+# Endpoints that answer 401/403 for private profiles, whatever the key. Their authorization failures say nothing about
+# the key, so they don't count towards quarantining it.
+PROFILE_ENDPOINTS = frozenset(("IPlayerService.GetBadges", "IPlayerService.GetOwnedGames",
+                               "IPlayerService.GetRecentlyPlayedGames", "IPlayerService.GetSteamLevel",
+                               "IPlayerService.IsPlayingSharedGame", "ISteamUser.GetFriendList",
+                               "ISteamUser.GetUserGroupList", "ISteamUserStats.GetPlayerAchievements",
+                               "ISteamUserStats.GetUserStatsForGame"))
+
+
+class _KeyState(object):
+    def __init__(self, index, key, rate, burst):
+        self.index = index
+        self.key = key
+        self.limiter = RateLimiter(rate, burst) if rate is not None else None
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.day = None
+        self.used_today = 0
+        self.consecutive_auth_failures = 0
+        self.quarantined_until = 0.0
+        self.throttled_until = 0.0
+
+    def masked_key(self):
+        # The pool index keeps labels unique, even for keys that end the same.
+        return "{0}:...{1}".format(self.index, self.key[-4:])
+
+
+class APIKeyPool(object):
+    def __init__(self, keys, rate=None, burst=None, daily_quota=DEFAULT_DAILY_QUOTA, strategy=LEAST_LOADED,
+                 quarantine_after=10, quarantine_time=1 * HOUR, throttle_time=60):
+        """
+        A pool of Steam Web API keys, used in place of a single key to spread load over several keys' quotas. Pass it
+        anywhere a key is accepted:
+
+            >>> pool = APIKeyPool(["KEY1...", "KEY2...", "KEY3..."], rate=10)
+            >>> APIConnection(api_key=pool)
+
+        Every request takes a key from the pool, and reports back how it went. Keys that keep failing with
+        APIUnauthorized/APIPrivate (on endpoints that don't check profile privacy) are quarantined for a while, and
+        keys that get throttled (APIRateLimited) are rested for a short time. The pool is thread-safe.
+
+        :param keys: The API keys.
+        :type keys: list of str
+        :param rate: The maximum requests per second per key, or None for no limit.
+        :type rate: float
+        :param burst: How many requests each key may make at once before "rate" kicks in.
+        :type burst: float
+        :param daily_quota: The maximum requests per key per (UTC) day.
+        :type daily_quota: int
+        :param strategy: LEAST_LOADED to pick the key with the fewest requests in flight (then the fewest used
+        today), or ROUND_ROBIN to take turns.
+        :type strategy: str
+        :param quarantine_after: How many authorization failures in a row get a key quarantined. Failures from
+        PROFILE_ENDPOINTS, which private profiles cause, don't count.
+        :type quarantine_after: int
+        :param quarantine_time: How long a quarantined key is left alone, in seconds, before it's tried again.
+        :type quarantine_time: int or float
+        :param throttle_time: How long a throttled key is rested, in seconds.
+        :type throttle_time: int or float
+        """
+        if len(keys) == 0:
+            raise ValueError("An API key pool needs at least one key.")
+        if strategy not in (LEAST_LOADED, ROUND_ROBIN):
+            raise ValueError("\"strategy\" must be either LEAST_LOADED or ROUND_ROBIN.")
+        self.daily_quota = daily_quota
+        self.strategy = strategy
+        self.quarantine_after = quarantine_after
+        self.quarantine_time = quarantine_time
+        self.throttle_time = throttle_time
+        self._states = [_KeyState(index, key, rate, burst) for index, key in enumerate(keys)]
+        self._by_key = {state.key: state for state in self._states}
+        self._next_index = 0
+        self._lock = threading.Condition(threading.Lock())
+
+    def _is_usable(self, state, now, today):
+        if state.quarantined_until > now or state.throttled_until > now:
+            return False
+        if state.day == today and state.used_today >= self.daily_quota:
+            return False
+        return True
+
+    def _candidates(self, now, today):
+        usable = [state for state in self._states if self._is_usable(state, now, today)]
+        if self.strategy == ROUND_ROBIN:
+            count = len(self._states)
+            order = [self._states[(self._next_index + offset) % count] for offset in range(count)]
+            return [state for state in order if state in usable]
+        return sorted(usable, key=lambda state: (state.in_flight,
+                                                 state.used_today if state.day == today else 0))
+
+    def acquire(self, timeout=None):
+        """
+        Take a key for a single request. Waits if every key is currently rate-limited, throttled or quarantined.
+
+        :param timeout: The longest time to wait for a key, in seconds, or None to wait as long as necessary.
+        :type timeout: float
+        :return: An API key. Hand it back with "release" once the request is done.
+        :rtype: str
+        :raise: APIRateLimited if every key used up its daily quota, or is being throttled, or if "timeout" passed.
+        APIConfigurationError if every key is quarantined.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            while True:
+                now = time.time()
+                today = int(now // DAY)
+                candidates = self._candidates(now, today)
+                wait_time = None
+                if len(candidates) == 0:
+                    if all(state.quarantined_until > now for state in self._states):
+                        raise APIConfigurationError("Every API key in the pool has been quarantined.")
+                    # Throttled (and quarantined) keys come back in a while; keys out of quota don't until tomorrow.
+                    resting_until = [max(state.throttled_until, state.quarantined_until) for state in self._states
+                                     if self._is_usable(state, max(now, state.throttled_until, state.quarantined_until),
+                                                        today)]
+                    if len(resting_until) == 0:
+                        raise APIRateLimited("Every API key in the pool has used up its daily quota.")
+                    wait_time = min(resting_until) - now
+
+                for state in candidates:
+                    if state.limiter is None or state.limiter.try_acquire():
+                        if state.day != today:
+                            state.day = today
+                            state.used_today = 0
+                        state.in_flight += 1
+                        state.requests += 1
+                        state.used_today += 1
+                        self._next_index = (self._states.index(state) + 1) % len(self._states)
+                        return state.key
+                    key_wait_time = state.limiter.wait_time()
+                    if wait_time is None or key_wait_time < wait_time:
+                        wait_time = key_wait_time
+
+                if deadline is not None:
+                    if now + wait_time > deadline:
+                        raise APIRateLimited("Timed out waiting for an API key.")
+                # Also woken up early whenever a key is released.
+                self._lock.wait(max(wait_time, 0.001))
+
+    def release(self, key, error=None, endpoint=None):
+        """
+        Hand a key back after its request is done.
+
+        :param key: A key returned by "acquire".
+        :type key: str
+        :param error: The exception the request raised, if any.
+        :type error: Exception
+        :param endpoint: The request's "Interface.Command.Version" endpoint. Authorization failures from endpoints
+        that check the profile's privacy (see PROFILE_ENDPOINTS) don't count against the key.
+        :type endpoint: str
+        """
+        with self._lock:
+            state = self._by_key[key]
+            state.in_flight -= 1
+            now = time.time()
+            if error is None:
+                state.consecutive_auth_failures = 0
+            else:
+                state.errors += 1
+                if isinstance(error, (APIUnauthorized, APIPrivate)) and not self._is_profile_endpoint(endpoint):
+                    state.consecutive_auth_failures += 1
+                    if state.consecutive_auth_failures >= self.quarantine_after:
+                        state.quarantined_until = now + self.quarantine_time
+                        state.consecutive_auth_failures = 0
+                elif isinstance(error, APIRateLimited):
+                    state.throttled_until = now + self.throttle_time
+            self._lock.notify()
+
+    @staticmethod
+    def _is_profile_endpoint(endpoint):
+        return endpoint is not None and endpoint.rsplit('.', 1)[0] in PROFILE_ENDPOINTS
+
+    def stats(self):
+        """
+        :return: Per-key statistics, keyed by each key's index in the pool and its last four characters. (E.g.:
+        "0:...ABCD")
+        :rtype: dict
+        """
+        with self._lock:
+            now = time.time()
+            today = int(now // DAY)
+            stats = {}
+            for state in self._states:
+                if state.quarantined_until > now:
+                    status = "quarantined"
+                elif state.throttled_until > now:
+                    status = "throttled"
+                elif state.day == today and state.used_today >= self.daily_quota:
+                    status = "exhausted"
+                else:
+                    status = "ok"
+                stats[state.masked_key()] = {'status': status,
+                                             'requests': state.requests,
+                                             'errors': state.errors,
+                                             'in_flight': state.in_flight,
+                                             'used_today': state.used_today if state.day == today else 0,
+                                             'quota_remaining': self.daily_quota - (state.used_today
+                                                                                    if state.day == today else 0)}
+            return stats
+
+    def __len__(self):
+        return len(self._states)
+
+    def __repr__(self):
+        return "<{cls} ({count} keys)>".format(cls=self.__class__.__name__, count=len(self._states))
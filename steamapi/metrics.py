@@ -0,0 +1,230 @@
+__author__ = 'SmileyBarry'
+
+import threading
+
+# Checked on every request & cached property access, so keep it a plain module attribute. Use "enable()" and
+# "disable()" rather than setting it directly.
+enabled = False
+
+# Request latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CACHE_HIT = "hits"
+CACHE_MISS = "misses"
+CACHE_EXPIRED = "expirations"
+# An expired value served while it's refreshed in the background. (See "decorators.RefreshPolicy")
+CACHE_STALE = "stale_hits"
+
+
+class Histogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        A cumulative histogram, in the style of Prometheus: each bucket counts the observations less than or equal to
+        its upper bound.
+
+        :param buckets: Ascending bucket upper bounds. An implicit "+Inf" bucket is always added.
+        :type buckets: tuple of float
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                return
+        self.counts[-1] += 1
+
+    def cumulative_counts(self):
+        """
+        :return: (upper bound, cumulative count) pairs, ending with ("+Inf", total count).
+        :rtype: list of tuple
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            pairs += [(bound, total)]
+        return pairs
+
+    def to_dict(self):
+        return {'buckets': [[bound, count] for bound, count in self.cumulative_counts()],
+                'sum': self.sum,
+                'count': self.count}
+
+
+class _EndpointStats(object):
+    def __init__(self):
+        self.latency = Histogram()
+        self.response_bytes = 0
+        self.statuses = {}
+        self.errors = {}
+
+    def to_dict(self):
+        return {'requests': self.latency.count,
+                'latency': self.latency.to_dict(),
+                'response_bytes': self.response_bytes,
+                'statuses': dict(self.statuses),
+                'errors': dict(self.errors)}
+
+
+class MetricsRegistry(object):
+    """
+    Thread-safe storage for all recorded metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._properties = {}
+
+    def record_request(self, endpoint, status, elapsed, response_bytes, error=None):
+        """
+        :param endpoint: The API endpoint, as "Interface.Command.Version".
+        :type endpoint: str
+        :param status: The HTTP status code, or None if no response was received at all.
+        :type status: int or None
+        :param elapsed: The request's duration, in seconds.
+        :type elapsed: float
+        :param response_bytes: The response body's size.
+        :type response_bytes: int
+        :param error: The name of the exception class raised for this request, if any. (E.g.: "APIPrivate")
+        :type error: str or None
+        """
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = _EndpointStats()
+            stats.latency.observe(elapsed)
+            stats.response_bytes += response_bytes
+            status_name = str(status) if status is not None else "none"
+            stats.statuses[status_name] = stats.statuses.get(status_name, 0) + 1
+            if error is not None:
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def record_cache(self, property_name, event):
+        """
+        :param property_name: The cached property, as "Class.property".
+        :type property_name: str
+        :param event: CACHE_HIT, CACHE_MISS, CACHE_EXPIRED or CACHE_STALE.
+        :type event: str
+        """
+        with self._lock:
+            stats = self._properties.get(property_name)
+            if stats is None:
+                stats = {CACHE_HIT: 0, CACHE_MISS: 0, CACHE_EXPIRED: 0, CACHE_STALE: 0}
+                self._properties[property_name] = stats
+            stats[event] += 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._properties = {}
+
+    def snapshot(self):
+        """
+        :return: A point-in-time copy of all metrics, made of plain dictionaries. (JSON-serializable)
+        :rtype: dict
+        """
+        with self._lock:
+            endpoints = {endpoint: stats.to_dict() for endpoint, stats in self._endpoints.items()}
+            properties = {}
+            for property_name, stats in self._properties.items():
+                lookups = stats[CACHE_HIT] + stats[CACHE_MISS] + stats[CACHE_EXPIRED] + stats[CACHE_STALE]
+                properties[property_name] = dict(stats)
+                # Stale hits didn't wait for the API either.
+                hits = stats[CACHE_HIT] + stats[CACHE_STALE]
+                properties[property_name]['hit_ratio'] = float(hits) / lookups if lookups else 0.0
+        return {'endpoints': endpoints, 'cached_properties': properties}
+
+    def to_prometheus(self, prefix="steamapi"):
+        """
+        Render all metrics in Prometheus' text exposition format.
+
+        :param prefix: The metric name prefix.
+        :type prefix: str
+        :rtype: str
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, metric_type, description):
+            lines.extend(["# HELP {0}_{1} {2}".format(prefix, name, description),
+                          "# TYPE {0}_{1} {2}".format(prefix, name, metric_type)])
+
+        def sample(name, labels, value):
+            label_text = ','.join('{0}="{1}"'.format(key, _escape_label(label_value))
+                                  for key, label_value in labels)
+            lines.append("{0}_{1}{{{2}}} {3}".format(prefix, name, label_text, value))
+
+        endpoints = sorted(snapshot['endpoints'].items())
+        metric("requests_total", "counter", "API requests, by endpoint & HTTP status.")
+        for endpoint, stats in endpoints:
+            for status, count in sorted(stats['statuses'].items()):
+                sample("requests_total", [("endpoint", endpoint), ("status", status)], count)
+
+        metric("request_errors_total", "counter", "API requests that raised an exception, by exception class.")
+        for endpoint, stats in endpoints:
+            for error, count in sorted(stats['errors'].items()):
+                sample("request_errors_total", [("endpoint", endpoint), ("error", error)], count)
+
+        metric("request_duration_seconds", "histogram", "API request latency.")
+        for endpoint, stats in endpoints:
+            for bound, count in stats['latency']['buckets']:
+                sample("request_duration_seconds_bucket", [("endpoint", endpoint), ("le", bound)], count)
+            sample("request_duration_seconds_sum", [("endpoint", endpoint)], stats['latency']['sum'])
+            sample("request_duration_seconds_count", [("endpoint", endpoint)], stats['latency']['count'])
+
+        metric("response_bytes_total", "counter", "API response body bytes received.")
+        for endpoint, stats in endpoints:
+            sample("response_bytes_total", [("endpoint", endpoint)], stats['response_bytes'])
+
+        metric("cache_events_total", "counter", "Cached property lookups, by outcome.")
+        for property_name, stats in sorted(snapshot['cached_properties'].items()):
+            for event in (CACHE_HIT, CACHE_MISS, CACHE_EXPIRED, CACHE_STALE):
+                sample("cache_events_total", [("property", property_name), ("event", event)], stats[event])
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = MetricsRegistry()
+
+
+def enable():
+    """
+    Start recording metrics. While disabled (the default), the only cost is a flag check per request & per cached
+    property access.
+    """
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def snapshot():
+    """
+    :rtype: dict
+    """
+    return REGISTRY.snapshot()
+
+
+def to_prometheus(prefix="steamapi"):
+    """
+    :rtype: str
+    """
+    return REGISTRY.to_prometheus(prefix)
+
+
+def reset():
+    REGISTRY.reset()
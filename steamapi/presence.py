@@ -0,0 +1,362 @@
+__author__ = 'SmileyBarry'
+
+import heapq
+import threading
+import time
+
+from .consts import OnlineState
+from .core import APIConnection
+from .decorators import MINUTE, HOUR
+from .workers import RateLimiter, imap_bounded
+
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
+# Event kinds.
+CAME_ONLINE = "came_online"
+WENT_OFFLINE = "went_offline"
+STATE_CHANGED = "state_changed"
+STARTED_PLAYING = "started_playing"
+STOPPED_PLAYING = "stopped_playing"
+
+# "GetPlayerSummaries" accepts up to a hundred IDs per call.
+SUMMARIES_PER_CALL = 100
+
+_STOPPED = object()
+
+
+class PresenceEvent(object):
+    __slots__ = ('steamid', 'kind', 'old', 'new', 'timestamp')
+
+    def __init__(self, steamid, kind, old, new, timestamp):
+        """
+        A change in a watched user's presence.
+
+        :type steamid: int
+        :param kind: CAME_ONLINE, WENT_OFFLINE, STATE_CHANGED, STARTED_PLAYING or STOPPED_PLAYING.
+        :type kind: str
+        :param old: The previous OnlineState, or app ID for STARTED_PLAYING/STOPPED_PLAYING. (None if there wasn't one)
+        :param new: The current OnlineState, or app ID.
+        :param timestamp: When the change was noticed.
+        :type timestamp: float
+        """
+        self.steamid = steamid
+        self.kind = kind
+        self.old = old
+        self.new = new
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return "<{cls} {steamid} {kind} {old} -> {new}>".format(cls=self.__class__.__name__, steamid=self.steamid,
+                                                                kind=self.kind, old=self.old, new=self.new)
+
+
+class _WatchedUser(object):
+    __slots__ = ('steamid', 'state', 'appid', 'last_logoff', 'due', 'seen')
+
+    def __init__(self, steamid, due):
+        self.steamid = steamid
+        self.state = None
+        self.appid = None
+        self.last_logoff = None
+        self.due = due
+        self.seen = False
+
+
+class PresenceWatcher(object):
+    def __init__(self, steamids=(), callback=None, request_budget=60, online_interval=1 * MINUTE,
+                 offline_interval=10 * MINUTE, long_offline_interval=1 * HOUR, long_offline_after=24 * HOUR,
+                 concurrency=4):
+        """
+        Watch the presence (online state & current game) of many users, with batched "GetPlayerSummaries" calls of up
+        to a hundred users each. How often a user is polled adapts to what they're doing: online users every
+        "online_interval", offline users every "offline_interval", and users who have been offline for longer than
+        "long_offline_after" only every "long_offline_interval".
+
+        The first poll of a user only records their presence; events are emitted for changes after that. Unlike
+        "SteamUser.currently_playing", shared games' owners aren't looked up, as that takes a call per user.
+
+        Poll in the calling thread with "poll_once" or "events()", or in the background with "start()", receiving
+        events through "callback" or, without one, by iterating the watcher (also with "async for", on Python 3.5+):
+
+            >>> watcher = PresenceWatcher(steamids, request_budget=120)
+            >>> watcher.start()
+            >>> for event in watcher:
+            ...     if event.kind == STARTED_PLAYING:
+            ...         print(event.steamid, "started playing", event.new)
+
+        :param steamids: The users to watch. More can be added later, with "add".
+        :type steamids: iterable of int
+        :param callback: Called with each PresenceEvent, from the polling thread.
+        :param request_budget: The maximum number of requests per minute. When more users are due than the budget
+        allows, the longest-overdue ones go first and the rest wait.
+        :type request_budget: float
+        :param online_interval: Seconds between polls of an online user.
+        :param offline_interval: Seconds between polls of a recently-offline user.
+        :param long_offline_interval: Seconds between polls of a long-offline user.
+        :param long_offline_after: Seconds since a user's last logoff after which they count as long-offline.
+        :param concurrency: The maximum number of requests in flight.
+        :type concurrency: int
+        """
+        self.callback = callback
+        self.online_interval = online_interval
+        self.offline_interval = offline_interval
+        self.long_offline_interval = long_offline_interval
+        self.long_offline_after = long_offline_after
+        self.concurrency = concurrency
+        self._budget = RateLimiter(request_budget / 60.0, burst=max(concurrency, 1))
+        self._lock = threading.Lock()
+        self._users = {}
+        self._schedule = []
+        self._events = queue.Queue()
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats = {'polls': 0, 'requests': 0, 'failed_requests': 0, 'events': 0}
+        self.add(steamids)
+
+    def add(self, steamids):
+        """
+        Start watching more users. They're polled right away.
+
+        :type steamids: iterable of int
+        """
+        now = time.time()
+        with self._lock:
+            for steamid in steamids:
+                steamid = int(steamid)
+                if steamid not in self._users:
+                    self._users[steamid] = _WatchedUser(steamid, now)
+                    heapq.heappush(self._schedule, (now, steamid))
+
+    def remove(self, steamids):
+        """
+        :type steamids: iterable of int
+        """
+        with self._lock:
+            for steamid in steamids:
+                # Its schedule entry is dropped when it comes up.
+                self._users.pop(int(steamid), None)
+
+    def _interval(self, user, now):
+        if user.state is None:
+            # Not returned by the API. (Deleted or invalid IDs)
+            return self.long_offline_interval
+        if user.state != OnlineState.OFFLINE or user.appid is not None:
+            return self.online_interval
+        if user.last_logoff is not None and now - user.last_logoff > self.long_offline_after:
+            return self.long_offline_interval
+        return self.offline_interval
+
+    def _take_due(self, now):
+        """
+        Pop due users off the schedule, as many as the request budget allows right now.
+
+        :rtype: list of list of int
+        """
+        batches = []
+        with self._lock:
+            while len(self._schedule) > 0 and self._schedule[0][0] <= now:
+                if not self._budget.try_acquire():
+                    break
+                batch = []
+                while len(batch) < SUMMARIES_PER_CALL and len(self._schedule) > 0 and self._schedule[0][0] <= now:
+                    due, steamid = heapq.heappop(self._schedule)
+                    user = self._users.get(steamid)
+                    if user is not None and user.due == due:
+                        batch += [steamid]
+                if len(batch) > 0:
+                    batches += [batch]
+        return batches
+
+    def _reschedule(self, user, due):
+        user.due = due
+        heapq.heappush(self._schedule, (due, user.steamid))
+
+    def _observe(self, user, player, now):
+        """
+        Update a user's presence from their summary, and return the resulting events.
+        """
+        if player is None:
+            if user.seen and user.state is not None:
+                # Left out of this response, but known to exist: nothing to tell, so keep what we last saw.
+                return []
+            # Never returned by the API. (Deleted or invalid IDs)
+            state, appid, last_logoff = None, None, None
+        else:
+            state = getattr(player, 'personastate', OnlineState.OFFLINE)
+            appid = int(player.gameid) if 'gameid' in player else None
+            last_logoff = getattr(player, 'lastlogoff', None)
+        events = []
+        if user.seen:
+            if user.state != state:
+                if user.state == OnlineState.OFFLINE:
+                    kind = CAME_ONLINE
+                elif state == OnlineState.OFFLINE:
+                    kind = WENT_OFFLINE
+                else:
+                    kind = STATE_CHANGED
+                events += [PresenceEvent(user.steamid, kind, user.state, state, now)]
+            if user.appid != appid:
+                if user.appid is not None:
+                    events += [PresenceEvent(user.steamid, STOPPED_PLAYING, user.appid, None, now)]
+                if appid is not None:
+                    events += [PresenceEvent(user.steamid, STARTED_PLAYING, None, appid, now)]
+        user.seen = True
+        user.state, user.appid, user.last_logoff = state, appid, last_logoff
+        return events
+
+    def poll_once(self):
+        """
+        Poll every user that's due, within the request budget, and emit the resulting events.
+
+        :return: The events, also passed to "callback" and the iterator.
+        :rtype: list of PresenceEvent
+        """
+        now = time.time()
+        batches = self._take_due(now)
+        if len(batches) == 0:
+            return []
+
+        def fetch(batch):
+            return APIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002",
+                                        steamids=[str(steamid) for steamid in batch]).players
+
+        events = []
+        for batch, players, error in imap_bounded(fetch, batches, self.concurrency):
+            now = time.time()
+            with self._lock:
+                self._stats['requests'] += 1
+                if error is not None:
+                    self._stats['failed_requests'] += 1
+                    # Try again later, without giving up their place by too much.
+                    for steamid in batch:
+                        user = self._users.get(steamid)
+                        if user is not None:
+                            self._reschedule(user, now + self.online_interval)
+                    continue
+                by_id = {int(player.steamid): player for player in players}
+                for steamid in batch:
+                    user = self._users.get(steamid)
+                    if user is None:
+                        continue
+                    events += self._observe(user, by_id.get(steamid), now)
+                    self._reschedule(user, now + self._interval(user, now))
+        with self._lock:
+            self._stats['polls'] += 1
+            self._stats['events'] += len(events)
+
+        for event in events:
+            if self.callback is not None:
+                self.callback(event)
+            elif self._thread is not None:
+                self._events.put(event)
+        return events
+
+    def next_due(self):
+        """
+        :return: How long, in seconds, until polling can make progress again. (Either a user is due or the budget
+        allows another request, whichever comes last)
+        :rtype: float
+        """
+        with self._lock:
+            if len(self._schedule) == 0:
+                return self.long_offline_interval
+            until_due = self._schedule[0][0] - time.time()
+        return max(until_due, self._budget.wait_time(), 0.0)
+
+    def run(self):
+        """
+        Poll until "stop()" is called.
+        """
+        while not self._stopping.is_set():
+            self.poll_once()
+            self._stopping.wait(self.next_due())
+
+    def events(self):
+        """
+        Poll in the calling thread, forever, yielding events as they come.
+
+        :rtype: iterator of PresenceEvent
+        """
+        while not self._stopping.is_set():
+            for event in self.poll_once():
+                yield event
+            self._stopping.wait(self.next_due())
+
+    def start(self):
+        """
+        Poll in a background thread. Events go to "callback" if there is one, or to the watcher's iterator if not.
+        """
+        if self._thread is not None:
+            raise RuntimeError("This watcher is already running.")
+        self._stopping.clear()
+        # A fresh queue, without the last "stop()"'s end marker in it.
+        self._events = queue.Queue()
+        self._thread = threading.Thread(target=self.run, name="PresenceWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background thread, and end any iteration over the watcher.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._events.put(_STOPPED)
+
+    def _next_event(self):
+        event = self._events.get()
+        if event is _STOPPED:
+            # Leave it there for any other consumer.
+            self._events.put(_STOPPED)
+            return None
+        return event
+
+    def __iter__(self):
+        """
+        Iterate the events emitted by the background thread, until "stop()" is called.
+        """
+        while True:
+            event = self._next_event()
+            if event is None:
+                return
+            yield event
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        # Wait for the next event in the event loop's default executor, so no "async" syntax (and no Python 3.5) is
+        # needed to define this.
+        import asyncio
+
+        def next_event():
+            event = self._next_event()
+            if event is None:
+                raise StopAsyncIteration
+            return event
+
+        return asyncio.get_event_loop().run_in_executor(None, next_event)
+
+    def stats(self):
+        """
+        :return: Counts of polls, requests, failed requests & events, plus how many users are watched and overdue.
+        :rtype: dict
+        """
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            stats['users'] = len(self._users)
+            stats['overdue'] = sum(1 for user in self._users.values() if user.due <= now)
+        return stats
+
+    def __len__(self):
+        return len(self._users)
+
+    def __repr__(self):
+        return "<{cls} ({count} users)>".format(cls=self.__class__.__name__, count=len(self._users))
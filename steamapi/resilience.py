@@ -0,0 +1,383 @@
+__author__ = 'SmileyBarry'
+
+import threading
+import time
+
+from .errors import APICircuitOpen, APIError
+from . import scheduler, tracing
+
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
+# Circuit breaker states.
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Only GET requests are hedged: sending a POST twice could do whatever it does twice.
+HEDGED_METHODS = ("GET",)
+
+
+def _is_failure(error):
+    # Server-side trouble, or no response at all. A 4xx is a perfectly good answer from an endpoint that works.
+    return isinstance(error, (APIError, IOError)) and not isinstance(error, APICircuitOpen)
+
+
+class CircuitBreaker(object):
+    def __init__(self, endpoint, failure_threshold=5, reset_timeout=30.0):
+        """
+        Fail calls to an endpoint fast while it's failing. After "failure_threshold" failures in a row (APIError,
+        including throttling, or no response at all) the circuit opens, and calls raise APICircuitOpen right away
+        instead of tying up a thread waiting on a server that's down. Once "reset_timeout" seconds have passed, a
+        single trial call is let through (half-open): it closes the circuit if it succeeds, or opens it again if not.
+
+        :param endpoint: The endpoint's "Interface.Command.Version" name.
+        :type endpoint: str
+        :param failure_threshold: How many failures in a row open the circuit.
+        :type failure_threshold: int
+        :param reset_timeout: How long the circuit stays open, in seconds, before a trial call.
+        :type reset_timeout: float
+        """
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+        # When the circuit opened, or when its last trial call went out.
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Raise APICircuitOpen, unless a call may go through now.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.time()
+            # A trial that never reported back (e.g.: interrupted) doesn't keep the circuit shut for good: another
+            # one goes out after the same timeout.
+            if now - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._opened_at = now
+                return
+            self.rejected += 1
+            retry_in = self.reset_timeout - (now - self._opened_at)
+        raise APICircuitOpen("Calls to {0} keep failing. Not sending any for another {1:.1f} seconds.".format(
+            self.endpoint, retry_in))
+
+    def record(self, error=None):
+        """
+        Report how a call that was allowed went.
+
+        :param error: The exception it raised, if any.
+        :type error: Exception or None
+        """
+        with self._lock:
+            if error is None or not _is_failure(error):
+                self.failures = 0
+                self.state = CLOSED
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                if self.state == CLOSED:
+                    self.times_opened += 1
+                self.state = OPEN
+                self._opened_at = time.time()
+
+    def __repr__(self):
+        return "<{cls} {endpoint} ({state})>".format(cls=self.__class__.__name__, endpoint=self.endpoint,
+                                                     state=self.state)
+
+
+class _LatencyWindow(object):
+    # Re-sort the window for a fresh percentile after this many new samples, rather than on every request.
+    REFRESH_EVERY = 16
+
+    def __init__(self, size):
+        self.size = size
+        self.samples = []
+        self._next_index = 0
+        self._new_samples = 0
+        self._percentiles = {}
+
+    def add(self, elapsed):
+        if len(self.samples) < self.size:
+            self.samples.append(elapsed)
+        else:
+            self.samples[self._next_index] = elapsed
+            self._next_index = (self._next_index + 1) % self.size
+        self._new_samples += 1
+
+    def percentile(self, percentile):
+        if self._new_samples >= self.REFRESH_EVERY or percentile not in self._percentiles:
+            ordered = sorted(self.samples)
+            self._percentiles = {}
+            self._new_samples = 0
+            self._percentiles[percentile] = ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100.0))]
+        return self._percentiles[percentile]
+
+
+class _EndpointState(object):
+    def __init__(self, endpoint, policy):
+        self.breaker = CircuitBreaker(endpoint, policy.failure_threshold, policy.reset_timeout)
+        self.latencies = _LatencyWindow(policy.window)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.lock = threading.Lock()
+
+    def observe(self, elapsed):
+        with self.lock:
+            self.latencies.add(elapsed)
+
+
+class _AttemptPool(object):
+    # Threads idle for this long, in seconds, exit.
+    IDLE_TIMEOUT = 60.0
+
+    def __init__(self):
+        """
+        Daemon threads that send hedged requests' attempts, reused from one request to the next rather than started
+        for each. Grows whenever every thread is busy, and shrinks back as threads go idle.
+        """
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        # Threads waiting for a task that no "submit" has claimed yet.
+        self._idle = 0
+        self.threads = 0
+
+    def submit(self, func, *args):
+        with self._lock:
+            if self._idle > 0:
+                self._idle -= 1
+                start_thread = False
+            else:
+                self.threads += 1
+                start_thread = True
+        self._tasks.put((func, args))
+        if start_thread:
+            thread = threading.Thread(target=self._work, name="HedgedRequest")
+            thread.daemon = True
+            thread.start()
+
+    def _work(self):
+        while True:
+            try:
+                func, args = self._tasks.get(timeout=self.IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._lock:
+                    # With no unclaimed idle threads, a "submit" claimed this one, and its task is on the way.
+                    if self._idle > 0:
+                        self._idle -= 1
+                        self.threads -= 1
+                        return
+                continue
+            try:
+                func(*args)
+            finally:
+                with self._lock:
+                    self._idle += 1
+
+
+class ResiliencePolicy(object):
+    def __init__(self, hedge=True, hedge_percentile=95, min_hedge_delay=0.05, max_hedge_ratio=0.1, min_samples=20,
+                 window=200, failure_threshold=5, reset_timeout=30.0):
+        """
+        Keep the slowest and the failing requests from dominating: hedge slow GET requests, and fail calls to
+        failing endpoints fast. Install it with "core.set_resilience":
+
+            >>> core.set_resilience(resilience.ResiliencePolicy())
+
+        Hedging: once a GET request to an endpoint has taken longer than most of that endpoint's recent requests
+        (its "hedge_percentile"-th latency percentile), an identical request is sent alongside it, and whichever
+        answers first is used. A slow request is usually slow for reasons of its own (a busy server, a lost packet),
+        so the duplicate usually answers well before it. Hedges go through the scheduler and key pool like any
+        other request, and are capped at "max_hedge_ratio" of each endpoint's requests, so a slow API as a whole
+        doesn't get twice the load. The losing attempt can't be cancelled: it runs to completion in the background,
+        holding its scheduler slot and pooled key until then. The same cap bounds how many of those there are.
+
+        Circuit breaking: every endpoint gets a CircuitBreaker, so calls to an endpoint that keeps failing raise
+        APICircuitOpen instead of waiting on it.
+
+        :param hedge: Whether to hedge GET requests at all. (Circuit breakers apply either way)
+        :type hedge: bool
+        :param hedge_percentile: Hedge requests slower than this percentile of the endpoint's recent latencies.
+        :type hedge_percentile: float
+        :param min_hedge_delay: Never hedge requests sooner than this, in seconds.
+        :type min_hedge_delay: float
+        :param max_hedge_ratio: The most hedges per request sent, per endpoint.
+        :type max_hedge_ratio: float
+        :param min_samples: How many latencies an endpoint needs on record before its requests are hedged.
+        :type min_samples: int
+        :param window: How many recent latencies per endpoint the percentile is taken over.
+        :type window: int
+        :param failure_threshold: How many failures in a row open an endpoint's circuit.
+        :type failure_threshold: int
+        :param reset_timeout: How long a circuit stays open, in seconds.
+        :type reset_timeout: float
+        """
+        if not 0 < hedge_percentile < 100:
+            raise ValueError("\"hedge_percentile\" must be between 0 and 100.")
+        if min_samples < 1 or window < min_samples:
+            raise ValueError("\"window\" must hold at least \"min_samples\" latencies, and at least one.")
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._endpoints = {}
+        self._lock = threading.Lock()
+        self._pool = _AttemptPool()
+
+    def _state(self, endpoint):
+        state = self._endpoints.get(endpoint)
+        if state is None:
+            with self._lock:
+                state = self._endpoints.get(endpoint)
+                if state is None:
+                    state = self._endpoints[endpoint] = _EndpointState(endpoint, self)
+        return state
+
+    def breaker(self, endpoint):
+        """
+        :param endpoint: The endpoint's "Interface.Command.Version" name.
+        :type endpoint: str
+        :rtype: CircuitBreaker
+        """
+        return self._state(endpoint).breaker
+
+    def _hedge_delay(self, state):
+        """
+        :return: How long to wait for a response before hedging, or None not to hedge.
+        """
+        with state.lock:
+            if len(state.latencies.samples) < self.min_samples:
+                return None
+            return max(self.min_hedge_delay, state.latencies.percentile(self.hedge_percentile))
+
+    def _take_hedge(self, state):
+        with state.lock:
+            if state.hedged + 1 > state.requests * self.max_hedge_ratio:
+                return False
+            state.hedged += 1
+            return True
+
+    def send(self, send, method, query, params, endpoint):
+        """
+        Send a request with "send", hedging and circuit breaking as configured. (Called by "core._send")
+
+        :param send: Sends a single request: "send(method, query, params, endpoint)".
+        :type send: callable
+        :type params: dict
+        :param endpoint: The endpoint's "Interface.Command.Version" name.
+        :type endpoint: str
+        :rtype: requests.Response
+        """
+        state = self._state(endpoint)
+        state.breaker.allow()
+        with state.lock:
+            state.requests += 1
+        try:
+            delay = self._hedge_delay(state) if self.hedge is True and method in HEDGED_METHODS else None
+            if delay is None:
+                start = time.time()
+                try:
+                    response = send(method, query, params, endpoint)
+                except Exception as ex:
+                    if not _is_failure(ex):
+                        state.observe(time.time() - start)
+                    raise
+                state.observe(time.time() - start)
+            else:
+                response = self._send_hedged(state, delay, send, method, query, params, endpoint)
+        except Exception as ex:
+            state.breaker.record(ex)
+            raise
+        state.breaker.record()
+        return response
+
+    def _send_hedged(self, state, delay, send, method, query, params, endpoint):
+        outcomes = queue.Queue()
+        parent_span = tracing.current_span()
+        priority_class = scheduler.current_priority()
+
+        def attempt(is_hedge):
+            start = time.time()
+            with tracing.attach(parent_span), scheduler.priority(priority_class):
+                try:
+                    # Each attempt gets its own copy: a key pool fills in "key" per request.
+                    response = send(method, query, dict(params), endpoint)
+                except Exception as ex:
+                    if not _is_failure(ex):
+                        state.observe(time.time() - start)
+                    outcomes.put((is_hedge, None, ex))
+                    return
+            # Every attempt's latency counts, including the losers': leaving out the slow ones would pull the
+            # percentile (and the hedge delay) down, and hedge more and more requests.
+            state.observe(time.time() - start)
+            outcomes.put((is_hedge, response, None))
+
+        # The caller waits for whichever attempt answers first, so even the first one runs on a (reused) pool thread.
+        self._pool.submit(attempt, False)
+        attempts = 1
+        try:
+            outcome = outcomes.get(timeout=delay)
+        except queue.Empty:
+            if self._take_hedge(state):
+                self._pool.submit(attempt, True)
+                attempts = 2
+            outcome = outcomes.get()
+
+        # The first response wins. A failure only loses to an attempt still in flight; a 4xx is a response.
+        first_error = None
+        while True:
+            is_hedge, response, error = outcome
+            attempts -= 1
+            if error is None:
+                if is_hedge is True:
+                    with state.lock:
+                        state.hedge_wins += 1
+                return response
+            if not _is_failure(error):
+                raise error
+            if first_error is None:
+                first_error = error
+            if attempts == 0:
+                raise first_error
+            outcome = outcomes.get()
+
+    def stats(self):
+        """
+        :return: {endpoint: its circuit's state & how often it opened and rejected calls, the requests sent, how many
+        were hedged & how many hedges answered first, and the current hedge delay in seconds (None until there are
+        enough samples)}
+        :rtype: dict
+        """
+        with self._lock:
+            states = dict(self._endpoints)
+        stats = {}
+        for endpoint, state in states.items():
+            with state.lock:
+                hedge_delay = None
+                if len(state.latencies.samples) >= self.min_samples:
+                    hedge_delay = max(self.min_hedge_delay, state.latencies.percentile(self.hedge_percentile))
+                stats[endpoint] = {'state': state.breaker.state,
+                                   'times_opened': state.breaker.times_opened,
+                                   'rejected': state.breaker.rejected,
+                                   'requests': state.requests,
+                                   'hedged': state.hedged,
+                                   'hedge_wins': state.hedge_wins,
+                                   'hedge_delay': hedge_delay}
+        return stats
+
+    def __repr__(self):
+        return "<{cls} ({endpoints} endpoints)>".format(cls=self.__class__.__name__, endpoints=len(self._endpoints))
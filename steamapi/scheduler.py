@@ -0,0 +1,226 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import threading
+import time
+
+# Priority classes.
+INTERACTIVE = "interactive"
+NORMAL = "normal"
+BATCH = "batch"
+
+# Under contention, each class gets this share of the requests sent. A class with nothing waiting doesn't use its
+# share; the others split it.
+DEFAULT_SHARES = {INTERACTIVE: 6, NORMAL: 3, BATCH: 1}
+
+_local = threading.local()
+
+
+class priority(object):
+    def __init__(self, priority_class):
+        """
+        Tag every API call made in this block (and in "workers.imap_bounded" workers started from it) with a priority
+        class:
+
+            >>> with scheduler.priority(scheduler.BATCH):
+            ...     export.export_users(steamids, writer)
+
+        Only has an effect while a scheduler is installed. (See "core.set_scheduler")
+
+        :param priority_class: INTERACTIVE, NORMAL, BATCH, or any class the scheduler was configured with. None
+        leaves the current one as-is.
+        :type priority_class: str
+        """
+        self._priority_class = priority_class
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'priority_class', None)
+        if self._priority_class is not None:
+            _local.priority_class = self._priority_class
+        return self._priority_class
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.priority_class = self._previous
+
+
+def current_priority():
+    """
+    :return: This thread's priority class, or None if it isn't in a "priority" block.
+    :rtype: str or None
+    """
+    return getattr(_local, 'priority_class', None)
+
+
+class _PriorityClass(object):
+    __slots__ = ('name', 'share', 'max_concurrency', 'waiting', 'in_flight', 'pass_value', 'requests', 'total_wait',
+                 'max_wait')
+
+    def __init__(self, name, share, max_concurrency):
+        self.name = name
+        self.share = float(share)
+        self.max_concurrency = max_concurrency
+        self.waiting = collections.deque()
+        self.in_flight = 0
+        # Stride scheduling: every request sent adds 1 / share, and the class with the lowest value goes next.
+        self.pass_value = 0.0
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class _Ticket(object):
+    __slots__ = ('queued_at', 'granted')
+
+    def __init__(self):
+        self.queued_at = time.time()
+        self.granted = threading.Event()
+
+
+class _Slot(object):
+    def __init__(self, scheduler, priority_class):
+        self._scheduler = scheduler
+        self._priority_class = priority_class
+
+    def __enter__(self):
+        self._scheduler._acquire(self._priority_class)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._scheduler._release(self._priority_class)
+
+
+class RequestScheduler(object):
+    def __init__(self, concurrency=8, rate=None, shares=None, max_concurrency=None, default=NORMAL):
+        """
+        Schedule every API request of the process by priority class, so interactive lookups don't queue behind
+        background crawls that share the same key and quota. Install it with "core.set_scheduler", and tag calls
+        with "priority":
+
+            >>> core.set_scheduler(scheduler.RequestScheduler(concurrency=8, rate=50))
+            >>> with scheduler.priority(scheduler.INTERACTIVE):
+            ...     profile = user.name, user.level
+
+        At most "concurrency" requests are in flight. When a slot frees up, the waiting class with the lowest
+        "pass" goes next (stride scheduling): under contention, each class gets its share of the requests, so a
+        high-priority request skips ahead of a long batch backlog, yet batch work keeps a share and never starves.
+        A class that was idle doesn't bank credit while idle.
+
+        :param concurrency: The maximum number of requests in flight, across all classes.
+        :type concurrency: int
+        :param rate: The maximum number of requests per second, across all classes -- the key's quota. Classes get
+        their shares of it the same way. (Default: unlimited)
+        :type rate: float
+        :param shares: {class: share}. (Default: DEFAULT_SHARES) Classes not listed here can't be used.
+        :type shares: dict
+        :param max_concurrency: {class: maximum requests in flight}, to always keep some slots free for the other
+        classes. (Default: BATCH may use three quarters of the slots, the others all of them)
+        :type max_concurrency: dict
+        :param default: The class of calls that aren't tagged.
+        :type default: str
+        """
+        if concurrency < 1:
+            raise ValueError("\"concurrency\" must be at least 1.")
+        if shares is None:
+            shares = DEFAULT_SHARES
+        if max_concurrency is None:
+            max_concurrency = {BATCH: max(1, concurrency * 3 // 4)}
+        if default not in shares:
+            raise ValueError("The default class \"{0}\" has no share.".format(default))
+        self.concurrency = concurrency
+        self.default = default
+        self._classes = {name: _PriorityClass(name, share, max_concurrency.get(name, concurrency))
+                         for name, share in shares.items()}
+        if rate is not None:
+            # Imported here: "workers" imports this module.
+            from .workers import RateLimiter
+            self._limiter = RateLimiter(rate, burst=concurrency)
+        else:
+            self._limiter = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._virtual_time = 0.0
+
+    def slot(self, priority_class=None):
+        """
+        Wait for a request slot, in a "with" block.
+
+        :param priority_class: The request's class. (Default: the thread's, see "priority", or the scheduler's
+        default)
+        :type priority_class: str
+        """
+        if priority_class is None:
+            priority_class = current_priority() or self.default
+        if priority_class not in self._classes:
+            raise ValueError("Unknown priority class \"{0}\".".format(priority_class))
+        return _Slot(self, self._classes[priority_class])
+
+    def _dispatch(self):
+        """
+        Hand free slots (and, with a rate, tokens) to waiting requests. Call with the lock held.
+        """
+        while self._in_flight < self.concurrency:
+            best = None
+            for priority_class in self._classes.values():
+                if len(priority_class.waiting) == 0 or priority_class.in_flight >= priority_class.max_concurrency:
+                    continue
+                if best is None or priority_class.pass_value < best.pass_value:
+                    best = priority_class
+            if best is None:
+                return
+            if self._limiter is not None and not self._limiter.try_acquire():
+                # Out of quota. Waiting requests retry when the next token is due.
+                return
+            ticket = best.waiting.popleft()
+            best.in_flight += 1
+            self._in_flight += 1
+            self._virtual_time = best.pass_value
+            best.pass_value += 1.0 / best.share
+            ticket.granted.set()
+
+    def _acquire(self, priority_class):
+        ticket = _Ticket()
+        with self._lock:
+            if len(priority_class.waiting) == 0 and priority_class.in_flight == 0:
+                # Coming back from idle: start from the present, instead of with all the credit built up meanwhile.
+                priority_class.pass_value = max(priority_class.pass_value, self._virtual_time)
+            priority_class.waiting.append(ticket)
+            self._dispatch()
+        if self._limiter is None:
+            # Slots are handed out as others are released.
+            ticket.granted.wait()
+        else:
+            # Nothing is released when the quota runs out, so dispatch again once the next token is due.
+            while not ticket.granted.wait(max(self._limiter.wait_time(), 0.001)):
+                with self._lock:
+                    self._dispatch()
+        wait = time.time() - ticket.queued_at
+        with self._lock:
+            priority_class.requests += 1
+            priority_class.total_wait += wait
+            priority_class.max_wait = max(priority_class.max_wait, wait)
+
+    def _release(self, priority_class):
+        with self._lock:
+            priority_class.in_flight -= 1
+            self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self):
+        """
+        :return: {class: counts of requests sent, waiting & in flight, and the average & longest wait for a slot,
+        in seconds}
+        :rtype: dict
+        """
+        with self._lock:
+            return {name: {'requests': priority_class.requests,
+                           'waiting': len(priority_class.waiting),
+                           'in_flight': priority_class.in_flight,
+                           'average_wait': priority_class.total_wait / priority_class.requests
+                           if priority_class.requests > 0 else 0.0,
+                           'max_wait': priority_class.max_wait}
+                    for name, priority_class in self._classes.items()}
+
+    def __repr__(self):
+        return "<{cls} ({in_flight}/{concurrency} in flight)>".format(cls=self.__class__.__name__,
+                                                                      in_flight=self._in_flight,
+                                                                      concurrency=self.concurrency)
@@ -0,0 +1,320 @@
+__author__ = 'SmileyBarry'
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from .core import unwrap
+from .errors import APIException
+from .export import iter_users
+
+SNAPSHOT_FIELDS = ("summary", "bans", "badges", "games")
+
+# Only these fields are compared. The rest of a summary (online state, last logoff, current game...) changes all the
+# time, and would turn every snapshot into a change.
+SUMMARY_FIELDS = ("personaname", "realname", "profileurl", "avatar", "communityvisibilitystate", "profilestate",
+                  "loccountrycode", "locstatecode", "primaryclanid", "timecreated")
+# "DaysSinceLastBan" goes up every day, but a new ban always shows up in the ban counts too.
+BAN_FIELDS = ("CommunityBanned", "VACBanned", "NumberOfVACBans", "NumberOfGameBans", "EconomyBan")
+
+# Delta kinds.
+FIRST_SEEN = "first_seen"
+NAME_CHANGED = "name_changed"
+SUMMARY_CHANGED = "summary_changed"
+BAN_CHANGED = "ban_changed"
+LEVEL_CHANGED = "level_changed"
+BADGE_CHANGED = "badge_changed"
+GAME_ADDED = "game_added"
+GAME_REMOVED = "game_removed"
+PLAYTIME_CHANGED = "playtime_changed"
+
+
+def normalize(row):
+    """
+    Reduce a user's raw data to its comparable, JSON-serializable snapshot form. Fields that weren't fetched, or
+    couldn't be (e.g.: a private library), are left out.
+
+    :param row: A row from "export.iter_users", or any dict with some of the "summary", "bans", "badges" & "games"
+    keys holding plain API data.
+    :type row: dict
+    :rtype: dict
+    """
+    snapshot = {}
+    if row.get('summary') is not None:
+        summary = row['summary']
+        snapshot['summary'] = {field: summary[field] for field in SUMMARY_FIELDS if field in summary}
+    if row.get('bans') is not None:
+        bans = row['bans']
+        snapshot['bans'] = {field: bans[field] for field in BAN_FIELDS if field in bans}
+    if row.get('badges') is not None:
+        badges = row['badges']
+        snapshot['badges'] = {'level': badges.get('player_level'),
+                              'xp': badges.get('player_xp'),
+                              # JSON object keys have to be strings.
+                              'badges': {"{0}:{1}".format(badge['badgeid'], badge.get('appid', '')): badge['level']
+                                         for badge in badges.get('badges', [])}}
+    if row.get('games') is not None:
+        snapshot['games'] = {str(game['appid']): game.get('playtime_forever', 0) for game in row['games']}
+    return snapshot
+
+
+def snapshot_user(user, fields=SNAPSHOT_FIELDS):
+    """
+    Take a snapshot of a SteamUser, through (and warming up) its cached properties. Use "track" for many users
+    instead; it batches summaries & bans.
+
+    :type user: SteamUser
+    :param fields: Any of "summary", "bans", "badges" and "games".
+    :type fields: tuple of str
+    :rtype: dict
+    """
+    row = {}
+    for field, attribute in (("summary", "_summary"), ("bans", "_bans"), ("badges", "_badges")):
+        if field in fields:
+            try:
+                row[field] = unwrap(getattr(user, attribute))
+            except APIException:
+                pass
+    if "games" in fields:
+        try:
+            row['games'] = [{'appid': game.appid, 'playtime_forever': getattr(game, 'playtime_forever', 0)}
+                            for game in user.games]
+        except APIException:
+            pass
+    return normalize(row)
+
+
+def diff(old, new):
+    """
+    Compare two snapshots of the same user. Fields missing from either snapshot are skipped, so a partial snapshot
+    never looks like a removal.
+
+    :type old: dict
+    :type new: dict
+    :return: A list of (kind, key, old value, new value) tuples. "key" is the changed field, app ID or badge, where
+    there is one.
+    :rtype: list of tuple
+    """
+    changes = []
+    if 'summary' in old and 'summary' in new:
+        for field in SUMMARY_FIELDS:
+            old_value, new_value = old['summary'].get(field), new['summary'].get(field)
+            if old_value != new_value:
+                kind = NAME_CHANGED if field == "personaname" else SUMMARY_CHANGED
+                changes += [(kind, field, old_value, new_value)]
+    if 'bans' in old and 'bans' in new:
+        for field in BAN_FIELDS:
+            old_value, new_value = old['bans'].get(field), new['bans'].get(field)
+            if old_value != new_value:
+                changes += [(BAN_CHANGED, field, old_value, new_value)]
+    if 'badges' in old and 'badges' in new:
+        old_badges, new_badges = old['badges'], new['badges']
+        if old_badges['level'] != new_badges['level']:
+            changes += [(LEVEL_CHANGED, None, old_badges['level'], new_badges['level'])]
+        # A badge that's new, or gone, has a level of None on that side.
+        for badge in sorted(set(old_badges['badges']) | set(new_badges['badges'])):
+            old_level, level = old_badges['badges'].get(badge), new_badges['badges'].get(badge)
+            if old_level != level:
+                changes += [(BADGE_CHANGED, badge, old_level, level)]
+    if 'games' in old and 'games' in new:
+        old_games, new_games = old['games'], new['games']
+        for appid, playtime in sorted(new_games.items()):
+            if appid not in old_games:
+                changes += [(GAME_ADDED, appid, None, playtime)]
+            elif old_games[appid] != playtime:
+                changes += [(PLAYTIME_CHANGED, appid, old_games[appid], playtime)]
+        for appid in sorted(set(old_games) - set(new_games)):
+            changes += [(GAME_REMOVED, appid, old_games[appid], None)]
+    return changes
+
+
+def _merge(old, new):
+    """
+    Carry over the fields a partial snapshot doesn't have.
+    """
+    merged = dict(old)
+    merged.update(new)
+    return merged
+
+
+class SnapshotStore(object):
+    def __init__(self, path):
+        """
+        Persist the last-seen snapshot of every tracked user, and the deltas between consecutive snapshots, in a
+        single SQLite file. Only changes are ever written: a user whose data didn't change costs one read, and no
+        writes.
+
+        :param path: The store's file path. Created if it doesn't exist. (":memory:" works too)
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS snapshots (steamid INTEGER PRIMARY KEY, data BLOB, updated REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS deltas (steamid INTEGER, recorded REAL, kind TEXT, key TEXT, "
+                         "old TEXT, new TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS deltas_by_steamid ON deltas (steamid, recorded)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS deltas_by_time ON deltas (recorded)")
+        self._db.commit()
+
+    def _load(self, steamid):
+        row = self._db.execute("SELECT data FROM snapshots WHERE steamid = ?", (steamid,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(bytes(row[0])).decode('utf-8'))
+
+    def _update(self, steamid, snapshot, timestamp):
+        old = self._load(steamid)
+        if old is None:
+            changes = [(FIRST_SEEN, None, None, None)]
+            merged = snapshot
+        else:
+            changes = diff(old, snapshot)
+            if len(changes) == 0 and set(snapshot) <= set(old):
+                return []
+            # Even without changes, a section seen for the first time (e.g.: games, once a profile goes public) is
+            # stored, so its later changes show up.
+            merged = _merge(old, snapshot)
+        data = zlib.compress(json.dumps(merged, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+        self._db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)",
+                         (steamid, sqlite3.Binary(data), timestamp))
+        self._db.executemany("INSERT INTO deltas VALUES (?, ?, ?, ?, ?, ?)",
+                             [(steamid, timestamp, kind, key, json.dumps(old_value), json.dumps(new_value))
+                              for kind, key, old_value, new_value in changes])
+        return [{'steamid': steamid, 'recorded': timestamp, 'kind': kind, 'key': key, 'old': old_value,
+                 'new': new_value}
+                for kind, key, old_value, new_value in changes]
+
+    def get(self, steamid):
+        """
+        :return: The user's last stored snapshot, or None if they were never seen.
+        :rtype: dict or None
+        """
+        with self._lock:
+            return self._load(int(steamid))
+
+    def update(self, steamid, snapshot, timestamp=None):
+        """
+        Compare a fresh snapshot with the stored one, and store it (and the deltas) if anything changed, or if it has
+        sections the stored one lacks.
+
+        :type steamid: int
+        :param snapshot: A snapshot, from "normalize" or "snapshot_user".
+        :type snapshot: dict
+        :param timestamp: When the snapshot was taken. (Default: now)
+        :type timestamp: float
+        :return: The deltas written. A user seen for the first time gets a single FIRST_SEEN delta.
+        :rtype: list of dict
+        """
+        return self.update_many([(steamid, snapshot)], timestamp)
+
+    def update_many(self, snapshots, timestamp=None):
+        """
+        Like "update", for many users in a single transaction.
+
+        :param snapshots: (Steam ID, snapshot) pairs.
+        :type snapshots: iterable of tuple
+        :rtype: list of dict
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        deltas = []
+        with self._lock:
+            try:
+                for steamid, snapshot in snapshots:
+                    deltas += self._update(int(steamid), snapshot, timestamp)
+            except Exception:
+                self._db.rollback()
+                raise
+            self._db.commit()
+        return deltas
+
+    def deltas(self, steamid=None, since=None, kinds=None):
+        """
+        Read back stored deltas, oldest first.
+
+        :param steamid: Only this user's deltas.
+        :type steamid: int
+        :param since: Only deltas recorded at or after this time.
+        :type since: float
+        :param kinds: Only these kinds of deltas. (E.g.: (GAME_ADDED, BAN_CHANGED))
+        :type kinds: tuple of str
+        :rtype: list of dict
+        """
+        conditions = []
+        arguments = []
+        if steamid is not None:
+            conditions += ["steamid = ?"]
+            arguments += [int(steamid)]
+        if since is not None:
+            conditions += ["recorded >= ?"]
+            arguments += [since]
+        if kinds is not None:
+            conditions += ["kind IN ({0})".format(', '.join('?' * len(kinds)))]
+            arguments += list(kinds)
+        query = "SELECT steamid, recorded, kind, key, old, new FROM deltas"
+        if len(conditions) > 0:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY recorded, rowid"
+        with self._lock:
+            rows = self._db.execute(query, arguments).fetchall()
+        return [{'steamid': row_steamid, 'recorded': recorded, 'kind': kind, 'key': key, 'old': json.loads(old),
+                 'new': json.loads(new)}
+                for row_steamid, recorded, kind, key, old, new in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+
+    def __repr__(self):
+        return '<{cls} "{path}">'.format(cls=self.__class__.__name__, path=self.path)
+
+
+def track(steamids, store, fields=SNAPSHOT_FIELDS, concurrency=4, batch_size=100, commit_every=1000):
+    """
+    Take fresh snapshots of many users and write whatever changed to a store. Summaries & bans are fetched in
+    batches; see "export.iter_users".
+
+        >>> store = SnapshotStore("users.sqlite")
+        >>> stats = track(steamids, store, concurrency=8)
+        >>> new_bans = store.deltas(since=stats['started'], kinds=(BAN_CHANGED,))
+
+    :type steamids: iterable of int
+    :type store: SnapshotStore
+    :param fields: Any of "summary", "bans", "badges" and "games".
+    :type fields: tuple of str
+    :param concurrency: The maximum number of concurrent requests per stage.
+    :type concurrency: int
+    :param batch_size: How many users to fetch in each batched call.
+    :type batch_size: int
+    :param commit_every: How many users to write per transaction.
+    :type commit_every: int
+    :return: Counts of the users seen, changed & failed, the deltas written, and when the run started.
+    :rtype: dict
+    """
+    stats = {'started': time.time(), 'users': 0, 'changed': 0, 'failed': 0, 'deltas': 0}
+    pending = []
+
+    def write_pending():
+        deltas = store.update_many(pending, stats['started'])
+        stats['changed'] += len(set(delta['steamid'] for delta in deltas))
+        stats['deltas'] += len(deltas)
+        del pending[:]
+
+    for row in iter_users(steamids, fields, concurrency, batch_size):
+        stats['users'] += 1
+        if 'batch' in row.get('errors', {}) or 'details' in row.get('errors', {}):
+            # The request failed, so we know nothing new about this user.
+            stats['failed'] += 1
+            continue
+        pending += [(row['steamid'], normalize(row))]
+        if len(pending) >= commit_every:
+            write_pending()
+    write_pending()
+    return stats
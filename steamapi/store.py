@@ -1,9 +1,107 @@
 __author__ = 'andrew'
 
+from . import scheduler, tracing
 from .core import APIConnection
+from .errors import APIError, APIFailure
+from .workers import RateLimiter, imap_bounded
 
+import datetime
+import json
+import numbers
+import threading
+import time
 import uuid
 
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
+# Order states (as "QueryTxn" reports them) that mean the order was already finalized.
+FINALIZED_STATES = ("Succeeded", "PartialRefund", "Refunded", "Chargedback", "RefundedSuspectedFraud",
+                    "RefundedFriendlyFraud")
+
+# "GetReport" report types.
+GAMESALES = "GAMESALES"
+STEAMSTORESALES = "STEAMSTORESALES"
+SETTLEMENT = "SETTLEMENT"
+
+REPORT_PAGE_SIZE = 1000
+# "GetReport" returns at most this many orders per call.
+MAX_REPORT_PAGE_SIZE = 10000
+_REPORT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _is_retryable(error):
+    # Server errors & throttling (APIError), or no answer at all: "requests"' connection errors and timeouts are
+    # IOErrors.
+    return isinstance(error, (APIError, IOError))
+
+
+def _report_time(value):
+    """
+    :param value: A datetime (naive ones are taken as UTC), a Unix timestamp, or an RFC 3339 UTC string.
+    :return: The time as "GetReport" takes it: an RFC 3339 UTC string.
+    :rtype: str
+    """
+    if isinstance(value, datetime.datetime):
+        if value.utcoffset() is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        return value.strftime(_REPORT_TIME_FORMAT)
+    if isinstance(value, numbers.Number):
+        return time.strftime(_REPORT_TIME_FORMAT, time.gmtime(value))
+    return value
+
+
+class ReportCheckpoint(object):
+    def __init__(self, since, orderids=()):
+        """
+        A position in the order history, for resuming "SteamIngameStore.iter_report": the time of the last order
+        read, and the IDs of the orders read at exactly that time. (Reading resumes at that time, so those are
+        skipped rather than repeated)
+
+            >>> checkpoint = ReportCheckpoint.loads(saved) if saved else ReportCheckpoint(since)
+            >>> for order in store.iter_report(checkpoint):
+            ...     process(order)
+            ...     saved = checkpoint.dumps()
+
+        :param since: Where to start: a datetime, a Unix timestamp or an RFC 3339 UTC string.
+        :param orderids: Orders at "since" that were already read.
+        :type orderids: iterable of str
+        """
+        self.time = _report_time(since)
+        self.orderids = set(str(orderid) for orderid in orderids)
+
+    def advance(self, order):
+        """
+        Move past an order.
+        """
+        if order.time != self.time:
+            self.time = order.time
+            self.orderids = set()
+        self.orderids.add(str(order.orderid))
+
+    def dumps(self):
+        """
+        :return: The checkpoint, as a JSON string.
+        :rtype: str
+        """
+        return json.dumps({'time': self.time, 'orderids': sorted(self.orderids)})
+
+    @classmethod
+    def loads(cls, data):
+        """
+        :param data: A string from "dumps".
+        :rtype: ReportCheckpoint
+        """
+        checkpoint = json.loads(data)
+        return cls(checkpoint['time'], checkpoint['orderids'])
+
+    def __repr__(self):
+        return "<{cls} {time} (+{count} orders)>".format(cls=self.__class__.__name__, time=self.time,
+                                                         count=len(self.orderids))
+
 
 class SteamIngameStore(object):
     def __init__(self, appid, debug=False):
@@ -42,3 +140,179 @@ class SteamIngameStore(object):
     def finalize_txh(self, orderid):
         return APIConnection().call(self.interface, 'FinalizeTxn', 'v1', method='POST', appid=self.appid,
                                     orderid=orderid)
+
+    def _with_retries(self, func, item, limiter, retries, backoff, before_retry=None):
+        """
+        Call "func(item)" through "limiter", retrying transient failures with exponential backoff.
+
+        :param before_retry: Called with the item before each retry. If it returns anything but None, that's
+        returned instead of retrying.
+        """
+        attempt = 0
+        while True:
+            if attempt > 0 and before_retry is not None:
+                result = before_retry(item)
+                if result is not None:
+                    return result
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return func(item)
+            except Exception as ex:
+                if attempt >= retries or not _is_retryable(ex):
+                    raise
+            time.sleep(backoff * 2 ** attempt)
+            attempt += 1
+
+    def query_many(self, orderids, concurrency=8, rate=None, retries=3, backoff=1.0, ordered=True):
+        """
+        Query many orders concurrently, yielding each result as soon as it (and, if "ordered", every order before it)
+        is done. Orders are read lazily, so any number of them can be streamed through in constant memory.
+
+            >>> for orderid, response, error in store.query_many(orderids, concurrency=16, rate=50):
+            ...     if error is None and response.result == "OK":
+            ...         reconcile(orderid, response.params.status)
+
+        :param orderids: The orders to query.
+        :type orderids: iterable of int
+        :param concurrency: The maximum number of concurrent requests.
+        :type concurrency: int
+        :param rate: The maximum number of requests per second, retries included. (Default: unlimited)
+        :type rate: float
+        :param retries: How many times to retry an order after a server error, throttling or a network failure.
+        :type retries: int
+        :param backoff: Seconds to wait before the first retry. Doubles with each retry.
+        :type backoff: float
+        :param ordered: Yield results in input order. If False, as soon as they're ready.
+        :type ordered: bool
+        :return: An iterator of (orderid, "QueryTxn" response, exception) tuples. "exception" is None on success.
+        :rtype: iterator
+        """
+        limiter = RateLimiter(rate, burst=concurrency) if rate is not None else None
+
+        def query(orderid):
+            return self._with_retries(self.query_txh, orderid, limiter, retries, backoff)
+
+        return imap_bounded(query, orderids, concurrency, ordered)
+
+    def finalize_many(self, orderids, concurrency=8, rate=None, retries=3, backoff=1.0, ordered=True):
+        """
+        Finalize many orders concurrently. Like "query_many", with retries that are safe for "FinalizeTxn": a POST
+        that failed without an answer may still have gone through, so before retrying, the order is queried, and
+        only finalized again if it isn't already. An order can't be finalized twice either way.
+
+        :param orderids: The orders to finalize.
+        :type orderids: iterable of int
+        :param concurrency: The maximum number of concurrent requests.
+        :type concurrency: int
+        :param rate: The maximum number of requests per second, checks & retries included. (Default: unlimited)
+        :type rate: float
+        :param retries: How many times to retry an order.
+        :type retries: int
+        :param backoff: Seconds to wait before the first retry. Doubles with each retry.
+        :type backoff: float
+        :param ordered: Yield results in input order. If False, as soon as they're ready.
+        :type ordered: bool
+        :return: An iterator of (orderid, response, exception) tuples. The response is "FinalizeTxn"'s, or
+        "QueryTxn"'s if an earlier attempt had already finalized the order. "exception" is None on success.
+        :rtype: iterator
+        """
+        limiter = RateLimiter(rate, burst=concurrency) if rate is not None else None
+
+        def query_if_finalized(orderid):
+            response = self._with_retries(self.query_txh, orderid, limiter, retries, backoff)
+            if response.result == "OK" and response.params.status in FINALIZED_STATES:
+                return response
+            return None
+
+        def finalize(orderid):
+            return self._with_retries(self.finalize_txh, orderid, limiter, retries, backoff, query_if_finalized)
+
+        return imap_bounded(finalize, orderids, concurrency, ordered)
+
+    def _get_report(self, report_type, cursor, page_size):
+        response = APIConnection().call(self.interface, 'GetReport', 'v5', appid=self.appid, type=report_type,
+                                        time=cursor, maxresults=page_size)
+        if response.result != "OK":
+            error = getattr(response, 'error', None)
+            raise APIFailure(getattr(error, 'errordesc', "GetReport failed."))
+        return list(getattr(response.params, 'orders', []))
+
+    def iter_report(self, since, type=GAMESALES, page_size=REPORT_PAGE_SIZE, retries=3, backoff=1.0):
+        """
+        Stream the store's order history, oldest first, through "GetReport". Pages are requested by time, starting
+        at the last order of the previous page, and the next page is fetched in the background while the current
+        one is being read. No more than a few pages are in memory at once, however long the history is.
+
+            >>> for order in store.iter_report(datetime.datetime(2016, 1, 1)):
+            ...     ledger.add(order.orderid, order.time, order.status)
+
+        :param since: Where to start: a datetime (naive ones are taken as UTC), a Unix timestamp, an RFC 3339 UTC
+        string, or a ReportCheckpoint to resume from. A checkpoint is updated as each order is yielded, so saving it
+        after processing an order resumes right after that order.
+        :param type: GAMESALES, STEAMSTORESALES or SETTLEMENT.
+        :type type: str
+        :param page_size: Orders per request. (Up to MAX_REPORT_PAGE_SIZE)
+        :type page_size: int
+        :param retries: How many times to retry a page after a server error, throttling or a network failure.
+        :type retries: int
+        :param backoff: Seconds to wait before the first retry. Doubles with each retry.
+        :type backoff: float
+        :return: An iterator of orders, as "GetReport" returns them.
+        :rtype: iterator of APIResponse
+        """
+        checkpoint = since if isinstance(since, ReportCheckpoint) else ReportCheckpoint(since)
+        # A page being read, one waiting, and one being fetched.
+        pages = queue.Queue(maxsize=1)
+        stopped = threading.Event()
+        parent_span = tracing.current_span()
+        priority_class = scheduler.current_priority()
+
+        def put(page, error=None):
+            while not stopped.is_set():
+                try:
+                    pages.put((page, error), timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def fetch_pages():
+            cursor, seen, size = checkpoint.time, set(checkpoint.orderids), page_size
+            try:
+                with tracing.attach(parent_span), scheduler.priority(priority_class):
+                    while not stopped.is_set():
+                        orders = self._with_retries(lambda arguments: self._get_report(type, *arguments),
+                                                    (cursor, size), None, retries, backoff)
+                        is_full = len(orders) >= size
+                        if is_full and orders[-1].time == cursor:
+                            # The whole page is at the cursor's time, so the next one would start at the same place.
+                            if size >= MAX_REPORT_PAGE_SIZE:
+                                raise APIFailure("More than {0} orders were placed at {1}; \"GetReport\" can't page "
+                                                 "past them.".format(size, cursor))
+                            size = min(size * 2, MAX_REPORT_PAGE_SIZE)
+                            continue
+                        put([order for order in orders if order.time != cursor or str(order.orderid) not in seen])
+                        if not is_full:
+                            put(None)
+                            return
+                        # The next page starts at this page's last time, and repeats the orders placed then.
+                        cursor, size = orders[-1].time, page_size
+                        seen = set(str(order.orderid) for order in orders if order.time == cursor)
+            except Exception as ex:
+                put(None, ex)
+
+        thread = threading.Thread(target=fetch_pages, name="GetReport")
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                page, error = pages.get()
+                if error is not None:
+                    raise error
+                if page is None:
+                    return
+                for order in page:
+                    checkpoint.advance(order)
+                    yield order
+        finally:
+            stopped.set()
@@ -0,0 +1,332 @@
+__author__ = 'SmileyBarry'
+
+import random
+import threading
+import time
+
+# True whenever a trace is open (in any thread) or a hook is registered. Checked on every request & cached property
+# miss, so it's kept as a plain module attribute.
+active = False
+
+SPAN_INTERNAL = "internal"
+SPAN_PROPERTY = "property"
+SPAN_HTTP = "http"
+
+_local = threading.local()
+_lock = threading.Lock()
+_open_traces = 0
+_request_hooks = []
+_response_hooks = []
+
+# OpenTelemetry's numeric span kinds: INTERNAL = 1, CLIENT = 3.
+_OTEL_SPAN_KINDS = {SPAN_INTERNAL: 1, SPAN_PROPERTY: 1, SPAN_HTTP: 3}
+
+
+def _update_active():
+    global active
+    active = _open_traces > 0 or len(_request_hooks) > 0 or len(_response_hooks) > 0
+
+
+def _new_id(bits):
+    return "{0:0{1}x}".format(random.getrandbits(bits), bits // 4)
+
+
+class Span(object):
+    def __init__(self, name, kind=SPAN_INTERNAL, parent=None, attributes=None):
+        """
+        A single timed operation inside a trace. You usually shouldn't create one yourself, but use "span()" or
+        "trace()" instead.
+
+        :param name: A human-readable name. (E.g.: "SteamUser.currently_playing")
+        :type name: str
+        :param kind: SPAN_INTERNAL, SPAN_PROPERTY or SPAN_HTTP.
+        :type kind: str
+        :param parent: The enclosing span, or None for a trace's root span.
+        :type parent: Span
+        :param attributes: Extra key-value details about the operation.
+        :type attributes: dict
+        """
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.attributes = attributes if attributes is not None else {}
+        self.children = []
+        self.error = None
+        self.start = time.time()
+        self.end = None
+        self.span_id = _new_id(64)
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            parent.children.append(self)
+        else:
+            self.trace_id = _new_id(128)
+
+    @property
+    def duration(self):
+        """
+        :return: The span's duration in seconds, or None if it hasn't ended yet.
+        :rtype: float or None
+        """
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def finish(self, error=None):
+        self.end = time.time()
+        if error is not None:
+            self.error = type(error).__name__
+
+    def walk(self, depth=0):
+        """
+        Iterate this span and all of its descendants, depth-first.
+
+        :return: An iterator of (depth, span) tuples.
+        """
+        yield depth, self
+        for child in list(self.children):
+            for item in child.walk(depth + 1):
+                yield item
+
+    def __repr__(self):
+        return '<{cls} {kind} "{name}">'.format(cls=self.__class__.__name__, kind=self.kind, name=self.name)
+
+
+class Trace(object):
+    def __init__(self, name="trace"):
+        """
+        Record every cached property resolution & HTTP request made by this thread (and by worker threads it spawns
+        through "workers.imap_bounded") while the trace is open. Use it as a context manager:
+
+            >>> with tracing.trace("profile page") as profile_trace:
+            ...     user.currently_playing
+            >>> print(profile_trace.dump())
+
+        :param name: The root span's name.
+        :type name: str
+        """
+        self.root = Span(name)
+        self._previous_span = None
+
+    def __enter__(self):
+        global _open_traces
+        self._previous_span = getattr(_local, 'span', None)
+        _local.span = self.root
+        with _lock:
+            _open_traces += 1
+            _update_active()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _open_traces
+        self.root.finish(exc_val)
+        _local.span = self._previous_span
+        with _lock:
+            _open_traces -= 1
+            _update_active()
+
+    def spans(self):
+        """
+        :return: All spans in this trace, depth-first, starting with the root.
+        :rtype: list of Span
+        """
+        return [span for depth, span in self.root.walk()]
+
+    def dump(self):
+        """
+        Render the trace as an indented tree, one span per line.
+
+        :rtype: str
+        """
+        lines = []
+        for depth, span in self.root.walk():
+            duration = span.duration
+            line = "{indent}{name} [{kind}] {duration}".format(
+                indent="  " * depth, name=span.name, kind=span.kind,
+                duration="{0:.1f}ms".format(duration * 1000) if duration is not None else "(running)")
+            if 'http.status_code' in span.attributes:
+                line += " -> {0}".format(span.attributes['http.status_code'])
+            if span.error is not None:
+                line += " !! {0}".format(span.error)
+            lines += [line]
+        return '\n'.join(lines)
+
+    def repeated_calls(self, threshold=2):
+        """
+        Find likely N+1 patterns: the same endpoint being called over and over through the same property, from the
+        same piece of calling code. For example, reading ".name" of every friend, with precaching disabled, shows up
+        as ("friends page", "SteamUser.name", "ISteamUser.GetPlayerSummaries.v0002", <friend count>).
+
+        :param threshold: The minimum call count to report.
+        :type threshold: int
+        :return: A list of (calling span name, property name, endpoint, call count) tuples, most-repeated first.
+        "property name" is None for requests made outside of any property.
+        :rtype: list of tuple
+        """
+        counts = {}
+        for depth, span in self.root.walk():
+            if span.kind != SPAN_HTTP:
+                continue
+            # Climb to the outermost property that (indirectly) made this request, and the code that read it.
+            origin = None
+            caller = span.parent
+            while caller is not None and caller.kind == SPAN_PROPERTY:
+                origin = caller
+                caller = caller.parent
+            key = (caller.name if caller is not None else None,
+                   origin.name if origin is not None else None,
+                   span.attributes.get('steamapi.endpoint', span.name))
+            counts[key] = counts.get(key, 0) + 1
+        repeated = [key + (count,) for key, count in counts.items() if count >= threshold]
+        return sorted(repeated, key=lambda item: -item[3])
+
+    def to_otel(self, service_name="steamapi"):
+        """
+        Export the trace in the shape of OpenTelemetry's OTLP/JSON "ExportTraceServiceRequest", ready to be
+        serialized and sent to a collector, or loaded into any OTLP-compatible tool.
+
+        :param service_name: The "service.name" resource attribute.
+        :type service_name: str
+        :rtype: dict
+        """
+        spans = []
+        for depth, span in self.root.walk():
+            attributes = [_otel_attribute('steamapi.span_kind', span.kind)]
+            attributes += [_otel_attribute(key, value) for key, value in sorted(span.attributes.items())]
+            otel_span = {'traceId': span.trace_id,
+                         'spanId': span.span_id,
+                         'name': span.name,
+                         'kind': _OTEL_SPAN_KINDS.get(span.kind, 1),
+                         'startTimeUnixNano': str(int(span.start * 1e9)),
+                         'endTimeUnixNano': str(int((span.end if span.end is not None else span.start) * 1e9)),
+                         'attributes': attributes,
+                         'status': {'code': 2, 'message': span.error} if span.error is not None else {'code': 0}}
+            if span.parent is not None:
+                otel_span['parentSpanId'] = span.parent.span_id
+            spans += [otel_span]
+        return {'resourceSpans': [{'resource': {'attributes': [_otel_attribute('service.name', service_name)]},
+                                   'scopeSpans': [{'scope': {'name': 'steamapi'},
+                                                   'spans': spans}]}]}
+
+
+def _otel_attribute(key, value):
+    if isinstance(value, bool):
+        typed_value = {'boolValue': value}
+    elif isinstance(value, int):
+        typed_value = {'intValue': str(value)}
+    elif isinstance(value, float):
+        typed_value = {'doubleValue': value}
+    else:
+        typed_value = {'stringValue': str(value)}
+    return {'key': key, 'value': typed_value}
+
+
+class span(object):
+    def __init__(self, name, kind=SPAN_INTERNAL, **attributes):
+        """
+        Open a child span under the current one. Does nothing if this thread has no open trace, so it's safe to
+        sprinkle around your own code:
+
+            >>> with tracing.span("render friends page"):
+            ...     names = [friend.name for friend in user.friends]
+
+        :param name: The span's name.
+        :type name: str
+        :param kind: SPAN_INTERNAL, SPAN_PROPERTY or SPAN_HTTP.
+        :type kind: str
+        """
+        self._name = name
+        self._kind = kind
+        self._attributes = attributes
+        self.span = None
+
+    def __enter__(self):
+        parent = getattr(_local, 'span', None)
+        if parent is not None:
+            self.span = Span(self._name, self._kind, parent, self._attributes)
+            _local.span = self.span
+        return self.span
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.span is not None:
+            self.span.finish(exc_val)
+            _local.span = self.span.parent
+
+
+class attach(object):
+    def __init__(self, parent):
+        """
+        Make "parent" (usually taken from "current_span()" in another thread) the current span of this thread, so
+        work done on another thread's behalf shows up in its trace.
+
+        :type parent: Span or None
+        """
+        self._parent = parent
+        self._previous_span = None
+
+    def __enter__(self):
+        self._previous_span = getattr(_local, 'span', None)
+        if self._parent is not None:
+            _local.span = self._parent
+        return self._parent
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _local.span = self._previous_span
+
+
+def current_span():
+    """
+    :return: This thread's innermost open span, or None if it isn't tracing.
+    :rtype: Span or None
+    """
+    return getattr(_local, 'span', None)
+
+
+def trace(name="trace"):
+    """
+    Start a new trace. (See "Trace")
+
+    :rtype: Trace
+    """
+    return Trace(name)
+
+
+def add_request_hook(hook):
+    """
+    Call "hook(method, url, params)" before every API request. "params" includes "key", so be careful when logging
+    it.
+    """
+    with _lock:
+        _request_hooks.append(hook)
+        _update_active()
+
+
+def remove_request_hook(hook):
+    with _lock:
+        _request_hooks.remove(hook)
+        _update_active()
+
+
+def add_response_hook(hook):
+    """
+    Call "hook(method, url, params, response, error, elapsed)" after every API request. "response" is None if no
+    response was received, and "error" is the exception that the request raised, if any.
+    """
+    with _lock:
+        _response_hooks.append(hook)
+        _update_active()
+
+
+def remove_response_hook(hook):
+    with _lock:
+        _response_hooks.remove(hook)
+        _update_active()
+
+
+def run_request_hooks(method, url, params):
+    for hook in list(_request_hooks):
+        hook(method, url, params)
+
+
+def run_response_hooks(method, url, params, response, error, elapsed):
+    for hook in list(_response_hooks):
+        hook(method, url, params, response, error, elapsed)
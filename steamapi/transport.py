@@ -0,0 +1,245 @@
+__author__ = 'SmileyBarry'
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    # Python 2.x
+    from urlparse import parse_qsl, urlsplit
+
+from .errors import APIReplayMissing
+
+# Replay modes: "strict" fails on any request missing from the archive, "fallthrough" sends it for real instead.
+STRICT = "strict"
+FALLTHROUGH = "fallthrough"
+
+_KEY_IN_URL = re.compile(r'([?&]key=)[^&]*')
+
+
+def _redact_url(url):
+    return _KEY_IN_URL.sub(r'\1REDACTED', url)
+
+
+def _stable_params(url, params):
+    """
+    :param url: The request's split URL. Parameters in its query string (e.g.: a bound call's static arguments,
+    see "core.PreparedAPICall") count as much as "params" do.
+    :return: The request's parameters, except the API key, as sorted (name, value) string pairs.
+    :rtype: list of tuple
+    """
+    pairs = parse_qsl(url.query, keep_blank_values=True) + list(params.items())
+    return sorted((str(name), str(value)) for name, value in pairs if name != "key")
+
+
+def request_fingerprint(method, query, params):
+    """
+    Identify a request by its method, API function and parameters. The API key and the server's address are ignored,
+    so recordings made with one key (or against a proxy) replay with any other.
+
+    :rtype: str
+    """
+    url = urlsplit(query)
+    identity = json.dumps([method, url.path, _stable_params(url, params)], separators=(',', ':'))
+    return hashlib.sha1(identity.encode('utf-8')).hexdigest()
+
+
+class HTTPTransport(object):
+    def __init__(self):
+        """
+        The default transport: sends requests over the network, through the "requests" library.
+        """
+        # Imported here, rather than with the module, so importing the library stays fast.
+        import requests
+        self._requests = requests
+
+    def send(self, method, query, params):
+        """
+        :param method: GET or POST.
+        :param query: The full URL of the API function.
+        :param params: The call's parameters, including "key" & "format".
+        :type params: dict
+        :rtype: requests.Response
+        """
+        if method == "POST":
+            return self._requests.request(method, query, data=params)
+        else:
+            return self._requests.request(method, query, params=params)
+
+
+class _RecordedRequest(object):
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+
+
+class RecordedResponse(object):
+    def __init__(self, method, url, status_code, content, headers=None):
+        """
+        A response read back from an archive. Mimics the parts of "requests.Response" that the library uses.
+
+        :param url: The request's URL, with the API key (if any) redacted.
+        :type url: str
+        :type status_code: int
+        :type content: bytes
+        :type headers: dict
+        """
+        self.request = _RecordedRequest(method, url)
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return "<{cls} [{status}] {url}>".format(cls=self.__class__.__name__, status=self.status_code, url=self.url)
+
+
+class Archive(object):
+    def __init__(self, path):
+        """
+        A compact, indexed archive of API exchanges: a single SQLite file, with response bodies zlib-compressed and
+        keyed by "request_fingerprint". Recording the same request again replaces the older response. API keys are
+        never stored.
+
+        :param path: The archive's file path. Created if it doesn't exist. (":memory:" works too)
+        :type path: str
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS exchanges ("
+                         "fingerprint TEXT PRIMARY KEY, method TEXT, url TEXT, params TEXT, status INTEGER, "
+                         "content_type TEXT, body BLOB, recorded REAL)")
+        self._db.commit()
+
+    def store(self, method, query, params, response):
+        """
+        Add a response to the archive.
+
+        :type response: requests.Response or RecordedResponse
+        """
+        stored_params = json.dumps(dict(_stable_params(urlsplit(query), params)), sort_keys=True)
+        url = _redact_url(response.request.url) if response.request is not None else query
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (request_fingerprint(method, query, params), method, url, stored_params,
+                              response.status_code, response.headers.get('Content-Type'),
+                              sqlite3.Binary(zlib.compress(response.content)), time.time()))
+            self._db.commit()
+
+    def lookup(self, method, query, params):
+        """
+        :return: The archived response to this request, or None if it was never recorded.
+        :rtype: RecordedResponse or None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT method, url, status, content_type, body FROM exchanges "
+                                   "WHERE fingerprint = ?",
+                                   (request_fingerprint(method, query, params),)).fetchone()
+        if row is None:
+            return None
+        method, url, status, content_type, body = row
+        headers = {'Content-Type': content_type} if content_type is not None else {}
+        return RecordedResponse(method, url, status, zlib.decompress(bytes(body)), headers)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM exchanges").fetchone()[0]
+
+    def __repr__(self):
+        return '<{cls} "{path}">'.format(cls=self.__class__.__name__, path=self.path)
+
+
+class RecordingTransport(object):
+    def __init__(self, archive, transport=None):
+        """
+        Send every request through another transport (the network, by default), and record each exchange into an
+        archive, errors included.
+
+        :type archive: Archive
+        :param transport: The transport that actually sends requests.
+        :type transport: HTTPTransport
+        """
+        self.archive = archive
+        self.transport = transport if transport is not None else HTTPTransport()
+
+    def send(self, method, query, params):
+        response = self.transport.send(method, query, params)
+        self.archive.store(method, query, params, response)
+        return response
+
+
+class ReplayTransport(object):
+    def __init__(self, archive, mode=STRICT, transport=None, record=False):
+        """
+        Answer requests from an archive, without touching the network.
+
+        :type archive: Archive
+        :param mode: STRICT to raise APIReplayMissing for requests that were never recorded, or FALLTHROUGH to send
+        them through "transport" instead.
+        :type mode: str
+        :param transport: The transport used in FALLTHROUGH mode. (Default: the network)
+        :type transport: HTTPTransport
+        :param record: In FALLTHROUGH mode, also add the fallen-through exchanges to the archive, so the next replay
+        finds them.
+        :type record: bool
+        """
+        if mode not in (STRICT, FALLTHROUGH):
+            raise ValueError("\"mode\" must be either STRICT or FALLTHROUGH.")
+        self.archive = archive
+        self.mode = mode
+        # Built on first use: a strict replay never falls through, so it shouldn't need (or import) "requests".
+        self._transport = transport
+        self.record = record
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def transport(self):
+        """
+        :return: The transport requests fall through to.
+        :rtype: HTTPTransport
+        """
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    self._transport = HTTPTransport()
+        return self._transport
+
+    def send(self, method, query, params):
+        response = self.archive.lookup(method, query, params)
+        with self._lock:
+            if response is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if response is not None:
+            return response
+        if self.mode == STRICT:
+            raise APIReplayMissing("{0} {1} was not found in the archive.".format(method, query))
+        response = self.transport.send(method, query, params)
+        if self.record is True:
+            self.archive.store(method, query, params, response)
+        return response
@@ -2,10 +2,13 @@ __author__ = 'SmileyBarry'
 
 from .core import APIConnection, SteamObject, chunker
 
-from .app import SteamApp
+from .app import SteamApp, _global_percentages
+from .cache import NegativeCache, TTLCache, MISSING
 from .decorators import cached_property, INFINITE, MINUTE, HOUR
 from .errors import *
+from .workers import imap_bounded
 
+import collections
 import datetime
 import itertools
 
@@ -37,8 +40,9 @@ class SteamUserBadge(SteamObject):
         if isinstance(completion_time, datetime.datetime):
             self._completion_time = completion_time
         else:
-            self._completion_time = datetime.datetime.fromtimestamp(
-                completion_time)
+            # Converted on first access. Most readers of a badge list never look at it.
+            self._completion_time = None
+        self._completion_timestamp = completion_time
         self._xp = xp
         self._scarcity = scarcity
         self._appid = appid
@@ -69,6 +73,8 @@ class SteamUserBadge(SteamObject):
 
     @property
     def completion_time(self):
+        if self._completion_time is None:
+            self._completion_time = datetime.datetime.fromtimestamp(self._completion_timestamp)
         return self._completion_time
 
     def __repr__(self):
@@ -82,6 +88,61 @@ class SteamUserBadge(SteamObject):
         return hash((self._appid, self.id))
 
 
+class SteamUserBadges(list):
+    def __init__(self, badges=()):
+        """
+        A user's badges: a list of SteamUserBadge, also indexed by badge ID and by app ID. "SteamUser.badges" builds
+        one per "GetBadges" response and returns it on every access, so treat it as read-only.
+
+        :type badges: iterable of SteamUserBadge
+        """
+        list.__init__(self, badges)
+        self._by_badge_id = {}
+        self._by_appid = {}
+        for badge in self:
+            self._by_badge_id.setdefault(badge.badge_id, []).append(badge)
+            if badge.appid is not None:
+                self._by_appid.setdefault(badge.appid, []).append(badge)
+        self.xp_by_app = {appid: sum(badge.xp for badge in app_badges)
+                          for appid, app_badges in self._by_appid.items()}
+
+    @classmethod
+    def from_api_response(cls, badges):
+        """
+        :param badges: The "badges" list of a "GetBadges" response.
+        :type badges: list of APIResponse
+        :rtype: SteamUserBadges
+        """
+        return cls(SteamUserBadge(badge.badgeid,
+                                  badge.level,
+                                  badge.completion_time,
+                                  badge.xp,
+                                  badge.scarcity,
+                                  getattr(badge, 'appid', None))
+                   for badge in badges)
+
+    def by_badge_id(self, badge_id):
+        """
+        :return: The badges with this badge ID. (Game badges of different apps share IDs)
+        :rtype: list of SteamUserBadge
+        """
+        return self._by_badge_id.get(badge_id, [])
+
+    def by_appid(self, appid):
+        """
+        :return: The app's badges. (E.g.: its regular & foil trading card badges)
+        :rtype: list of SteamUserBadge
+        """
+        return self._by_appid.get(appid, [])
+
+    def app_xp(self, appid):
+        """
+        :return: The total XP of the app's badges.
+        :rtype: int
+        """
+        return self.xp_by_app.get(appid, 0)
+
+
 class SteamGroup(SteamObject):
     def __init__(self, guid):
         self._id = guid
@@ -96,9 +157,57 @@ class SteamGroup(SteamObject):
         return self._id
 
 
+# Vanity URLs rarely change hands, but names that don't exist (yet) can be claimed at any time.
+VANITY_URL_CACHE = TTLCache(ttl=24 * HOUR, max_size=100000)
+VANITY_URL_NEGATIVE_TTL = 1 * HOUR
+
+# Users whose libraries (etc.) were private, by endpoint. Call "attach" on it to share it with other processes.
+ACCESS_DENIED_CACHE = NegativeCache(ttl=6 * HOUR)
+
+
+def _resolve_vanity_url(vanity_url):
+    """
+    Resolve a vanity URL ending into a 64-bit Steam ID, through "VANITY_URL_CACHE".
+
+    :type vanity_url: str
+    :rtype: int
+    :raise: UserNotFoundError if no user has this vanity URL.
+    """
+    steamid = VANITY_URL_CACHE.get(vanity_url)
+    if steamid is MISSING:
+        response = APIConnection().call(
+            "ISteamUser", "ResolveVanityURL", "v0001", vanityurl=vanity_url)
+        if response.success != 1:
+            steamid = None
+            VANITY_URL_CACHE.set(vanity_url, None, ttl=VANITY_URL_NEGATIVE_TTL)
+        else:
+            steamid = int(response.steamid)
+            VANITY_URL_CACHE.set(vanity_url, steamid)
+    if steamid is None:
+        raise UserNotFoundError("User not found.")
+    return steamid
+
+
+class _DeferredSteamID(object):
+    """
+    Stands in for "SteamUser._id" until a user created from a vanity URL needs its ID, then resolves it once. Since
+    this is a non-data descriptor, the resolved ID (stored in the instance) shadows it from then on, at no cost.
+    """
+
+    def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        steamid = _resolve_vanity_url(inst._vanity_url)
+        inst._id = steamid
+        return steamid
+
+
 class SteamUser(SteamObject):
     PLAYER_SUMMARIES_BATCH_SIZE = 350
 
+    # Only used until "_id" is set, i.e. for users created from a vanity URL.
+    _id = _DeferredSteamID()
+
     # OVERRIDES
     def __init__(self, userid=None, userurl=None, accountid=None):
         """
@@ -108,7 +217,8 @@ class SteamUser(SteamObject):
         :param userid: The user's 64-bit SteamID. (Optional, unless steam_userurl isn't specified)
         :type userid: int
         :param userurl: The user's vanity URL-ending name. (Required if "steam_userid" isn't specified,
-        unused otherwise)
+        unused otherwise) It's resolved the first time the user's ID is needed, not here, so a vanity URL that
+        doesn't exist raises UserNotFoundError at that point. To resolve many names at once, use "resolve_many".
         :type userurl: str
         :raise: ValueError on improper usage.
         """
@@ -120,11 +230,10 @@ class SteamUser(SteamObject):
                 # This is a full URL. It's not valid.
                 raise ValueError(
                     "\"userurl\" must be the *ending* of a vanity URL, not the entire URL!")
-            response = APIConnection().call(
-                "ISteamUser", "ResolveVanityURL", "v0001", vanityurl=userurl)
-            if response.success != 1:
-                raise UserNotFoundError("User not found.")
-            userid = response.steamid
+            self._vanity_url = userurl
+            cached_steamid = VANITY_URL_CACHE.get(userurl)
+            if userid is None and cached_steamid is not MISSING and cached_steamid is not None:
+                userid = cached_steamid
 
         if accountid is not None:
             userid = self._convert_accountid_to_steamid(accountid)
@@ -149,6 +258,64 @@ class SteamUser(SteamObject):
         # objects wouldn't cause a match.
         return hash(('user', self.id))
 
+    @classmethod
+    def resolve_many(cls, vanity_urls, concurrency=8):
+        """
+        Resolve many vanity URL endings at once, concurrently. Duplicates are only resolved once, and results (both
+        found & not found) are cached in "VANITY_URL_CACHE", so repeated names don't cost a request either.
+
+        :param vanity_urls: Vanity URL endings, like the "userurl" argument of SteamUser.
+        :type vanity_urls: iterable of str
+        :param concurrency: The maximum number of concurrent requests.
+        :type concurrency: int
+        :return: A mapping of each vanity URL ending to its SteamUser, or to None if no such user exists.
+        :rtype: dict
+        :raise: ValueError if a full URL is given. Any API error other than UserNotFoundError is raised as-is.
+        """
+        unique_urls = []
+        for vanity_url in vanity_urls:
+            if '/' in vanity_url:
+                raise ValueError(
+                    "Vanity URLs must be the *ending* of a vanity URL, not the entire URL!")
+            unique_urls += [vanity_url]
+        # Drop duplicates while keeping the original order.
+        unique_urls = list(collections.OrderedDict.fromkeys(unique_urls))
+
+        users = {}
+        for vanity_url, steamid, error in imap_bounded(_resolve_vanity_url, unique_urls, concurrency):
+            if isinstance(error, UserNotFoundError):
+                users[vanity_url] = None
+            elif error is not None:
+                raise error
+            else:
+                users[vanity_url] = cls(userid=steamid, userurl=vanity_url)
+        return users
+
+    @classmethod
+    def fetch_badges(cls, users, concurrency=8):
+        """
+        Fetch many users' badges at once, concurrently. Each user's "badges", "level" & "xp" are then cached, as if
+        read one by one.
+
+        :param users: SteamUser objects, or 64-bit Steam IDs.
+        :type users: iterable of SteamUser or int
+        :param concurrency: The maximum number of concurrent requests.
+        :type concurrency: int
+        :return: A mapping of each Steam ID to the user's SteamUserBadges, or to None if their profile is private.
+        :rtype: dict
+        :raise: Any API error other than AccessException is raised as-is.
+        """
+        users = [user if isinstance(user, SteamUser) else cls(userid=user) for user in users]
+        badges = {}
+        for user, user_badges, error in imap_bounded(lambda user: user.badges, users, concurrency):
+            if isinstance(error, AccessException):
+                badges[user.steamid] = None
+            elif error is not None:
+                raise error
+            else:
+                badges[user.steamid] = user_badges
+        return badges
+
     # PRIVATE UTILITIES
     @staticmethod
     def _convert_accountid_to_steamid(accountid):
@@ -161,10 +328,13 @@ class SteamUser(SteamObject):
         return "7656119%d" % (z * 2 + 7960265728 + y)
 
     @staticmethod
-    def _convert_games_list(raw_list, associated_userid=None):
+    def _convert_games_list(raw_list, associated_userid=None, appinfo=False):
         """
         Convert a raw, APIResponse-formatted list of games into full SteamApp objects.
         :type raw_list: list of APIResponse
+        :param appinfo: Whether the list came with app info. ("include_appinfo") The API leaves
+        "has_community_visible_stats" out of those for games without stats, instead of setting it to false.
+        :type appinfo: bool
         :rtype: list of SteamApp
         """
         games_list = []
@@ -178,9 +348,31 @@ class SteamUser(SteamObject):
                 game_obj.img_logo_url = game.img_logo_url
             if 'img_icon_url' in game:
                 game_obj.img_icon_url = game.img_icon_url
+            if 'has_community_visible_stats' in game:
+                game_obj.has_community_visible_stats = game.has_community_visible_stats
+            elif appinfo:
+                game_obj.has_community_visible_stats = False
             games_list += [game_obj]
         return games_list
 
+    def _check_access(self, endpoint):
+        """
+        Fail right away if "endpoint" recently refused this user. (See "ACCESS_DENIED_CACHE")
+
+        :raise: AccessException
+        """
+        if ACCESS_DENIED_CACHE.check(endpoint, self._id) is not None:
+            raise AccessException()
+
+    def _deny_access(self, endpoint):
+        """
+        Remember that "endpoint" refused this user, and raise.
+
+        :raise: AccessException
+        """
+        ACCESS_DENIED_CACHE.add(endpoint, self._id, AccessException.__name__)
+        raise AccessException()
+
     @cached_property(ttl=2 * HOUR)
     def _summary(self):
         """
@@ -380,20 +572,23 @@ class SteamUser(SteamObject):
         """
         return self._badges.player_level
 
-    @property  # Already cached by "_badges".
+    @property  # Already cached by "_badges", and built once per response.
     def badges(self):
         """
-        :rtype: list of SteamUserBadge
-        """
-        badge_list = []
-        for badge in self._badges.badges:
-            badge_list += [SteamUserBadge(badge.badgeid,
-                                          badge.level,
-                                          badge.completion_time,
-                                          badge.xp,
-                                          badge.scarcity,
-                                          getattr(badge, 'appid', None))]
-        return badge_list
+        :rtype: SteamUserBadges
+        """
+        built = getattr(self, '_badge_collection', None)
+        if built is None:
+            # Only checked before the first build: once built, reads just compare the cached response.
+            self._check_access("IPlayerService.GetBadges")
+        response = self._badges
+        if built is None or built[0] is not response:
+            if 'badges' not in response:
+                # Private profiles get an empty response.
+                self._deny_access("IPlayerService.GetBadges")
+            built = (response, SteamUserBadges.from_api_response(response.badges))
+            self._badge_collection = built
+        return built[1]
 
     @property  # Already cached by "_badges".
     def xp(self):
@@ -407,12 +602,13 @@ class SteamUser(SteamObject):
         """
         :rtype: list of SteamApp
         """
+        self._check_access("IPlayerService.GetRecentlyPlayedGames")
         response = APIConnection().call(
             "IPlayerService", "GetRecentlyPlayedGames", "v1", steamid=self.steamid)
         if 'total_count' not in response:
             # Private profiles will cause a special response, where the API doesn't tell us if there are
             # any results *at all*. We just get a blank JSON document.
-            raise AccessException()
+            self._deny_access("IPlayerService.GetRecentlyPlayedGames")
         if response.total_count == 0:
             return []
         return self._convert_games_list(response.games, self._id)
@@ -422,6 +618,7 @@ class SteamUser(SteamObject):
         """
         :rtype: list of SteamApp
         """
+        self._check_access("IPlayerService.GetOwnedGames")
         response = APIConnection().call("IPlayerService",
                                         "GetOwnedGames",
                                         "v1",
@@ -431,16 +628,17 @@ class SteamUser(SteamObject):
         if 'game_count' not in response:
             # Private profiles will cause a special response, where the API doesn't tell us if there are
             # any results *at all*. We just get a blank JSON document.
-            raise AccessException()
+            self._deny_access("IPlayerService.GetOwnedGames")
         if response.game_count == 0:
             return []
-        return self._convert_games_list(response.games, self._id)
+        return self._convert_games_list(response.games, self._id, appinfo=True)
 
     @cached_property(ttl=INFINITE)
     def owned_games(self):
         """
         :rtype: list of SteamApp
         """
+        self._check_access("IPlayerService.GetOwnedGames")
         response = APIConnection().call("IPlayerService",
                                         "GetOwnedGames",
                                         "v1",
@@ -450,10 +648,69 @@ class SteamUser(SteamObject):
         if 'game_count' not in response:
             # Private profiles will cause a special response, where the API doesn't tell us if there are
             # any results *at all*. We just get a blank JSON document.
-            raise AccessException()
+            self._deny_access("IPlayerService.GetOwnedGames")
         if response.game_count == 0:
             return []
-        return self._convert_games_list(response.games, self._id)
+        return self._convert_games_list(response.games, self._id, appinfo=True)
+
+    def achievement_summary(self, concurrency=8):
+        """
+        Sum up the achievements of every game in the user's library, fetching games concurrently. Games without stats
+        (according to "GetOwnedGames", or to any earlier sweep) are skipped without a call, and each app's global
+        unlock percentages are fetched once and shared by every user (see "app.GLOBAL_PERCENTAGES_CACHE"), so a
+        game usually costs a single "GetUserStatsForGame" call.
+
+            >>> for row in user.achievement_summary(concurrency=16):
+            ...     print(row['name'], "{0:.0%}".format(row['completion']))
+
+        :param concurrency: The maximum number of concurrent requests.
+        :type concurrency: int
+        :return: One row per game with achievements, in library order: its "appid" & "name", the "unlocked" and
+        "total" achievement counts, "completion" (0.0 to 1.0), and the "rarest" unlocked achievement's API name & its
+        global "rarest_percent". (None if nothing's unlocked) A game whose stats couldn't be fetched gets an "errors"
+        entry instead.
+        :rtype: list of dict
+        """
+        # Games from "GetOwnedGames" always say whether they have stats. (See "_convert_games_list") Only games with
+        # nothing to say otherwise are assumed to have some, and cost a call to find out.
+        games = [game for game in self.games if getattr(game, 'has_community_visible_stats', True)]
+
+        def summarize(game):
+            percentages = _global_percentages(int(game.appid))
+            if len(percentages) == 0:
+                return None
+            stats = APIConnection().call("ISteamUserStats", "GetUserStatsForGame", "v2",
+                                         appid=game.appid,
+                                         steamid=self.steamid).playerstats
+            unlocked = [achievement.name for achievement in getattr(stats, 'achievements', [])
+                        if achievement.achieved != 0 and achievement.name in percentages]
+            rarest = min(unlocked, key=lambda name: percentages[name]) if len(unlocked) > 0 else None
+            return {'appid': int(game.appid),
+                    'name': game.name,
+                    'unlocked': len(unlocked),
+                    'total': len(percentages),
+                    'completion': len(unlocked) / float(len(percentages)),
+                    'rarest': rarest,
+                    'rarest_percent': percentages[rarest] if rarest is not None else None}
+
+        summary = []
+        for game, row, error in imap_bounded(summarize, games, concurrency):
+            if error is not None:
+                summary += [{'appid': int(game.appid), 'name': game.name, 'errors': {'stats': type(error).__name__}}]
+            elif row is not None:
+                summary += [row]
+        return summary
+
+    def achievement_summary_async(self, concurrency=8):
+        """
+        Like "achievement_summary", without blocking the event loop: the sweep runs in the loop's default executor.
+
+            >>> summary = await user.achievement_summary_async()
+
+        :rtype: asyncio.Future
+        """
+        import asyncio
+        return asyncio.get_event_loop().run_in_executor(None, self.achievement_summary, concurrency)
 
     @cached_property(ttl=INFINITE)
     def is_vac_banned(self):
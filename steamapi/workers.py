@@ -0,0 +1,163 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import threading
+import time
+
+from . import scheduler, tracing
+
+try:
+    import queue
+except ImportError:
+    # Python 2.x
+    import Queue as queue
+
+
+class _Task(object):
+    __slots__ = ('item', 'value', 'error', 'done')
+
+    def __init__(self, item):
+        self.item = item
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def imap_bounded(func, iterable, concurrency=4, ordered=True):
+    """
+    Apply "func" to every item of "iterable" using a fixed number of worker threads, yielding results as they become
+    available. Unlike "multiprocessing.pool.ThreadPool.imap", the input is consumed lazily and no more than twice
+    "concurrency" items are in flight at any time, so arbitrarily long (or endless) inputs use constant memory.
+
+    Exceptions raised by "func" don't stop the iteration. They're returned alongside the item instead, so one bad
+    item (a private profile, a deleted app, etc.) doesn't take down the entire run.
+
+    :param func: A single-argument callable to run for each item. It must be thread-safe.
+    :param iterable: The input items.
+    :type iterable: iterable
+    :param concurrency: The number of worker threads.
+    :type concurrency: int
+    :param ordered: Yield results in input order. If False, results are yielded as soon as they're ready.
+    :type ordered: bool
+    :return: An iterator of (item, value, exception) tuples. "exception" is None on success.
+    :rtype: iterator
+    """
+    if concurrency < 1:
+        raise ValueError("\"concurrency\" must be at least 1.")
+
+    # Work done by the pool belongs to the caller's trace (if any), and has the caller's priority.
+    parent_span = tracing.current_span()
+    priority_class = scheduler.current_priority()
+    tasks = queue.Queue()
+    finished = queue.Queue()
+    stopped = threading.Event()
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            if not stopped.is_set():
+                try:
+                    with tracing.attach(parent_span), scheduler.priority(priority_class):
+                        task.value = func(task.item)
+                except Exception as ex:
+                    task.error = ex
+            task.done.set()
+            if ordered is False:
+                finished.put(task)
+
+    workers = []
+    for _ in range(concurrency):
+        worker = threading.Thread(target=work)
+        worker.daemon = True
+        worker.start()
+        workers += [worker]
+
+    window = collections.deque()
+    window_size = concurrency * 2
+    items = iter(iterable)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(window) < window_size:
+                try:
+                    task = _Task(next(items))
+                except StopIteration:
+                    exhausted = True
+                    break
+                window.append(task)
+                tasks.put(task)
+
+            if len(window) == 0:
+                break
+
+            if ordered is True:
+                task = window.popleft()
+                task.done.wait()
+            else:
+                task = finished.get()
+                window.remove(task)
+            yield task.item, task.value, task.error
+    finally:
+        # Either we're done, or the consumer stopped iterating early. Let the workers skip anything that's left.
+        stopped.set()
+        for _ in workers:
+            tasks.put(None)
+
+
+class RateLimiter(object):
+    def __init__(self, rate, burst=None):
+        """
+        A thread-safe token bucket: allows "rate" operations per second on average, and bursts of up to "burst"
+        operations at once.
+
+        :param rate: The sustained rate, in operations per second.
+        :type rate: float
+        :param burst: The bucket's size. Defaults to one second's worth of operations. (At least one)
+        :type burst: float
+        """
+        if rate <= 0:
+            raise ValueError("\"rate\" must be positive.")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._last_update = time.time()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_update) * self.rate)
+        self._last_update = now
+
+    def try_acquire(self):
+        """
+        Take a token if one is available, without waiting.
+
+        :return: Whether a token was taken.
+        :rtype: bool
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def wait_time(self):
+        """
+        :return: How long, in seconds, until the next token is available. Zero if one is available right now.
+        :rtype: float
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Take a token, waiting for one if necessary.
+        """
+        while not self.try_acquire():
+            time.sleep(self.wait_time())
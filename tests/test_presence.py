@@ -0,0 +1,81 @@
+__author__ = 'SmileyBarry'
+
+import unittest
+
+from steamapi import presence
+from steamapi.consts import OnlineState
+from steamapi.core import APIConnection, APIResponse
+
+
+class FakeSummaries(object):
+    """
+    Replaces "APIConnection().call" with "GetPlayerSummaries" responses built from "players": {steamid: summary}.
+    Users missing from it are left out of the response, as the API does now and then.
+    """
+
+    def __init__(self, players):
+        self.players = players
+        self._connection = APIConnection()
+
+    def call(self, interface, command, version, method="GET", **kwargs):
+        steamids = [int(steamid) for steamid in kwargs['steamids']]
+        return APIResponse({'players': [dict(self.players[steamid], steamid=str(steamid))
+                                        for steamid in steamids if steamid in self.players]})
+
+    def __enter__(self):
+        self._connection.call = self.call
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        del self._connection.call
+
+
+def _watcher(steamids):
+    # Every user is due on every poll.
+    return presence.PresenceWatcher(steamids, request_budget=60000, online_interval=0, offline_interval=0,
+                                    long_offline_interval=0)
+
+
+class PresenceWatcherTest(unittest.TestCase):
+    def test_user_missing_from_response_keeps_state(self):
+        watcher = _watcher([1, 2])
+        with FakeSummaries({1: {'personastate': OnlineState.OFFLINE},
+                            2: {'personastate': OnlineState.ONLINE}}) as api:
+            self.assertEqual(watcher.poll_once(), [])
+
+            del api.players[1]
+            self.assertEqual(watcher.poll_once(), [])
+
+            api.players[1] = {'personastate': OnlineState.OFFLINE}
+            self.assertEqual(watcher.poll_once(), [])
+
+            api.players[1] = {'personastate': OnlineState.ONLINE, 'gameid': "440"}
+            events = [(event.steamid, event.kind, event.old, event.new) for event in watcher.poll_once()]
+            self.assertEqual(events, [(1, presence.CAME_ONLINE, OnlineState.OFFLINE, OnlineState.ONLINE),
+                                      (1, presence.STARTED_PLAYING, None, 440)])
+
+    def test_never_seen_user_has_no_state(self):
+        watcher = _watcher([1])
+        with FakeSummaries({}):
+            self.assertEqual(watcher.poll_once(), [])
+        self.assertIsNone(watcher._users[1].state)
+
+    def test_restart_after_stop(self):
+        watcher = _watcher([1])
+        with FakeSummaries({1: {'personastate': OnlineState.OFFLINE}}) as api:
+            watcher.poll_once()
+            watcher.start()
+            watcher.stop()
+
+            api.players[1] = {'personastate': OnlineState.ONLINE}
+            watcher.start()
+            try:
+                event = next(iter(watcher), None)
+            finally:
+                watcher.stop()
+        self.assertIsNotNone(event)
+        self.assertEqual(event.kind, presence.CAME_ONLINE)
+
+
+if __name__ == '__main__':
+    unittest.main()